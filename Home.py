@@ -13,4 +13,6 @@ st.write("""
 4. OxCGRT Index Specific Policy
 5. OxCGRT Economic Support Analysis
 6. Vaccinations Analysis
+7. Regional Policy Correlations
+8. Policy Correlation Cube
 """)
\ No newline at end of file
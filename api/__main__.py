@@ -0,0 +1,21 @@
+import argparse
+import logging
+import warnings
+
+import uvicorn
+
+# python -m api [--host 127.0.0.1] [--port 8000] [--workers 4]
+# Serves the read-only API of api/app.py. Worker processes share the
+# memory-mapped stores and cubes through the OS page cache.
+
+if __name__ == "__main__":
+    # Streamlit warns about every cached call made outside `streamlit run`
+    warnings.filterwarnings("ignore")
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+    parser = argparse.ArgumentParser(description="Serve the precomputed series, maps and correlations over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="worker processes (default: 1)")
+    args = parser.parse_args()
+    uvicorn.run("api.app:app", host=args.host, port=args.port, workers=args.workers, log_level="warning")
@@ -0,0 +1,290 @@
+import gzip
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from utils import countries
+from utils.cache import fingerprint
+from utils.cube import CUBE_VERSION, load_cube
+from utils.store import NATIONAL, OUTCOME_METRICS, STORE_VERSION, jurisdiction_frame, load_store, region_matrix
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Encoded responses kept per representation, least recently used first out
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("API_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = 1024
+
+ARROW_TYPE = "application/vnd.apache.arrow.stream"
+
+_responses = OrderedDict()
+_responses_bytes = [0]
+_responses_lock = threading.Lock()
+
+
+def _cached(key):
+    with _responses_lock:
+        if key in _responses:
+            _responses.move_to_end(key)
+            return _responses[key]
+    return None
+
+
+def _remember(key, body, encoding):
+    with _responses_lock:
+        if key not in _responses:
+            _responses[key] = body, encoding
+            _responses_bytes[0] += len(body)
+        while _responses_bytes[0] > RESPONSE_CACHE_MAX_BYTES and len(_responses) > 1:
+            _, (evicted, _) = _responses.popitem(last=False)
+            _responses_bytes[0] -= len(evicted)
+
+
+def _encode(frame, media_type):
+    # JSON as {"columns": [...], "data": [[row], ...]} with ISO dates and null
+    # for missing values, or an Arrow IPC stream of the frame
+    if media_type == ARROW_TYPE:
+        sink = pa.BufferOutputStream()
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    return frame.to_json(orient='split', index=False, date_format='iso', date_unit='s').encode()
+
+
+def _compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+def _negotiate(request):
+    accept = request.headers.get('accept', '')
+    requested = request.query_params.get('format')
+    if requested not in (None, 'json', 'arrow'):
+        raise HTTPException(400, f"format must be json or arrow, not {requested!r}")
+    media_type = ARROW_TYPE if requested == 'arrow' or (requested is None and ARROW_TYPE in accept) else \
+        "application/json"
+    accepted = {part.split(';')[0].strip() for part in request.headers.get('accept-encoding', '').split(',')}
+    encoding = 'br' if brotli is not None and 'br' in accepted else 'gzip' if 'gzip' in accepted else None
+    return media_type, encoding
+
+
+async def respond(request, version, build):
+    """Response with the frame returned by build(), negotiated, compressed and cached by ETag.
+
+    The ETag identifies the path, the query, the representation and
+    `version` (the data the frame is built from), so a client holding the
+    current ETag gets 304 Not Modified without the frame being built, and
+    repeated requests are served from the encoded response cache.
+    """
+    media_type, encoding = _negotiate(request)
+    query = sorted(request.query_params.multi_items())
+    etag = f'"{fingerprint(request.url.path, query, version, media_type, encoding)[:32]}"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept, Accept-Encoding'}
+    if etag in [tag.strip() for tag in request.headers.get('if-none-match', '').split(',')]:
+        return Response(status_code=304, headers=headers)
+
+    cached = _cached(etag)
+    if cached is None:
+        frame = await run_in_threadpool(build)
+        body = await run_in_threadpool(_encode, frame, media_type)
+        if encoding is not None and len(body) >= COMPRESS_MIN_BYTES:
+            cached = await run_in_threadpool(_compress, body, encoding), encoding
+        else:
+            cached = body, None
+        _remember(etag, *cached)
+    body, content_encoding = cached
+    if content_encoding is not None:
+        headers['Content-Encoding'] = content_encoding
+    return Response(body, media_type=media_type, headers=headers)
+
+
+# Request parameters
+
+def _check_parameters(request, allowed):
+    # Every endpoint accepts `format`; a misspelt name would otherwise be
+    # ignored and the defaults returned
+    unknown = sorted(set(request.query_params) - set(allowed) - {'format'})
+    if unknown:
+        raise HTTPException(400, f"unknown parameters: {', '.join(unknown)}")
+
+
+def _country(request):
+    iso_code = request.path_params['iso_code'].upper()
+    if iso_code not in countries.load_registry():
+        raise HTTPException(404, f"unknown country {iso_code}")
+    return iso_code
+
+
+def _names(request, name, default, allowed):
+    value = request.query_params.get(name)
+    names = default if value is None else allowed if value == 'all' else value.split(',')
+    unknown = [n for n in names if n not in allowed]
+    if unknown:
+        raise HTTPException(400, f"unknown {name}: {', '.join(unknown)}")
+    return list(names)
+
+
+def _timestamp(request, name):
+    # Dates are compared with the naive calendar days of the data, so times
+    # with an offset are read in UTC
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    try:
+        timestamp = pd.Timestamp(value)
+    except (ValueError, OverflowError):
+        timestamp = pd.NaT
+    if pd.isna(timestamp):
+        raise HTTPException(400, f"{name} is not a date: {value!r}")
+    return timestamp.tz_convert(None) if timestamp.tzinfo is not None else timestamp
+
+
+def _integer(request, name, default):
+    value = request.query_params.get(name)
+    try:
+        return default if value is None else int(value)
+    except ValueError:
+        raise HTTPException(400, f"{name} is not an integer: {value}")
+
+
+def _date_range(request):
+    # start/end (inclusive), or a single date
+    date = _timestamp(request, 'date')
+    if date is not None:
+        return date, date
+    return _timestamp(request, 'start'), _timestamp(request, 'end')
+
+
+def _days(dates, start, end):
+    first = 0 if start is None else dates.searchsorted(start)
+    last = len(dates) if end is None else dates.searchsorted(end, side='right')
+    return slice(first, last)
+
+
+def _store_version(store):
+    return STORE_VERSION, store['manifest']['source']
+
+
+# Endpoints
+
+async def list_countries(request):
+    _check_parameters(request, [])
+    registry = countries.load_registry()
+
+    # One row per jurisdiction: the national rows, then each region
+    def build():
+        rows = []
+        for iso_code, country in registry.items():
+            rows.append((iso_code, country['label'], NATIONAL, country['label']))
+            rows += [(iso_code, country['label'], code, region['name'])
+                     for code, region in country.get('regions', {}).items()]
+        return pd.DataFrame(rows, columns=['Country', 'Label', 'Jurisdiction', 'Name'])
+    return await respond(request, registry, build)
+
+
+async def series(request):
+    """Daily metrics of jurisdictions of a country.
+
+    ?jurisdictions=NAT_TOTAL,AK (or all; default the national rows)
+    &metrics=DailyCaseRate,... (or all; default the outcome metrics)
+    &start=&end= (inclusive dates) &format=json|arrow
+    """
+    _check_parameters(request, ['jurisdictions', 'metrics', 'start', 'end', 'date'])
+    iso_code = _country(request)
+    store = await run_in_threadpool(load_store, iso_code)
+    codes = _names(request, 'jurisdictions', [NATIONAL], list(store['jurisdictions']))
+    metrics = _names(request, 'metrics', OUTCOME_METRICS, list(store['metrics']))
+    days = _days(store['dates'], *_date_range(request))
+
+    def build():
+        frames = [jurisdiction_frame(store, code, metrics).iloc[days] for code in codes]
+        return pd.concat(frames, keys=codes, names=['Jurisdiction', None]).reset_index(level=0)
+    return await respond(request, _store_version(store), build)
+
+
+async def map_values(request):
+    """Regional values of one metric per date, as the page 2 choropleths draw them.
+
+    /map/{iso_code}/{metric}?date= (or start=&end=) &format=json|arrow
+    """
+    _check_parameters(request, ['date', 'start', 'end'])
+    iso_code = _country(request)
+    store = await run_in_threadpool(load_store, iso_code)
+    metric = request.path_params['metric']
+    if metric not in store['metrics']:
+        raise HTTPException(404, f"unknown metric {metric}")
+    start, end = _date_range(request)
+
+    def build():
+        matrix = region_matrix(store, metric, countries.region_names(iso_code))
+        matrix = matrix.iloc[:, _days(matrix.columns, start, end)]
+        frame = matrix.rename_axis(index='Region', columns='Date').stack(future_stack=True).rename(metric)
+        return frame.reset_index()
+    return await respond(request, _store_version(store), build)
+
+
+async def correlations(request):
+    """Precomputed lagged correlations of a country's policy and index columns (see utils/cube.py).
+
+    ?method=spearman|pearson|dcor (or all) &outcomes=DailyCaseRate,...
+    &columns=... (or all, the default) &lag_start=&lag_end= (inclusive)
+    &format=json|arrow
+    """
+    _check_parameters(request, ['method', 'outcomes', 'columns', 'lag_start', 'lag_end'])
+    iso_code = _country(request)
+    cube = await run_in_threadpool(load_cube, iso_code)
+    if cube is None:
+        raise HTTPException(404, f"no correlation cube for {iso_code}")
+    manifest = cube['manifest']
+    methods = _names(request, 'method', manifest['methods'], manifest['methods'])
+    outcomes = _names(request, 'outcomes', manifest['outcomes'], manifest['outcomes'])
+    columns = _names(request, 'columns', manifest['columns'], manifest['columns'])
+    lags = pd.Index(manifest['lags'])
+    days = _days(lags, _integer(request, 'lag_start', None), _integer(request, 'lag_end', None))
+
+    def build():
+        frames = []
+        for method in methods:
+            for outcome in outcomes:
+                m, o = manifest['methods'].index(method), manifest['outcomes'].index(outcome)
+                rows = [manifest['columns'].index(column) for column in columns]
+                correlation = cube['correlation'][m, o][rows][:, days]
+                pairs = cube['pairs'][m, o][rows][:, days]
+                frames.append(pd.DataFrame({
+                    'Method': method, 'Outcome': outcome,
+                    'Column': pd.Index(columns).repeat(correlation.shape[1]),
+                    'Lag': np.tile(lags[days], len(columns)),
+                    'Correlation': correlation.ravel(), 'N': pairs.ravel(),
+                }))
+        return pd.concat(frames, ignore_index=True)
+    return await respond(request, (CUBE_VERSION, manifest['source']), build)
+
+
+async def http_error(request, exc):
+    return JSONResponse({'error': exc.detail}, status_code=exc.status_code)
+
+
+app = Starlette(
+    routes=[
+        Route('/countries', list_countries),
+        Route('/series/{iso_code}', series),
+        Route('/map/{iso_code}/{metric}', map_values),
+        Route('/correlations/{iso_code}', correlations),
+    ],
+    exception_handlers={HTTPException: http_error},
+)
@@ -0,0 +1,151 @@
+import argparse
+import fnmatch
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+# python -m bench [--scale 1 10 100] [--countries 20] [--only 'compute.*'] [--pages]
+#                 [--save | --baseline bench/baseline.json]
+# Times the data pipelines and analysis kernels behind the pages, without a
+# browser or a Streamlit server.
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Cases faster than this are not reported as regressions (timer noise)
+NOISE_FLOOR_S = 0.005
+
+# Runs a page script twice (first run and rerun) in bare Streamlit mode; the
+# stage recorder of utils/instrument.py logs to $PAGE_METRICS_LOG
+PAGE_RUNNER = r'''
+import logging, runpy, sys, warnings
+warnings.filterwarnings("ignore")
+logging.disable(logging.WARNING)
+sys.path.insert(0, ".")
+for _ in range(2):
+    runpy.run_path(sys.argv[1], run_name="__main__")
+'''
+
+
+def measure(func, repeat):
+    # Best and median wall time over `repeat` runs after one warm-up run, and
+    # the peak traced allocation of one more run
+    func()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'median_s': statistics.median(times), 'min_s': min(times), 'peak_mb': peak / 2**20}
+
+
+def run_cases(patterns, scales, countries, repeat):
+    # Imported here, after the Streamlit warnings are silenced: the cached
+    # functions warn as they are defined
+    from bench.cases import CASES
+
+    results = {}
+    for name, (build, max_scale) in CASES.items():
+        if patterns and not any(fnmatch.fnmatch(name, p) for p in patterns):
+            continue
+        for scale in scales:
+            if scale > max_scale:
+                continue
+            key = f"{name}[x{scale}]" + (f"[{countries} countries]" if countries > 1 else "")
+            results[key] = measure(build(scale, countries), repeat)
+            report(key, results[key])
+    return results
+
+
+def run_pages(patterns):
+    # First run and rerun of every page, per stage, from the recorder's log
+    results = {}
+    pages = sorted(os.path.join("pages", p) for p in os.listdir("pages") if p.endswith(".py"))
+    with tempfile.TemporaryDirectory() as tmp:
+        for page in pages:
+            name = f"page.{os.path.splitext(os.path.basename(page))[0]}"
+            if patterns and not any(fnmatch.fnmatch(name, p) for p in patterns):
+                continue
+            log = os.path.join(tmp, "metrics.jsonl")
+            env = dict(os.environ, PAGE_METRICS_LOG=log, RESULT_CACHE_DIR=os.path.join(tmp, "results"))
+            subprocess.run([sys.executable, "-c", PAGE_RUNNER, page], env=env, check=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            with open(log) as f:
+                runs = [json.loads(line) for line in f]
+            os.remove(log)
+            for run, record in zip(("first", "rerun"), runs):
+                for stage in record['stages']:
+                    key = f"{name}.{run}.{stage['stage']}"
+                    results[key] = {'median_s': stage['wall_s'], 'min_s': stage['wall_s'],
+                                    'peak_mb': stage['peak_rss_mb']}
+                    report(key, results[key])
+    return results
+
+
+def report(key, result):
+    line = f"{key:<60} {result['median_s'] * 1000:10.1f} ms"
+    if result['peak_mb'] is not None:
+        line += f" {result['peak_mb']:9.1f} MB"
+    print(line, flush=True)
+
+
+def compare(results, baseline, tolerance):
+    # Cases slower than the baseline by more than `tolerance` (a fraction)
+    regressions = []
+    print(f"\n{'case':<60} {'baseline':>10} {'now':>10} {'ratio':>7}")
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        before, now = baseline[key]['median_s'], result['median_s']
+        ratio = now / before if before > 0 else float('inf')
+        slower = ratio > 1 + tolerance and now - before > NOISE_FLOOR_S
+        if slower:
+            regressions.append(key)
+        print(f"{key:<60} {before * 1000:8.1f}ms {now * 1000:8.1f}ms {ratio:6.2f}x{'  REGRESSION' if slower else ''}")
+    return regressions
+
+
+if __name__ == "__main__":
+    # Streamlit warns about every cached call made outside `streamlit run`
+    warnings.filterwarnings("ignore")
+    logging.disable(logging.WARNING)
+
+    parser = argparse.ArgumentParser(description="Benchmark the page pipelines and analysis kernels")
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 10, 100],
+                        help="row multipliers of the synthetic inputs (default: 1 10 100)")
+    parser.add_argument("--countries", type=int, default=1, help="copies of the country in multi-country cases")
+    parser.add_argument("--only", nargs="+", default=[], help="glob patterns of case names to run")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case (default: 3)")
+    parser.add_argument("--pages", action="store_true", help="also run every page script, per stage")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline file to compare with or save to")
+    parser.add_argument("--save", action="store_true", help="save the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="slowdown reported as a regression (default: 0.25 = 25%%)")
+    args = parser.parse_args()
+
+    results = run_cases(args.only, args.scale, args.countries, args.repeat)
+    if args.pages:
+        results.update(run_pages(args.only))
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump({'machine': platform.platform(), 'python': platform.python_version(),
+                       'results': results}, f, indent=1)
+        print(f"\nbaseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f)['results'], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s)")
+            sys.exit(1)
@@ -0,0 +1,267 @@
+import inspect
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+from plotly.subplots import make_subplots
+
+from utils.correlation import (_correlation_table, lagged_correlation_rows, lagged_distance_correlation,
+                               lagged_spearman)
+from utils.countries import country_codes, get_country, population, region_names, region_population
+from utils.data import DATA_DIR, INDEX_COLUMNS, POLICY_COLUMNS, load_oxcgrt, national, oxcgrt_path, regional
+from utils.events import LEVEL_COLUMNS, event_study, event_windows, policy_changes
+from utils.geo import SOURCES, load_geojson
+from utils.ingest import read_columns, read_csv_slice
+from utils.maps import values_on
+from utils.metrics import add_outcome_metrics, add_vaccination_metrics
+from utils.plotting import scatter, status_figure
+from utils.significance import lagged_significance
+from utils.store import NATIONAL, jurisdiction_frame, load_store, region_matrix
+
+# name -> (build, largest scale); build(scale, countries) returns the
+# zero-argument callable that is timed
+CASES = {}
+
+
+def case(name, max_scale=100):
+    def register(build):
+        CASES[name] = (build, max_scale)
+        return build
+    return register
+
+
+# The functions the pages call, without the Streamlit and on-disk result
+# caches in front of them
+def _uncached(func):
+    return inspect.unwrap(func)
+
+
+def _base_country():
+    return country_codes()[0]
+
+
+# `frame` repeated `scale` times back to back (per region when `region` is
+# given), re-dated at 1/scale-day steps so the copies fit in the original
+# date range (a century of daily rows would overflow datetime64[ns])
+def scale_rows(frame, scale, region=None):
+    if scale == 1:
+        return frame
+    scaled = pd.concat([frame] * scale, ignore_index=True)
+    if region is None:
+        position = pd.Series(np.arange(len(scaled)), index=scaled.index)
+    else:
+        scaled = scaled.sort_values(region, kind='stable', ignore_index=True)
+        position = scaled.groupby(region, sort=False).cumcount()
+    start = scaled['Date'].min()
+    return scaled.assign(Date=start + position * (pd.Timedelta(days=1) / scale))
+
+
+# `countries` copies of a frame labelled as different countries in a Country
+# column, as national_outcomes() returns them
+def scale_countries(frame, countries):
+    return pd.concat([frame.assign(Country=f"Country {i}") for i in range(countries)], ignore_index=True)
+
+
+def _outcomes(scale, columns=('ConfirmedCases', 'ConfirmedDeaths')):
+    iso_code = _base_country()
+    df = _uncached(national)(iso_code, list(columns), dropna=True)
+    return add_outcome_metrics(scale_rows(df, scale), population(iso_code))
+
+
+@case("load.read_csv", max_scale=1)
+def read_csv(scale, countries):
+    path = oxcgrt_path(_base_country())
+    return lambda: pd.read_csv(path, low_memory=False)
+
+
+@case("load.columnar", max_scale=1)
+def columnar(scale, countries):
+    path = oxcgrt_path(_base_country())
+    return lambda: read_columns(path)
+
+
+# Page loads: the country's columns from the columnar cache, filtered to it
+@case("load.oxcgrt", max_scale=1)
+def load_country(scale, countries):
+    iso_code = _base_country()
+    load = _uncached(load_oxcgrt)
+    columns = ('ConfirmedCases', 'ConfirmedDeaths', *INDEX_COLUMNS)
+    return lambda: load(iso_code, columns)
+
+
+# National rows only, filtered in the Parquet reader and, without the cache,
+# while streaming the CSV
+@case("load.national", max_scale=1)
+def load_national(scale, countries):
+    iso_code = _base_country()
+    load = _uncached(load_oxcgrt)
+    columns = ('ConfirmedCases', 'ConfirmedDeaths', *INDEX_COLUMNS)
+    return lambda: load(iso_code, columns, 'national')
+
+
+@case("load.csv_slice", max_scale=1)
+def csv_slice(scale, countries):
+    path = oxcgrt_path(_base_country())
+    columns = ['Date', 'ConfirmedCases', 'ConfirmedDeaths', *INDEX_COLUMNS]
+    return lambda: read_csv_slice(path, columns, [('Jurisdiction', '==', "NAT_TOTAL")])
+
+
+@case("derive.outcome_metrics")
+def outcome_metrics(scale, countries):
+    iso_code = _base_country()
+    df = scale_countries(scale_rows(_uncached(national)(iso_code, ['ConfirmedCases', 'ConfirmedDeaths']), scale),
+                         countries)
+    pop = population(iso_code)
+    return lambda: add_outcome_metrics(df, pop)
+
+
+@case("derive.regional_metrics")
+def regional_metrics(scale, countries):
+    iso_code = _base_country()
+    df = scale_rows(_uncached(regional)(iso_code, ['ConfirmedCases', 'ConfirmedDeaths'], dropna=True), scale,
+                    region='RegionCode')
+    pop, region_pop = population(iso_code), region_population(iso_code)
+    return lambda: add_outcome_metrics(df, pop, region_pop)
+
+
+# Page 6: vaccination progress of `countries` copies of every country in the
+# OWID file, in one grouped pass
+@case("derive.vaccination_metrics")
+def vaccination_metrics(scale, countries):
+    df = read_columns(os.path.join(DATA_DIR, "vaccinations.csv"))
+    copies = [df.assign(iso_code=df['iso_code'].astype(str) + str(i)) for i in range(countries)]
+    df = pd.concat([scale_rows(copy.rename(columns={'date': 'Date'}), scale, region='iso_code') for copy in copies],
+                   ignore_index=True).sort_values(['iso_code', 'Date'], kind='stable', ignore_index=True)
+    population = dict.fromkeys(df['iso_code'].unique(), 1e8)
+    return lambda: add_vaccination_metrics(df, population)
+
+
+# Page 2: the region x date matrix of the memory-mapped store (a view of it)
+# and one date's values
+@case("derive.choropleth_prep", max_scale=1)
+def choropleth_prep(scale, countries):
+    iso_code = _base_country()
+    key = SOURCES[get_country(iso_code)['geojson']]['key']
+    store = _uncached(load_store)(iso_code)
+    names = region_names(iso_code)
+    date = store['dates'][len(store['dates']) // 2]
+    return lambda: values_on(region_matrix(store, 'CasesPer100K', names), date, key, 'CasesPer100K')
+
+
+# Pages 3-4: one country's national series, a view of the memory-mapped store
+@case("derive.store_slice", max_scale=1)
+def store_slice(scale, countries):
+    store = _uncached(load_store)(_base_country())
+    return lambda: jurisdiction_frame(store, NATIONAL, ['DailyCaseRate', *INDEX_COLUMNS])
+
+
+# Page 5's kernels on a varying series: the stringency index against the daily
+# case rate (E1 income support, which the page plots, can be constant, and a
+# constant series only exercises the NaN path)
+def _policy_series(scale):
+    df = _outcomes(scale, ('ConfirmedCases', 'ConfirmedDeaths', 'StringencyIndex_WeightedAverage'))
+    return df['StringencyIndex_WeightedAverage'], df['DailyCaseRate']
+
+
+@case("compute.spearman")
+def spearman(scale, countries):
+    x, y = _policy_series(scale)
+    compute = _uncached(lagged_spearman)
+    return lambda: compute(x, y, list(range(0, 481)))
+
+
+@case("compute.dcor")
+def dcor(scale, countries):
+    x, y = _policy_series(scale)
+    compute = _uncached(lagged_distance_correlation)
+    return lambda: compute(x, y, list(range(0, 481, 60)))
+
+
+@case("compute.significance", max_scale=10)
+def significance(scale, countries):
+    x, y = _policy_series(scale)
+    compute = _uncached(lagged_significance)
+    return lambda: compute(x, y, list(range(0, 481, 10)), 'spearman', 200)
+
+
+# Page 7: every region's policy columns against both daily rates, vectorized
+# across regions
+@case("compute.regional_spearman", max_scale=10)
+def regional_spearman(scale, countries):
+    iso_code = _base_country()
+    df = scale_rows(_uncached(regional)(iso_code, ['ConfirmedCases', 'ConfirmedDeaths', *POLICY_COLUMNS]), scale,
+                    region='RegionCode')
+    df = add_outcome_metrics(df, population(iso_code), region_population(iso_code))
+    return lambda: _correlation_table(df, 'RegionCode', POLICY_COLUMNS, ['DailyCaseRate', 'DailyDeathRate'],
+                                      list(range(0, 481, 30)), 'spearman', None, lagged_correlation_rows)
+
+
+# Page 4: the policy change index of every region, and one event study on it
+@case("derive.policy_changes")
+def policy_change_index(scale, countries):
+    iso_code = _base_country()
+    df = scale_rows(_uncached(regional)(iso_code, LEVEL_COLUMNS), scale, region='RegionCode')
+    return lambda: policy_changes(df, LEVEL_COLUMNS, 'RegionCode')
+
+
+@case("compute.event_study")
+def event_study_windows(scale, countries):
+    iso_code = _base_country()
+    df = scale_rows(_uncached(regional)(iso_code, ['ConfirmedCases', 'ConfirmedDeaths', *LEVEL_COLUMNS]), scale,
+                    region='RegionCode')
+    df = add_outcome_metrics(df, population(iso_code), region_population(iso_code))
+    events = policy_changes(df, LEVEL_COLUMNS, 'RegionCode')
+    matrix = df.pivot_table(index='RegionCode', columns='Date', values='DailyCaseRate', aggfunc='last')
+    events = events.assign(Row=matrix.index.get_indexer(events['RegionCode']),
+                           Day=matrix.columns.get_indexer(events['Date']))
+    chosen = events[events['Policy'] == 'C6E_Stay at home requirements']
+    offsets = np.arange(-28, 57)
+    values = matrix.to_numpy(dtype=float)
+    return lambda: event_study(event_windows(chosen, values, offsets), offsets)
+
+
+# Page 3: daily case rate markers and an index line per country
+@case("render.index_figure")
+def index_figure(scale, countries):
+    df = scale_countries(_outcomes(scale, ['ConfirmedCases', 'ConfirmedDeaths'] + INDEX_COLUMNS), countries)
+
+    def build():
+        fig = make_subplots(specs=[[{"secondary_y": True}]])
+        for _, country_data in df.groupby('Country', sort=False):
+            fig.add_trace(scatter(x=country_data['Date'], y=country_data['DailyCaseRate'], mode='markers'),
+                          secondary_y=False)
+            fig.add_trace(scatter(x=country_data['Date'], y=country_data['StringencyIndex_WeightedAverage'],
+                                  mode='lines'), secondary_y=True)
+        return fig.to_json()
+    return build
+
+
+# Page 6: an index for non-vaccinated and vaccinated people, per country
+@case("render.status_figure")
+def status_lines(scale, countries):
+    columns = ['GovernmentResponseIndex_NonVaccinated', 'GovernmentResponseIndex_Vaccinated']
+    df = scale_rows(_uncached(national)(_base_country(), columns), scale)
+
+    def build():
+        return [status_figure(df, 'GovernmentResponseIndex', 'Government Response Index',
+                              'Government Response Index Value').to_json() for _ in range(countries)]
+    return build
+
+
+# Page 2: one date's choropleth, serialized as st.plotly_chart would
+@case("render.choropleth", max_scale=1)
+def choropleth(scale, countries):
+    iso_code = _base_country()
+    country = get_country(iso_code)
+    key = SOURCES[country['geojson']]['key']
+    geojson = _uncached(load_geojson)(country['geojson'])
+    names = list(region_names(iso_code).values())
+    values = pd.DataFrame({key: names, 'CasesPer100K': np.linspace(0, 40000, len(names))})
+
+    def build():
+        fig = px.choropleth_mapbox(values, geojson=geojson, locations=key, featureidkey=f"properties.{key}",
+                                   color='CasesPer100K', mapbox_style='carto-positron',
+                                   zoom=country['map']['zoom'], center=country['map']['center'])
+        return fig.to_json()
+    return build
@@ -1,159 +1,146 @@
-import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
+import streamlit as st
 from plotly.subplots import make_subplots
 import plotly.express as px  # Added for boxplots
 
-us_df = pd.read_csv("./data/OxCGRT_fullwithnotes_USA_v1.csv")
-us_df = us_df[us_df['Jurisdiction'] == "NAT_TOTAL"]
-us_df = us_df[['Date', 'ConfirmedCases', 'ConfirmedDeaths', 'GovernmentResponseIndex_WeightedAverage', 'StringencyIndex_WeightedAverage',
-               'ContainmentHealthIndex_WeightedAverage', 'EconomicSupportIndex']]
-us_df = us_df.dropna()
-us_df['Date'] = pd.to_datetime(us_df['Date'], format='%Y%m%d')
-us_population = 331_000_000  # U.S. population
-us_df['CasesPerCapita'] = us_df['ConfirmedCases'] / us_population * 100_000
-us_df['DeathsPerCapita'] = us_df['ConfirmedDeaths'] / us_population * 100_000
-us_df['Country'] = 'US'
-
-us_df['DailyCaseRate'] = us_df['ConfirmedCases'].diff().fillna(0)
-us_df['DailyDeathRate'] = us_df['ConfirmedDeaths'].diff().fillna(0)
-us_df['DailyCaseRate'] = us_df['DailyCaseRate'].apply(lambda x: max(0, x) / us_population * 100_000)
-us_df['DailyDeathRate'] = us_df['DailyDeathRate'].apply(lambda x: max(0, x) / us_population * 100_000)
-
-us_df_grouped = us_df
-
-can_df = pd.read_csv("./data/OxCGRT_fullwithnotes_CAN_v1.csv")
-can_df = can_df[can_df['Jurisdiction'] == "NAT_TOTAL"]
-can_df = can_df[['Date', 'ConfirmedCases', 'ConfirmedDeaths', 'GovernmentResponseIndex_WeightedAverage', 'StringencyIndex_WeightedAverage',
-               'ContainmentHealthIndex_WeightedAverage', 'EconomicSupportIndex']]
-can_df = can_df.dropna()
-can_df['Date'] = pd.to_datetime(can_df['Date'], format='%Y%m%d')
-can_population = 38_000_000  #CAN population
-can_df['CasesPerCapita'] = can_df['ConfirmedCases'] / can_population * 100_000
-can_df['DeathsPerCapita'] = can_df['ConfirmedDeaths'] / can_population * 100_000
-can_df['Country'] = 'Canada'
-
-# Calculate daily case and death rates for U.S.
-can_df['DailyCaseRate'] = can_df['ConfirmedCases'].diff().fillna(0)
-can_df['DailyDeathRate'] = can_df['ConfirmedDeaths'].diff().fillna(0)
-can_df['DailyCaseRate'] = can_df['DailyCaseRate'].apply(lambda x: max(0, x) / can_population * 100_000)
-can_df['DailyDeathRate'] = can_df['DailyDeathRate'].apply(lambda x: max(0, x) / can_population * 100_000)
-
-can_df_grouped = can_df
-
-# Combine U.S. and Canada data
-combined_df = pd.concat([us_df_grouped, can_df_grouped])
+from utils.countries import label, labels_title, select_countries
+from utils.data import INDEX_COLUMNS
+from utils.instrument import finish_page, plotly_chart, stage, start_page
+from utils.plotting import cached_figure, scatter, zoom_frames, zoom_version
+from utils.store import OUTCOME_METRICS, national_frame, store_version
+
+
+# Rows of every country labelled in a Country column, for the box plots
+def combined(columns):
+    return pd.concat([df[columns].assign(Country=country) for country, df in country_dfs.items()])
+
+
+start_page(__file__)
+
+# Load the selected countries: one frame per country, keyed by its label, read
+# from its memory-mapped store (utils/store.py) and shared by every session
+selected = select_countries()
+stage('load')
+country_dfs = {label(iso_code): national_frame(iso_code, tuple(OUTCOME_METRICS + INDEX_COLUMNS),
+                                               ('ConfirmedCases', 'ConfirmedDeaths', *INDEX_COLUMNS))
+               for iso_code in selected}
+stage('derive')
+# Time series are drawn from the sidebar date range only (full resolution when zoomed in)
+zoomed_dfs = zoom_frames(country_dfs)
+# Figures are rebuilt only when the data drawn or their own widgets change: the
+# stores' sources, the country labels and the date range identify the data
+data_version = (store_version(selected), list(country_dfs))
+zoomed_version = (data_version, zoom_version())
+stage('render')
 
 st.header("Government Response Index")
 
 # ------------------ First Plot ------------------
 # Daily case rate with GovernmentResponseIndex_WeightedAverage
-fig_cases_gov = make_subplots(specs=[[{"secondary_y": True}]])
-for country in ['US', 'Canada']:
-    country_data = combined_df[combined_df['Country'] == country]
-    # Add Daily Case Rate trace as scatter plot
-    fig_cases_gov.add_trace(
-        go.Scatter(
-            x=country_data['Date'],
-            y=country_data['DailyCaseRate'],
-            mode='markers',
-            name=f"{country} Daily Case Count"
-        ),
-        secondary_y=False
-    )
-    # Add Government Response Index as line plot
-    fig_cases_gov.add_trace(
-        go.Scatter(
-            x=country_data['Date'],
-            y=country_data['GovernmentResponseIndex_WeightedAverage'],
-            mode='lines',
-            name=f"{country} Government Response Index"
+def cases_gov_figure():
+    fig_cases_gov = make_subplots(specs=[[{"secondary_y": True}]])
+    for country, country_data in zoomed_dfs.items():
+        # Add Daily Case Rate trace as scatter plot
+        fig_cases_gov.add_trace(
+            scatter(
+                x=country_data['Date'],
+                y=country_data['DailyCaseRate'],
+                mode='markers',
+                name=f"{country} Daily Case Count"
+            ),
+            secondary_y=False
+        )
+        # Add Government Response Index as line plot
+        fig_cases_gov.add_trace(
+            scatter(
+                x=country_data['Date'],
+                y=country_data['GovernmentResponseIndex_WeightedAverage'],
+                mode='lines',
+                name=f"{country} Government Response Index"
+            ),
+            secondary_y=True
+        )
+
+    # Update layout for first plot
+    fig_cases_gov.update_xaxes(title_text="Date")
+    fig_cases_gov.update_yaxes(title_text="Daily Case Count per 100K", secondary_y=False)
+    fig_cases_gov.update_yaxes(title_text="Government Response Index", secondary_y=True)
+    fig_cases_gov.update_layout(
+        title_text="Daily COVID-19 Case Count and Government Response Index Over Time",
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=-0.3,
+            xanchor="center",
+            x=0.5
         ),
-        secondary_y=True
+        margin=dict(b=150),
+        height=600
     )
+    return fig_cases_gov
 
-# Update layout for first plot
-fig_cases_gov.update_xaxes(title_text="Date")
-fig_cases_gov.update_yaxes(title_text="Daily Case Count per 100K", secondary_y=False)
-fig_cases_gov.update_yaxes(title_text="Government Response Index", secondary_y=True)
-fig_cases_gov.update_layout(
-    title_text="Daily COVID-19 Case Count and Government Response Index Over Time",
-    legend=dict(
-        orientation="h",
-        yanchor="bottom",
-        y=-0.3,
-        xanchor="center",
-        x=0.5
-    ),
-    margin=dict(b=150),
-    height=600
-)
-
-st.plotly_chart(fig_cases_gov)
+plotly_chart(cached_figure('index_overall.cases_gov', cases_gov_figure, data_version=zoomed_version))
 
 # ------------------ Second Plot ------------------
 # Daily death rate with GovernmentResponseIndex_WeightedAverage
-fig_deaths_gov = make_subplots(specs=[[{"secondary_y": True}]])
-for country in ['US', 'Canada']:
-    country_data = combined_df[combined_df['Country'] == country]
-    # Add Daily Death Rate trace as scatter plot
-    fig_deaths_gov.add_trace(
-        go.Scatter(
-            x=country_data['Date'],
-            y=country_data['DailyDeathRate'],
-            mode='markers',
-            name=f"{country} Daily Death Count"
-        ),
-        secondary_y=False
-    )
-    # Add Government Response Index as line plot
-    fig_deaths_gov.add_trace(
-        go.Scatter(
-            x=country_data['Date'],
-            y=country_data['GovernmentResponseIndex_WeightedAverage'],
-            mode='lines',
-            name=f"{country} Government Response Index"
+def deaths_gov_figure():
+    fig_deaths_gov = make_subplots(specs=[[{"secondary_y": True}]])
+    for country, country_data in zoomed_dfs.items():
+        # Add Daily Death Rate trace as scatter plot
+        fig_deaths_gov.add_trace(
+            scatter(
+                x=country_data['Date'],
+                y=country_data['DailyDeathRate'],
+                mode='markers',
+                name=f"{country} Daily Death Count"
+            ),
+            secondary_y=False
+        )
+        # Add Government Response Index as line plot
+        fig_deaths_gov.add_trace(
+            scatter(
+                x=country_data['Date'],
+                y=country_data['GovernmentResponseIndex_WeightedAverage'],
+                mode='lines',
+                name=f"{country} Government Response Index"
+            ),
+            secondary_y=True
+        )
+
+    # Update layout for second plot
+    fig_deaths_gov.update_xaxes(title_text="Date")
+    fig_deaths_gov.update_yaxes(title_text="Daily Death Count per 100K", secondary_y=False)
+    fig_deaths_gov.update_yaxes(title_text="Government Response Index", secondary_y=True)
+    fig_deaths_gov.update_layout(
+        title_text="Daily COVID-19 Death Count and Government Response Index Over Time",
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=-0.3,
+            xanchor="center",
+            x=0.5
         ),
-        secondary_y=True
+        margin=dict(b=150),
+        height=600
     )
+    return fig_deaths_gov
 
-# Update layout for second plot
-fig_deaths_gov.update_xaxes(title_text="Date")
-fig_deaths_gov.update_yaxes(title_text="Daily Death Count per 100K", secondary_y=False)
-fig_deaths_gov.update_yaxes(title_text="Government Response Index", secondary_y=True)
-fig_deaths_gov.update_layout(
-    title_text="Daily COVID-19 Death Count and Government Response Index Over Time",
-    legend=dict(
-        orientation="h",
-        yanchor="bottom",
-        y=-0.3,
-        xanchor="center",
-        x=0.5
-    ),
-    margin=dict(b=150),
-    height=600
-)
-
-st.plotly_chart(fig_deaths_gov)
+plotly_chart(cached_figure('index_overall.deaths_gov', deaths_gov_figure, data_version=zoomed_version))
 
 # --- Added Boxplot of Government Response Index ---
 st.subheader("Distribution of Government Response Index Values")
 
-# Prepare data for boxplot
-boxplot_data = pd.concat([
-    us_df_grouped[['Date', 'GovernmentResponseIndex_WeightedAverage']].assign(Country='US'),
-    can_df_grouped[['Date', 'GovernmentResponseIndex_WeightedAverage']].assign(Country='Canada')
-])
-
 # Create boxplot
-fig_box_gov = px.box(
-    boxplot_data,
-    x='Country',
-    y='GovernmentResponseIndex_WeightedAverage',
-    title='Boxplot of Government Response Index: U.S. vs Canada',
-    labels={'GovernmentResponseIndex_WeightedAverage': 'Government Response Index'}
-)
-st.plotly_chart(fig_box_gov)
+def box_gov_figure():
+    return px.box(
+        combined(['Date', 'GovernmentResponseIndex_WeightedAverage']),
+        x='Country',
+        y='GovernmentResponseIndex_WeightedAverage',
+        title=f'Boxplot of Government Response Index: {labels_title(selected)}',
+        labels={'GovernmentResponseIndex_WeightedAverage': 'Government Response Index'}
+    )
+
+plotly_chart(cached_figure('index_overall.box_gov', box_gov_figure, data_version=data_version))
 
 # --- Added Selectbox and Boxplot for Other Indexes ---
 st.header("Stringency, Containment Health, Economic Support Indexes")
@@ -183,49 +170,51 @@ index_names = {
 }
 
 if selected_indexes:
-    fig_cases_indexes = make_subplots(specs=[[{"secondary_y": True}]])
-    for country in ['US', 'Canada']:
-        country_data = combined_df[combined_df['Country'] == country]
-        # Add Daily Case Rate trace as scatter plot
-        fig_cases_indexes.add_trace(
-            go.Scatter(
-                x=country_data['Date'],
-                y=country_data['DailyCaseRate'],
-                mode='markers',
-                name=f"{country} Daily Case Rate"
-            ),
-            secondary_y=False
-        )
-        # Add selected indexes as line plots
-        for index in selected_indexes:
+    def cases_indexes_figure(indexes):
+        fig_cases_indexes = make_subplots(specs=[[{"secondary_y": True}]])
+        for country, country_data in zoomed_dfs.items():
+            # Add Daily Case Rate trace as scatter plot
             fig_cases_indexes.add_trace(
-                go.Scatter(
+                scatter(
                     x=country_data['Date'],
-                    y=country_data[index],
-                    mode='lines',
-                    name=f"{country} {index_names[index]}"
+                    y=country_data['DailyCaseRate'],
+                    mode='markers',
+                    name=f"{country} Daily Case Rate"
                 ),
-                secondary_y=True
+                secondary_y=False
             )
+            # Add selected indexes as line plots
+            for index in indexes:
+                fig_cases_indexes.add_trace(
+                    scatter(
+                        x=country_data['Date'],
+                        y=country_data[index],
+                        mode='lines',
+                        name=f"{country} {index_names[index]}"
+                    ),
+                    secondary_y=True
+                )
+
+        # Update layout for third plot
+        fig_cases_indexes.update_xaxes(title_text="Date")
+        fig_cases_indexes.update_yaxes(title_text="Daily Case Rate per 100K", secondary_y=False)
+        fig_cases_indexes.update_yaxes(title_text="Index Value", secondary_y=True)
+        fig_cases_indexes.update_layout(
+            title_text="Daily COVID-19 Case Rate and Selected Indexes Over Time",
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=-0.4,
+                xanchor="center",
+                x=0.5
+            ),
+            margin=dict(b=150),
+            height=600
+        )
+        return fig_cases_indexes
 
-    # Update layout for third plot
-    fig_cases_indexes.update_xaxes(title_text="Date")
-    fig_cases_indexes.update_yaxes(title_text="Daily Case Rate per 100K", secondary_y=False)
-    fig_cases_indexes.update_yaxes(title_text="Index Value", secondary_y=True)
-    fig_cases_indexes.update_layout(
-        title_text="Daily COVID-19 Case Rate and Selected Indexes Over Time",
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=-0.4,
-            xanchor="center",
-            x=0.5
-        ),
-        margin=dict(b=150),
-        height=600
-    )
-
-    st.plotly_chart(fig_cases_indexes)
+    plotly_chart(cached_figure('index_overall.cases_indexes', cases_indexes_figure, tuple(selected_indexes),
+                               data_version=zoomed_version))
 else:
     st.write("Please select at least one index to display.")
 
@@ -248,49 +237,51 @@ if display_economic_death:
     selected_indexes_death.append('EconomicSupportIndex')
 
 if selected_indexes_death:
-    fig_deaths_indexes = make_subplots(specs=[[{"secondary_y": True}]])
-    for country in ['US', 'Canada']:
-        country_data = combined_df[combined_df['Country'] == country]
-        # Add Daily Death Rate trace as scatter plot
-        fig_deaths_indexes.add_trace(
-            go.Scatter(
-                x=country_data['Date'],
-                y=country_data['DailyDeathRate'],
-                mode='markers',
-                name=f"{country} Daily Death Rate"
-            ),
-            secondary_y=False
-        )
-        # Add selected indexes as line plots
-        for index in selected_indexes_death:
+    def deaths_indexes_figure(indexes):
+        fig_deaths_indexes = make_subplots(specs=[[{"secondary_y": True}]])
+        for country, country_data in zoomed_dfs.items():
+            # Add Daily Death Rate trace as scatter plot
             fig_deaths_indexes.add_trace(
-                go.Scatter(
+                scatter(
                     x=country_data['Date'],
-                    y=country_data[index],
-                    mode='lines',
-                    name=f"{country} {index_names[index]}"
+                    y=country_data['DailyDeathRate'],
+                    mode='markers',
+                    name=f"{country} Daily Death Rate"
                 ),
-                secondary_y=True
+                secondary_y=False
             )
+            # Add selected indexes as line plots
+            for index in indexes:
+                fig_deaths_indexes.add_trace(
+                    scatter(
+                        x=country_data['Date'],
+                        y=country_data[index],
+                        mode='lines',
+                        name=f"{country} {index_names[index]}"
+                    ),
+                    secondary_y=True
+                )
+
+        # Update layout for fourth plot
+        fig_deaths_indexes.update_xaxes(title_text="Date")
+        fig_deaths_indexes.update_yaxes(title_text="Daily Death Rate per 100K", secondary_y=False)
+        fig_deaths_indexes.update_yaxes(title_text="Index Value", secondary_y=True)
+        fig_deaths_indexes.update_layout(
+            title_text="Daily COVID-19 Death Rate and Selected Indexes Over Time",
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=-0.4,
+                xanchor="center",
+                x=0.5
+            ),
+            margin=dict(b=150),
+            height=600
+        )
+        return fig_deaths_indexes
 
-    # Update layout for fourth plot
-    fig_deaths_indexes.update_xaxes(title_text="Date")
-    fig_deaths_indexes.update_yaxes(title_text="Daily Death Rate per 100K", secondary_y=False)
-    fig_deaths_indexes.update_yaxes(title_text="Index Value", secondary_y=True)
-    fig_deaths_indexes.update_layout(
-        title_text="Daily COVID-19 Death Rate and Selected Indexes Over Time",
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=-0.4,
-            xanchor="center",
-            x=0.5
-        ),
-        margin=dict(b=150),
-        height=600
-    )
-
-    st.plotly_chart(fig_deaths_indexes)
+    plotly_chart(cached_figure('index_overall.deaths_indexes', deaths_indexes_figure, tuple(selected_indexes_death),
+                               data_version=zoomed_version))
 else:
     st.write("Please select at least one index to display.")
 
@@ -311,20 +302,18 @@ selected_index_name = st.selectbox(
     index=0  # Default to 'Stringency Index'
 )
 
-selected_index = index_options[selected_index_name]
+# Create boxplot for selected index
+def box_index_figure(selected_index_name):
+    selected_index = index_options[selected_index_name]
+    return px.box(
+        combined(['Date', selected_index]),
+        x='Country',
+        y=selected_index,
+        title=f'Boxplot of {selected_index_name}: {labels_title(selected)}',
+        labels={selected_index: selected_index_name}
+    )
 
-# Prepare data for boxplot
-boxplot_index_data = pd.concat([
-    us_df_grouped[['Date', selected_index]].assign(Country='US'),
-    can_df_grouped[['Date', selected_index]].assign(Country='Canada')
-])
+plotly_chart(cached_figure('index_overall.box_index', box_index_figure, selected_index_name,
+                           data_version=data_version))
 
-# Create boxplot for selected index
-fig_box_index = px.box(
-    boxplot_index_data,
-    x='Country',
-    y=selected_index,
-    title=f'Boxplot of {selected_index_name}: U.S. vs Canada',
-    labels={selected_index: selected_index_name}
-)
-st.plotly_chart(fig_box_index)
\ No newline at end of file
+finish_page()
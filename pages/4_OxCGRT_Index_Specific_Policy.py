@@ -1,8 +1,17 @@
-import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
+import streamlit as st
 from plotly.subplots import make_subplots
 
+from utils.countries import label, labels_title, select_countries
+from utils.events import LEVEL_COLUMNS, event_study, event_windows, policy_event_index
+from utils.instrument import finish_page, plotly_chart, stage, start_page
+from utils.plotting import cached_figure, scatter, zoom_frames, zoom_version
+from utils.store import national_frame, store_version
+
+start_page(__file__)
+
 original_index_columns = [
     'C1E_School closing', 
     'C2E_Workplace closing',  
@@ -99,64 +108,23 @@ index_explanations = {
     'EconomicSupportIndex': '...', 
 }
 
-# Load and prepare U.S. data
-us_population = 331_000_000  # U.S. population
-us_df = pd.read_csv("./data/OxCGRT_fullwithnotes_USA_v1.csv")
-us_raw = pd.read_csv("./data/OxCGRT_fullwithnotes_USA_v1.csv")
-us_df = us_df[us_df['Jurisdiction'] == "NAT_TOTAL"]
-us_df = us_df[['Date', 'ConfirmedCases', 'ConfirmedDeaths', 'GovernmentResponseIndex_WeightedAverage', 'StringencyIndex_WeightedAverage',
-               'ContainmentHealthIndex_WeightedAverage', 'EconomicSupportIndex']]
-us_df = us_df.dropna()
-for index in original_index_columns:
-    us_df[index] = us_raw[index]
-us_df['Date'] = pd.to_datetime(us_df['Date'], format='%Y%m%d')
-
-us_df_grouped = us_df
-
-us_df_grouped['Country'] = 'US'
-
-# Calculate daily case and death rates for U.S.
-us_df_grouped['DailyCaseRate'] = us_df_grouped['ConfirmedCases'].diff().fillna(0)
-us_df_grouped['DailyDeathRate'] = us_df_grouped['ConfirmedDeaths'].diff().fillna(0)
-us_df_grouped['DailyCaseRate'] = us_df_grouped['DailyCaseRate'].apply(lambda x: max(0, x) / us_population * 100_000)
-us_df_grouped['DailyDeathRate'] = us_df_grouped['DailyDeathRate'].apply(lambda x: max(0, x) / us_population * 100_000)
+# Load the selected countries, with the monetary indexes scaled to 100K
+# population: one frame per country, keyed by its label, read from its
+# memory-mapped store (utils/store.py) and shared by every session
+selected = select_countries()
+stage('load')
+country_dfs = {label(iso_code): national_frame(iso_code, ('DailyCaseRate', 'DailyDeathRate', *index_columns),
+                                               ('ConfirmedCases', 'ConfirmedDeaths', *original_index_columns[-4:]))
+               for iso_code in selected}
+stage('derive')
+# Time series are drawn from the sidebar date range only (full resolution when zoomed in)
+zoomed_dfs = zoom_frames(country_dfs)
+# Figures are rebuilt only when the data drawn or their own widgets change: the
+# stores' sources, the country labels and the date range identify the data
+data_version = (store_version(selected), list(country_dfs), zoom_version())
+stage('render')
 
-# Load and prepare Canada data
-can_population = 38_000_000  #CAN population
-can_df = pd.read_csv("./data/OxCGRT_fullwithnotes_CAN_v1.csv")
-can_raw = pd.read_csv("./data/OxCGRT_fullwithnotes_CAN_v1.csv")
-can_df = can_df[can_df['Jurisdiction'] == "NAT_TOTAL"]
-can_df = can_df[['Date', 'ConfirmedCases', 'ConfirmedDeaths', 'GovernmentResponseIndex_WeightedAverage', 'StringencyIndex_WeightedAverage',
-               'ContainmentHealthIndex_WeightedAverage', 'EconomicSupportIndex']]
-can_df = can_df.dropna()
-for index in original_index_columns:
-    can_df[index] = can_raw[index]
-can_df['Date'] = pd.to_datetime(can_df['Date'], format='%Y%m%d')
-
-can_df_grouped = can_df
-can_df_grouped['Country'] = 'Canada'
-
-# Calculate daily case and death rates for Canada
-can_df_grouped['DailyCaseRate'] = can_df_grouped['ConfirmedCases'].diff().fillna(0)
-can_df_grouped['DailyDeathRate'] = can_df_grouped['ConfirmedDeaths'].diff().fillna(0)
-can_df_grouped['DailyCaseRate'] = can_df_grouped['DailyCaseRate'].apply(lambda x: max(0, x) / can_population * 100_000)
-can_df_grouped['DailyDeathRate'] = can_df_grouped['DailyDeathRate'].apply(lambda x: max(0, x) / can_population * 100_000)
-
-# Scale to 100 k POP
-index_to_scale = [
-    "E3_Fiscal measures",
-    "E4_International support",
-    "H4_Emergency investment in healthcare",
-    "H5_Investment in vaccines"
-]
-for idx in index_to_scale:
-    us_df_grouped[idx + " Per 100K Population"] = us_df_grouped[idx] / us_population * 100_000
-    can_df_grouped[idx + " Per 100K Population"] = can_df_grouped[idx] / can_population * 100_000
-
-# Combine U.S. and Canada data
-combined_df = pd.concat([us_df_grouped, can_df_grouped])
-
-st.header("COVID-19 Daily Case and Death Counts Per 100K Population and Policy Index Over Time: U.S. vs Canada")
+st.header(f"COVID-19 Daily Case and Death Counts Per 100K Population and Policy Index Over Time: {labels_title(selected)}")
 
 # ------------------ First Plot ------------------
 # Daily case rate with selectable index using selectbox
@@ -169,48 +137,50 @@ if selected_index:
     # Display the detailed explanation for the selected index
     st.write(f"**Explanation:** {index_explanations[selected_index]}")
 
-    fig_cases_indexes = make_subplots(specs=[[{"secondary_y": True}]])
-    for country in ['US', 'Canada']:
-        country_data = combined_df[combined_df['Country'] == country]
-        # Add Daily Case Rate trace as scatter plot
-        fig_cases_indexes.add_trace(
-            go.Scatter(
-                x=country_data['Date'],
-                y=country_data['DailyCaseRate'],
-                mode='markers',
-                name=f"{country} Daily Case Count"
-            ),
-            secondary_y=False
-        )
-        # Add selected index as line plot
-        fig_cases_indexes.add_trace(
-            go.Scatter(
-                x=country_data['Date'],
-                y=country_data[selected_index],
-                mode='lines',
-                name=f"{country} {selected_index}"
+    def cases_index_figure(selected_index):
+        fig_cases_indexes = make_subplots(specs=[[{"secondary_y": True}]])
+        for country, country_data in zoomed_dfs.items():
+            # Add Daily Case Rate trace as scatter plot
+            fig_cases_indexes.add_trace(
+                scatter(
+                    x=country_data['Date'],
+                    y=country_data['DailyCaseRate'],
+                    mode='markers',
+                    name=f"{country} Daily Case Count"
+                ),
+                secondary_y=False
+            )
+            # Add selected index as line plot
+            fig_cases_indexes.add_trace(
+                scatter(
+                    x=country_data['Date'],
+                    y=country_data[selected_index],
+                    mode='lines',
+                    name=f"{country} {selected_index}"
+                ),
+                secondary_y=True
+            )
+
+        # Update layout for first plot
+        fig_cases_indexes.update_xaxes(title_text="Date")
+        fig_cases_indexes.update_yaxes(title_text="Daily Case Count per 100K", secondary_y=False)
+        fig_cases_indexes.update_yaxes(title_text="Index Value", secondary_y=True)
+        fig_cases_indexes.update_layout(
+            title_text="Daily COVID-19 Case Count and Selected Index Over Time",
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=-0.4,
+                xanchor="center",
+                x=0.5
             ),
-            secondary_y=True
+            margin=dict(b=150),
+            height=600
         )
+        return fig_cases_indexes
 
-    # Update layout for first plot
-    fig_cases_indexes.update_xaxes(title_text="Date")
-    fig_cases_indexes.update_yaxes(title_text="Daily Case Count per 100K", secondary_y=False)
-    fig_cases_indexes.update_yaxes(title_text="Index Value", secondary_y=True)
-    fig_cases_indexes.update_layout(
-        title_text="Daily COVID-19 Case Count and Selected Index Over Time",
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=-0.4,
-            xanchor="center",
-            x=0.5
-        ),
-        margin=dict(b=150),
-        height=600
-    )
-
-    st.plotly_chart(fig_cases_indexes)
+    plotly_chart(cached_figure('specific_policy.cases_index', cases_index_figure, selected_index,
+                               data_version=data_version))
 else:
     st.write("Please select an index to display.")
 
@@ -226,48 +196,110 @@ if selected_index_death:
     # Display the detailed explanation for the selected index
     # st.write(f"**Explanation:** {index_explanations[selected_index_death]}")
 
-    fig_deaths_indexes = make_subplots(specs=[[{"secondary_y": True}]])
-    for country in ['US', 'Canada']:
-        country_data = combined_df[combined_df['Country'] == country]
-        # Add Daily Death Rate trace as scatter plot
-        fig_deaths_indexes.add_trace(
-            go.Scatter(
-                x=country_data['Date'],
-                y=country_data['DailyDeathRate'],
-                mode='markers',
-                name=f"{country} Daily Death Count"
-            ),
-            secondary_y=False
-        )
-        # Add selected index as line plot
-        fig_deaths_indexes.add_trace(
-            go.Scatter(
-                x=country_data['Date'],
-                y=country_data[selected_index_death],
-                mode='lines',
-                name=f"{country} {selected_index_death}"
+    def deaths_index_figure(selected_index_death):
+        fig_deaths_indexes = make_subplots(specs=[[{"secondary_y": True}]])
+        for country, country_data in zoomed_dfs.items():
+            # Add Daily Death Rate trace as scatter plot
+            fig_deaths_indexes.add_trace(
+                scatter(
+                    x=country_data['Date'],
+                    y=country_data['DailyDeathRate'],
+                    mode='markers',
+                    name=f"{country} Daily Death Count"
+                ),
+                secondary_y=False
+            )
+            # Add selected index as line plot
+            fig_deaths_indexes.add_trace(
+                scatter(
+                    x=country_data['Date'],
+                    y=country_data[selected_index_death],
+                    mode='lines',
+                    name=f"{country} {selected_index_death}"
+                ),
+                secondary_y=True
+            )
+
+        # Update layout for second plot
+        fig_deaths_indexes.update_xaxes(title_text="Date")
+        fig_deaths_indexes.update_yaxes(title_text="Daily Death Count per 100K", secondary_y=False)
+        fig_deaths_indexes.update_yaxes(title_text="Index Value", secondary_y=True)
+        fig_deaths_indexes.update_layout(
+            title_text="Daily COVID-19 Death Count and Selected Index Over Time",
+            legend=dict(
+                orientation="h",
+                yanchor="bottom",
+                y=-0.4,
+                xanchor="center",
+                x=0.5
             ),
-            secondary_y=True
+            margin=dict(b=150),
+            height=600
         )
+        return fig_deaths_indexes
 
-    # Update layout for second plot
-    fig_deaths_indexes.update_xaxes(title_text="Date")
-    fig_deaths_indexes.update_yaxes(title_text="Daily Death Count per 100K", secondary_y=False)
-    fig_deaths_indexes.update_yaxes(title_text="Index Value", secondary_y=True)
-    fig_deaths_indexes.update_layout(
-        title_text="Daily COVID-19 Death Count and Selected Index Over Time",
-        legend=dict(
-            orientation="h",
-            yanchor="bottom",
-            y=-0.4,
-            xanchor="center",
-            x=0.5
-        ),
-        margin=dict(b=150),
-        height=600
-    )
-
-    st.plotly_chart(fig_deaths_indexes)
+    plotly_chart(cached_figure('specific_policy.deaths_index', deaths_index_figure, selected_index_death,
+                               data_version=data_version))
 else:
     st.write("Please select an index to display.")
 
+# ------------------ Policy Change Event Study ------------------
+# Outcome paths around every change of a policy to a chosen level, aligned on
+# the day of the change and averaged across changes and jurisdictions. The
+# change index of each country is built once (utils/events.py), so a query
+# only filters it and reads the windows.
+st.header("Policy Change Event Study")
+
+event_policy = st.selectbox("Policy", LEVEL_COLUMNS, index=LEVEL_COLUMNS.index('C6E_Stay at home requirements'),
+                            key="event_policy")
+include_regions = st.toggle("Include state and province changes", value=True, key="event_regions")
+stage('load')
+event_indexes = {iso_code: policy_event_index(iso_code, include_regions) for iso_code in selected}
+stage('render')
+levels = sorted({int(level) for events, _ in event_indexes.values()
+                 for level in events['To'][events['Policy'] == event_policy].unique()})
+if not levels:
+    st.write("The selected policy does not change in the selected countries.")
+else:
+    event_level = st.selectbox("Changed to level", levels, index=levels.index(2) if 2 in levels else 0,
+                               key="event_level")
+    event_offsets = np.arange(-28, 57)
+    horizons = [14, 28, 56]
+
+    stage('compute')
+    studies = {}
+    for outcome in ['DailyCaseRate', 'DailyDeathRate']:
+        windows = []
+        for events, matrices in event_indexes.values():
+            chosen = events[(events['Policy'] == event_policy) & (events['To'] == event_level)]
+            windows.append(event_windows(chosen, matrices[outcome], event_offsets))
+        studies[outcome] = event_study(np.concatenate(windows), event_offsets)
+    stage('render')
+
+    st.write(f"**Explanation:** {index_explanations[event_policy]}")
+    for outcome, name in (('DailyCaseRate', "Daily Case Count"), ('DailyDeathRate', "Daily Death Count")):
+        study = studies[outcome]
+        fig = go.Figure()
+        fig.add_trace(go.Scatter(x=pd.concat([study['Offset'], study['Offset'][::-1]]),
+                                 y=pd.concat([study['CIHigh'], study['CILow'][::-1]]), fill="toself", opacity=0.2,
+                                 line=dict(width=0), hoverinfo="skip", showlegend=False, name="95% CI"))
+        fig.add_trace(go.Scatter(x=study['Offset'], y=study['Mean'], mode='lines', name="Mean change",
+                                 customdata=study['Events'],
+                                 hovertemplate="Day %{x}: %{y:.3f} (%{customdata} changes)<extra></extra>"))
+        fig.add_vline(x=0, line_dash="dot")
+        fig.update_layout(title=f"Change in {name} per 100K Around {event_policy} Moving to {event_level}",
+                          xaxis_title="Days since the change",
+                          yaxis_title="Change since the week before",
+                          showlegend=False)
+        plotly_chart(fig)
+
+    # Mean change and number of changes at fixed horizons
+    summary = pd.DataFrame({
+        'Days after': horizons,
+        **{f"{outcome} change": studies[outcome].set_index('Offset').loc[horizons, 'Mean'].to_numpy()
+           for outcome in studies},
+        'Changes': studies['DailyCaseRate'].set_index('Offset').loc[horizons, 'Events'].to_numpy(),
+    })
+    st.dataframe(summary, hide_index=True)
+
+finish_page()
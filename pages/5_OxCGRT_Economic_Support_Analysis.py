@@ -2,155 +2,149 @@ import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from scipy.stats import spearmanr
-import dcor
-
-us_df = pd.read_csv("./data/OxCGRT_fullwithnotes_USA_v1.csv")
-us_df = us_df[us_df["Jurisdiction"] == "NAT_TOTAL"]
-us_population = 331_000_000 
-us_df['DailyCaseRate'] = us_df['ConfirmedCases'].diff().fillna(0)
-us_df['DailyDeathRate'] = us_df['ConfirmedDeaths'].diff().fillna(0)
-us_df['DailyCaseRate'] = us_df['DailyCaseRate'].apply(lambda x: max(0, x) / us_population * 100_000)
-us_df['DailyDeathRate'] = us_df['DailyDeathRate'].apply(lambda x: max(0, x) / us_population * 100_000)
-
-can_df = pd.read_csv("./data/OxCGRT_fullwithnotes_CAN_v1.csv")
-can_df = can_df[can_df["Jurisdiction"] == "NAT_TOTAL"]
-can_population = 331_000_000 
-can_df['DailyCaseRate'] = can_df['ConfirmedCases'].diff().fillna(0)
-can_df['DailyDeathRate'] = can_df['ConfirmedDeaths'].diff().fillna(0)
-can_df['DailyCaseRate'] = can_df['DailyCaseRate'].apply(lambda x: max(0, x) / can_population * 100_000)
-can_df['DailyDeathRate'] = can_df['DailyDeathRate'].apply(lambda x: max(0, x) / can_population * 100_000)
+
+from utils.correlation import lagged_distance_correlation, lagged_spearman
+from utils.countries import select_countries
+from utils.data import national_outcomes
+from utils.instrument import finish_page, plotly_chart, stage, start_page
+from utils.significance import lagged_significance
+
+start_page(__file__)
+
+columns = ['ConfirmedCases', 'ConfirmedDeaths', 'E1_Income support', 'E2_Debt/contract relief',
+           'E3_Fiscal measures', 'E4_International support']
 
 index_to_scale = [
     "E3_Fiscal measures",
     "E4_International support",
 ]
-for idx in index_to_scale:
-    us_df[idx + " Per 100K Population"] = us_df[idx] / us_population * 100_000
-    can_df[idx + " Per 100K Population"] = can_df[idx] / can_population * 100_000
 
+# One frame per selected country, keyed by its label
+selected = select_countries()
+stage('load')
+combined_df = national_outcomes(selected, columns, per_100k=index_to_scale)
+stage('derive')
+country_dfs = dict(tuple(combined_df.groupby('Country', sort=False)))
+
+# Spearman correlation of df1 with df2 shifted back by each lag, as a frame
+# with Lag, Correlation, PValue, CILow, CIHigh and N columns
 def spearmanr_correlation(df1, df2, lags):
-    corrs = []
-    for lag in lags:
-        # Shift df2 without modifying it in place
-        shifted_df2 = df2.shift(-lag)
-        
-        # Combine df1 and shifted_df2 into a single DataFrame
-        combined = pd.concat([df1, shifted_df2], axis=1)
-        combined.columns = ['df1', 'df2']
-        
-        # Drop rows with NaN values
-        combined = combined.dropna()
-        
-        corr, _ = spearmanr(combined['df1'], combined['df2'])
-        corrs.append(corr)
-
-    return corrs
-
-def spearmanr_plot(selected_index, lags):
-    df1 = us_df[selected_index]
-    df2 = us_df['DailyCaseRate']
-    df3 = us_df['DailyDeathRate']
-    lagged_correlations_cases = spearmanr_correlation(df1, df2, lags)
-    lagged_correlations_deaths = spearmanr_correlation(df1, df3, lags)
-
-    us_df_cases = pd.DataFrame({"Lag": lags, "Correlation": lagged_correlations_cases})
-    us_df_deaths = pd.DataFrame({"Lag": lags, "Correlation": lagged_correlations_deaths})
-
-    df1 = can_df[selected_index]
-    df2 = can_df['DailyCaseRate']
-    df3 = can_df['DailyDeathRate']
-    lagged_correlations_cases = spearmanr_correlation(df1, df2, lags)
-    lagged_correlations_deaths = spearmanr_correlation(df1, df3, lags)
-
-    can_df_cases = pd.DataFrame({"Lag": lags, "Correlation": lagged_correlations_cases})
-    can_df_deaths = pd.DataFrame({"Lag": lags, "Correlation": lagged_correlations_deaths})
+    return lagged_spearman(df1, df2, lags)
+
+def add_band(fig, lags, low, high, color, name, dash=None):
+    # Shaded band between low and high, or two dashed lines if dash is given
+    x = pd.concat([lags, lags[::-1]])
+    y = pd.concat([high, low[::-1]])
+    if dash is None:
+        fig.add_trace(go.Scatter(x=x, y=y, fill="toself", fillcolor=color, opacity=0.2, line=dict(width=0),
+                                 hoverinfo="skip", showlegend=False, name=name))
+    else:
+        fig.add_trace(go.Scatter(x=x, y=y, mode="lines", line=dict(color=color, width=1, dash=dash),
+                                 hoverinfo="skip", showlegend=False, name=name))
+
+def add_correlation_traces(fig, result, name, significance=None):
+    # Correlation line with its 95% confidence interval as a shaded band. With
+    # resampling significance, the interval is the block bootstrap one and the
+    # block permutation null band is drawn as dotted lines.
+    colorway = fig.layout.template.layout.colorway
+    color = colorway[sum(trace.showlegend is not False for trace in fig.data) % len(colorway)]
+    fig.add_trace(go.Scatter(x=result["Lag"], y=result["Correlation"], name=name, line=dict(color=color)))
+    if significance is not None:
+        add_band(fig, significance["Lag"], significance["CILow"], significance["CIHigh"], color, f"{name} 95% CI")
+        add_band(fig, significance["Lag"], significance["NullLow"], significance["NullHigh"], color,
+                 f"{name} 95% null band", dash="dot")
+    elif "CILow" in result:
+        add_band(fig, result["Lag"], result["CILow"], result["CIHigh"], color, f"{name} 95% CI")
+
+def correlation_significance(df1, df2, lags, method):
+    if not show_significance:
+        return None
+    with st.spinner("Resampling..."):
+        return lagged_significance(df1, df2, lags, method, n_resamples[method])
+
+def spearmanr_plot(selected_index, lags, significance_lags):
+    fig_cases = go.Figure()
+    fig_deaths = go.Figure()
+    for country, df in country_dfs.items():
+        for fig, outcome in ((fig_cases, 'DailyCaseRate'), (fig_deaths, 'DailyDeathRate')):
+            stage('compute')
+            result = spearmanr_correlation(df[selected_index], df[outcome], lags)
+            significance = correlation_significance(df[selected_index], df[outcome], significance_lags, 'spearman')
+            stage('render')
+            add_correlation_traces(fig, result, country, significance)
 
     # Plotly visualization for DailyCaseRate
-    fig_cases = go.Figure()
-    fig_cases.add_trace(go.Scatter(x=us_df_cases["Lag"], y=us_df_cases["Correlation"], name="US"))
-    fig_cases.add_trace(go.Scatter(x=can_df_cases["Lag"], y=can_df_cases["Correlation"], name="Canada"))
     fig_cases.update_layout(title=f"Spearman Correlation of {selected_index} and Lagged Daily Case Count",
                             xaxis_title="Lag (days)",
                             yaxis_title="Spearman Correlation",
                             )
-    st.plotly_chart(fig_cases)
+    plotly_chart(fig_cases)
 
     # Plotly visualization for DailyDeathRate
-    fig_deaths = go.Figure()
-    fig_deaths.add_trace(go.Scatter(x=us_df_deaths["Lag"], y=us_df_deaths["Correlation"], name="US"))
-    fig_deaths.add_trace(go.Scatter(x=can_df_deaths["Lag"], y=can_df_deaths["Correlation"], name="Canada"))
     fig_deaths.update_layout(title=f"Spearman Correlation of {selected_index} and Lagged Daily Death Count",
                             xaxis_title="Lag (days)",
                             yaxis_title="Spearman Correlation",
                             )
-    st.plotly_chart(fig_deaths)
+    plotly_chart(fig_deaths)
+
+stage('render')
+
+# Resampling significance (utils/significance.py): null bands from block
+# permutations and confidence intervals from a block bootstrap, cached per
+# series, lag grid and number of resamples. A distance correlation resample
+# costs about as much as a whole lagged distance correlation, so it gets far
+# fewer by default.
+show_significance = st.toggle("Show resampling significance bands", value=False, key="show_significance")
+n_resamples = {'spearman': 200, 'dcor': 50}
+if show_significance:
+    n_resamples['spearman'] = st.select_slider("Spearman resamples per lag", options=[200, 500, 1000, 2000],
+                                               value=200)
+    n_resamples['dcor'] = st.select_slider("Distance correlation resamples per lag", options=[50, 100, 200, 500],
+                                           value=50)
+    st.caption("Distance correlation resampling takes about 1 second per series and outcome at 50 resamples on "
+               "one core, and grows linearly with the count (about 5 seconds at 200). Results are cached.")
 
 st.header("Analysis of the Effects of E1 Income Support and E2 Debt or Contract Relief for Households")
 
-spearmanr_plot("E1_Income support", list(range(0, 481, 60)))
+# Every lag from 0 to 480 days, with significance every 10 days
+spearmanr_plot("E1_Income support", list(range(0, 481)), list(range(0, 481, 10)))
 
-spearmanr_plot("E2_Debt/contract relief", list(range(0, 481, 60)))
+spearmanr_plot("E2_Debt/contract relief", list(range(0, 481)), list(range(0, 481, 10)))
 
+# Distance correlation of df1 with df2 shifted back by each lag, as a frame
+# with Lag, Correlation and N columns
 def dcor_correlation(df1, df2, lags):
-    corrs = []
-    for lag in lags:
-        # Shift df2 without modifying it in place
-        shifted_df2 = df2.shift(-lag)
-        
-        # Combine df1 and shifted_df2 into a single DataFrame
-        combined = pd.concat([df1, shifted_df2], axis=1)
-        combined.columns = ['df1', 'df2']
-        
-        # Drop rows with NaN values
-        combined = combined.dropna()
-        
-        corr = dcor.distance_correlation(combined['df1'], combined['df2'])
-        corrs.append(corr)
-
-    return corrs
+    return lagged_distance_correlation(df1, df2, lags)
 
 def dcor_plot(selected_index, lags):
-    df1 = us_df[selected_index]
-    df2 = us_df['DailyCaseRate']
-    df3 = us_df['DailyDeathRate']
-    lagged_correlations_cases = dcor_correlation(df1, df2, lags)
-    lagged_correlations_deaths = dcor_correlation(df1, df3, lags)
-
-    us_df_cases = pd.DataFrame({"Lag": lags, "Correlation": lagged_correlations_cases})
-    us_df_deaths = pd.DataFrame({"Lag": lags, "Correlation": lagged_correlations_deaths})
-
-    df1 = can_df[selected_index]
-    df2 = can_df['DailyCaseRate']
-    df3 = can_df['DailyDeathRate']
-    lagged_correlations_cases = dcor_correlation(df1, df2, lags)
-    lagged_correlations_deaths = dcor_correlation(df1, df3, lags)
-
-    can_df_cases = pd.DataFrame({"Lag": lags, "Correlation": lagged_correlations_cases})
-    can_df_deaths = pd.DataFrame({"Lag": lags, "Correlation": lagged_correlations_deaths})
+    fig_cases = go.Figure()
+    fig_deaths = go.Figure()
+    for country, df in country_dfs.items():
+        for fig, outcome in ((fig_cases, 'DailyCaseRate'), (fig_deaths, 'DailyDeathRate')):
+            stage('compute')
+            result = dcor_correlation(df[selected_index], df[outcome], lags)
+            significance = correlation_significance(df[selected_index], df[outcome], lags, 'dcor')
+            stage('render')
+            add_correlation_traces(fig, result, country, significance)
 
     # Plotly visualization for DailyCaseRate
-    fig_cases = go.Figure()
-    fig_cases.add_trace(go.Scatter(x=us_df_cases["Lag"], y=us_df_cases["Correlation"], name="US"))
-    fig_cases.add_trace(go.Scatter(x=can_df_cases["Lag"], y=can_df_cases["Correlation"], name="Canada"))
     fig_cases.update_layout(title=f"Distance Correlation of {selected_index} and Lagged Daily Case Count",
                             xaxis_title="Lag (days)",
                             yaxis_title="Distance Correlation",
                             )
-    st.plotly_chart(fig_cases)
+    plotly_chart(fig_cases)
 
     # Plotly visualization for DailyDeathRate
-    fig_deaths = go.Figure()
-    fig_deaths.add_trace(go.Scatter(x=us_df_deaths["Lag"], y=us_df_deaths["Correlation"], name="US"))
-    fig_deaths.add_trace(go.Scatter(x=can_df_deaths["Lag"], y=can_df_deaths["Correlation"], name="Canada"))
     fig_deaths.update_layout(title=f"Distance Correlation of {selected_index} and Lagged Daily Death Count",
                             xaxis_title="Lag (days)",
                             yaxis_title="Distance Correlation",
                             )
-    st.plotly_chart(fig_deaths)
+    plotly_chart(fig_deaths)
 
 st.header("Analysis of the Effects of E3 Fiscal Measures Per 100K Population and E4 Providing Support to Other Countries Per 100K Population")
 
 dcor_plot("E3_Fiscal measures Per 100K Population", list(range(0, 481, 60)))
 
-dcor_plot("E4_International support Per 100K Population", list(range(0, 481, 60)))
\ No newline at end of file
+dcor_plot("E4_International support Per 100K Population", list(range(0, 481, 60)))
+
+finish_page()
@@ -0,0 +1,80 @@
+import plotly.graph_objects as go
+import streamlit as st
+
+from utils.correlation import correlation_table
+from utils.countries import label, region_names, select_countries
+from utils.data import POLICY_COLUMNS, regional_outcomes
+from utils.instrument import finish_page, plotly_chart, stage, start_page
+
+start_page(__file__)
+
+OUTCOMES = {
+    'DailyCaseRate': "Daily Case Count",
+    'DailyDeathRate': "Daily Death Count",
+}
+
+METHODS = {
+    'spearman': "Spearman Correlation",
+    'dcor': "Distance Correlation",
+}
+
+selected = select_countries(regional=True)
+
+# Every (region, policy, outcome) pair of the selected countries is correlated
+# at every lag in one vectorized batch per country (utils/correlation.py)
+policies = st.sidebar.multiselect("Policies", POLICY_COLUMNS, default=['E1_Income support', 'E2_Debt/contract relief'],
+                                  key="regional_policies")
+outcomes = st.sidebar.multiselect("Outcomes", list(OUTCOMES), default=list(OUTCOMES), format_func=OUTCOMES.get,
+                                  key="regional_outcomes")
+method = st.sidebar.radio("Method", list(METHODS), format_func=METHODS.get, key="regional_method")
+lag_step = st.sidebar.select_slider("Days between lags", options=[1, 5, 10, 30, 60], value=10, key="regional_lag_step")
+if not policies or not outcomes:
+    st.info("Select at least one policy and one outcome.")
+    st.stop()
+lags = list(range(0, 481, lag_step))
+
+# One tidy table per country: Region, Policy, Outcome, Lag, Correlation, N
+# (and PValue for Spearman)
+tables = {}
+for iso_code in selected:
+    stage('load')
+    df = regional_outcomes(iso_code, ['ConfirmedCases', 'ConfirmedDeaths'] + policies)
+    stage('compute')
+    with st.spinner(f"Correlating {label(iso_code)} regions..."):
+        table = correlation_table(df, 'RegionCode', policies, outcomes, lags, method)
+    stage('derive')
+    table = table.rename(columns={'X': 'Policy', 'Y': 'Outcome'})
+    tables[iso_code] = table.assign(Region=table['RegionCode'].map(region_names(iso_code)))
+
+stage('render')
+
+
+# Region x lag heatmap of one policy against one outcome
+def correlation_heatmap(table, policy, outcome, title):
+    rows = table[(table['Policy'] == policy) & (table['Outcome'] == outcome)]
+    matrix = rows.pivot(index='Region', columns='Lag', values='Correlation')
+    zmin = -1 if method == 'spearman' else 0
+    fig = go.Figure(go.Heatmap(z=matrix.to_numpy(), x=matrix.columns, y=matrix.index, zmin=zmin, zmax=1,
+                               colorscale='RdBu' if method == 'spearman' else 'Viridis',
+                               reversescale=method == 'spearman', colorbar=dict(title=METHODS[method])))
+    fig.update_layout(title=title, xaxis_title="Lag (days)", yaxis_title="Region",
+                      height=max(400, 18 * len(matrix)))
+    return fig
+
+
+for iso_code, table in tables.items():
+    st.header(f"{METHODS[method]} of Policies and Lagged Outcomes in {label(iso_code)} Regions")
+    for policy in policies:
+        for outcome in outcomes:
+            title = f"{METHODS[method]} of {policy} and Lagged {OUTCOMES[outcome]}"
+            plotly_chart(correlation_heatmap(table, policy, outcome, title))
+
+    columns = ['Region', 'RegionCode', 'Policy', 'Outcome', 'Lag', 'Correlation', 'N']
+    if 'PValue' in table:
+        columns.append('PValue')
+    st.dataframe(table[columns], hide_index=True)
+    st.download_button("Download table (CSV)", table[columns].to_csv(index=False).encode(),
+                       file_name=f"{iso_code}_regional_{method}.csv", mime="text/csv",
+                       key=f"download_{iso_code}")
+
+finish_page()
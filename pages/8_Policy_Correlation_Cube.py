@@ -0,0 +1,77 @@
+import plotly.graph_objects as go
+import streamlit as st
+
+from utils.countries import label, select_countries
+from utils.cube import COLUMNS, METHODS, OUTCOMES, cube_is_stale, load_cube
+from utils.instrument import finish_page, plotly_chart, stage, start_page
+
+start_page(__file__)
+
+METHOD_NAMES = {
+    'spearman': "Spearman Correlation",
+    'pearson': "Pearson Correlation",
+    'dcor': "Distance Correlation",
+}
+
+OUTCOME_NAMES = {
+    'DailyCaseRate': "Daily Case Count",
+    'DailyDeathRate': "Daily Death Count",
+}
+
+# Precomputed correlations of every policy and index column with both
+# outcomes at every lag (python -m utils.cube); the page only slices them
+selected = select_countries()
+method = st.sidebar.radio("Method", METHODS, format_func=METHOD_NAMES.get, key="cube_method")
+outcome = st.sidebar.radio("Outcome", OUTCOMES, format_func=OUTCOME_NAMES.get, key="cube_outcome")
+lag_range = st.sidebar.slider("Lags (days)", min_value=0, max_value=480, value=(0, 480), key="cube_lags")
+
+stage('load')
+cubes = {}
+for iso_code in selected:
+    cube = load_cube(iso_code)
+    if cube is None:
+        st.warning(f"No correlation cube for {label(iso_code)}; build it with `python -m utils.cube {iso_code}`.")
+        continue
+    if cube_is_stale(iso_code, cube):
+        st.warning(f"The {label(iso_code)} data changed since its correlation cube was built; rebuild it with "
+                   f"`python -m utils.cube {iso_code}`.")
+    cubes[iso_code] = cube
+if not cubes:
+    st.stop()
+
+stage('render')
+m = METHODS.index(method)
+o = OUTCOMES.index(outcome)
+lags = slice(lag_range[0], lag_range[1] + 1)
+zmin = 0 if method == 'dcor' else -1
+
+st.header(f"{METHOD_NAMES[method]} of Every Policy and Index with the Lagged {OUTCOME_NAMES[outcome]}")
+
+# Column x lag plane of each country
+for iso_code, cube in cubes.items():
+    lag_values = cube['manifest']['lags'][lags]
+    fig = go.Figure(go.Heatmap(z=cube['correlation'][m, o, :, lags], x=lag_values, y=COLUMNS, zmin=zmin, zmax=1,
+                               colorscale='Viridis' if method == 'dcor' else 'RdBu', reversescale=method != 'dcor',
+                               customdata=cube['pairs'][m, o, :, lags],
+                               hovertemplate="%{y}<br>Lag %{x}: %{z:.3f} (%{customdata} days)<extra></extra>",
+                               colorbar=dict(title=METHOD_NAMES[method])))
+    fig.update_layout(title=f"{label(iso_code)}: {METHOD_NAMES[method]} by Lag", xaxis_title="Lag (days)",
+                      height=max(500, 22 * len(COLUMNS)), yaxis=dict(autorange="reversed"))
+    plotly_chart(fig)
+
+# Lag profiles of chosen columns, one line per country and column
+chosen = st.multiselect("Columns to compare", COLUMNS,
+                        default=['E1_Income support', 'E2_Debt/contract relief', 'E3_Fiscal measures',
+                                 'E4_International support'], key="cube_columns")
+if chosen:
+    fig = go.Figure()
+    for iso_code, cube in cubes.items():
+        lag_values = cube['manifest']['lags'][lags]
+        for column in chosen:
+            fig.add_trace(go.Scatter(x=lag_values, y=cube['correlation'][m, o, COLUMNS.index(column), lags],
+                                     mode='lines', name=f"{label(iso_code)} {column}"))
+    fig.update_layout(title=f"{METHOD_NAMES[method]} of Selected Columns and Lagged {OUTCOME_NAMES[outcome]}",
+                      xaxis_title="Lag (days)", yaxis_title=METHOD_NAMES[method])
+    plotly_chart(fig)
+
+finish_page()
@@ -0,0 +1,22 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# The code under test reads a synthetic data directory and keeps its on-disk
+# caches next to it, never data/
+_ROOT = tempfile.mkdtemp(prefix="covid-dashboard-tests-")
+os.environ["APP_DATA_DIR"] = os.path.join(_ROOT, "data")
+for variable in ("RESULT_CACHE_DIR", "STORE_DIR", "CUBE_DIR"):
+    os.environ[variable] = os.path.join(_ROOT, variable.lower())
+
+
+@pytest.fixture(scope="session", autouse=True)
+def synthetic_data():
+    from utils.synthetic import generate
+    return generate(os.environ["APP_DATA_DIR"], countries=2, regions=3, days=400)
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_ROOT, ignore_errors=True)
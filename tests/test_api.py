@@ -0,0 +1,134 @@
+import asyncio
+import gzip
+import json
+import os
+from urllib.parse import urlencode
+
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from api.app import ARROW_TYPE, app
+from utils import cube
+
+
+def get(path, params=None, headers=None):
+    """GET `path` from the app in-process, as (status, headers, body)."""
+    query = urlencode(params or {}).encode()
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': query,
+        'headers': [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+        'client': ('127.0.0.1', 1), 'server': ('testserver', 80),
+    }
+    response = {'body': b''}
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = {name.decode(): value.decode() for name, value in message['headers']}
+        else:
+            response['body'] += message.get('body', b'')
+
+    asyncio.run(app(scope, receive, send))
+    return response['status'], response['headers'], response['body']
+
+
+def get_json(path, params=None):
+    status, _, body = get(path, params)
+    assert status == 200, body
+    return json.loads(body)
+
+
+def test_countries(synthetic_data):
+    result = get_json('/countries')
+    assert result['columns'] == ['Country', 'Label', 'Jurisdiction', 'Name']
+    assert len(result['data']) == sum(1 + len(country['regions']) for country in synthetic_data.values())
+
+
+def test_series_date_range():
+    result = get_json('/series/SAA', {'jurisdictions': 'NAT_TOTAL,R001', 'metrics': 'DailyCaseRate',
+                                      'start': '2020-02-01', 'end': '2020-02-03'})
+    assert result['columns'] == ['Jurisdiction', 'Date', 'DailyCaseRate']
+    assert [row[:2] for row in result['data']] == [
+        [code, f'2020-02-0{day}T00:00:00'] for code in ('NAT_TOTAL', 'R001') for day in (1, 2, 3)]
+
+
+def test_timezone_aware_dates_are_read_in_utc():
+    result = get_json('/series/SAA', {'start': '2020-02-02T03:00:00+05:00', 'end': '2020-02-03'})
+    assert [row[1] for row in result['data']] == ['2020-02-02T00:00:00', '2020-02-03T00:00:00']
+
+
+def test_map_values_of_one_date():
+    result = get_json('/map/SAA/CasesPer100K', {'date': '2020-03-01'})
+    assert result['columns'] == ['Region', 'Date', 'CasesPer100K']
+    assert [row[0] for row in result['data']] == ['Region 1', 'Region 2', 'Region 3']
+
+
+def test_etag_and_not_modified():
+    status, headers, body = get('/series/SAA', {'jurisdictions': 'all'})
+    assert status == 200 and body
+    etag = headers['etag']
+    status, headers, body = get('/series/SAA', {'jurisdictions': 'all'}, {'If-None-Match': etag})
+    assert status == 304 and body == b'' and headers['etag'] == etag
+    assert get('/series/SAA', {'jurisdictions': 'R001'})[1]['etag'] != etag
+    assert get('/series/SAA', {'jurisdictions': 'all'}, {'Accept-Encoding': 'gzip'})[1]['etag'] != etag
+
+
+def test_gzip():
+    status, headers, body = get('/series/SAA', {'jurisdictions': 'all'}, {'Accept-Encoding': 'gzip'})
+    assert status == 200 and headers['content-encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(body)) == get_json('/series/SAA', {'jurisdictions': 'all'})
+    assert 'content-encoding' not in get('/series/SAA', {'jurisdictions': 'all'})[1]
+
+
+@pytest.mark.parametrize("params, headers", [({'format': 'arrow'}, {}), ({}, {'Accept': ARROW_TYPE})])
+def test_arrow(params, headers):
+    status, response_headers, body = get('/series/SAA', {'metrics': 'DailyCaseRate', **params}, headers)
+    assert status == 200 and response_headers['content-type'] == ARROW_TYPE
+    table = pa.ipc.open_stream(body).read_all()
+    assert table.column_names == ['Jurisdiction', 'Date', 'DailyCaseRate']
+    assert table.num_rows == len(get_json('/series/SAA', {'metrics': 'DailyCaseRate'})['data'])
+
+
+@pytest.mark.parametrize("path, params, status", [
+    ('/series/XXX', {}, 404),
+    ('/map/SAA/Unknown', {}, 404),
+    ('/correlations/SAA', {}, 404),
+    ('/series/SAA', {'metrics': 'Unknown'}, 400),
+    ('/series/SAA', {'metric': 'DailyCaseRate'}, 400),
+    ('/countries', {'page': '2'}, 400),
+    ('/series/SAA', {'start': 'not a date'}, 400),
+    ('/series/SAA', {'start': ''}, 400),
+    ('/map/SAA/CasesPer100K', {'date': ''}, 400),
+    ('/series/SAA', {'format': 'xml'}, 400),
+])
+def test_errors(path, params, status):
+    response_status, headers, body = get(path, params)
+    assert response_status == status
+    assert headers['content-type'] == 'application/json'
+    assert 'error' in json.loads(body)
+
+
+def test_correlations():
+    # A cube of three lags, built by hand: computing a real one takes minutes
+    correlation_path, pairs_path, manifest_path = cube.cube_paths('SAB')
+    os.makedirs(cube.CUBE_DIR, exist_ok=True)
+    shape = (len(cube.METHODS), len(cube.OUTCOMES), len(cube.COLUMNS), 3)
+    np.save(correlation_path, np.arange(np.prod(shape), dtype=np.float32).reshape(shape))
+    np.save(pairs_path, np.full(shape, 100, dtype=np.int16))
+    with open(manifest_path, 'w') as f:
+        json.dump({'version': cube.CUBE_VERSION, 'methods': cube.METHODS, 'outcomes': cube.OUTCOMES,
+                   'columns': cube.COLUMNS, 'lags': [0, 1, 2], 'source': cube._source('SAB')}, f)
+
+    result = get_json('/correlations/SAB', {'method': 'pearson', 'outcomes': 'DailyDeathRate',
+                                            'columns': cube.COLUMNS[1], 'lag_start': 1})
+    assert result['columns'] == ['Method', 'Outcome', 'Column', 'Lag', 'Correlation', 'N']
+    first = np.ravel_multi_index((1, 1, 1, 1), shape)
+    assert result['data'] == [['pearson', 'DailyDeathRate', cube.COLUMNS[1], lag, first + lag - 1, 100]
+                              for lag in (1, 2)]
+    assert get('/correlations/SAB', {'lag_start': 'x'})[0] == 400
+    assert get('/correlations/SAB', {'method': 'kendall'})[0] == 400
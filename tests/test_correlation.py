@@ -0,0 +1,107 @@
+import inspect
+import warnings
+
+import dcor
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from utils.correlation import (distance_correlation, lagged_correlation_rows, lagged_distance_correlation,
+                               lagged_spearman)
+from utils.parallel import PARALLEL_MIN_WORK
+
+LAGS = [0, 1, 7, 30, 199, 250]
+
+
+def _series(kind, n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.cumsum(rng.normal(size=n))
+    y = np.r_[np.zeros(5), x[:-5]] + rng.normal(scale=3, size=n)
+    if kind == 'ties':
+        x, y = np.round(x / 4), np.round(y / 4)
+    elif kind == 'missing':
+        x[rng.random(n) < 0.2] = np.nan
+        y[rng.random(n) < 0.2] = np.nan
+    elif kind == 'constant':
+        x = np.full(n, 3.0)
+    return x, y
+
+
+def _shifted_pairs(x, y, lag):
+    # (x[t], y[t + lag]) without the pairs missing a value
+    m = max(len(x) - lag, 0)
+    a, b = x[:m], y[lag:lag + m]
+    complete = ~np.isnan(a) & ~np.isnan(b)
+    return a[complete], b[complete]
+
+
+@pytest.mark.parametrize("kind", ['plain', 'ties', 'missing', 'constant'])
+def test_spearman_matches_scipy(kind):
+    x, y = _series(kind)
+    result = inspect.unwrap(lagged_spearman)(x, y, LAGS)
+    for lag, row in zip(LAGS, result.itertuples()):
+        a, b = _shifted_pairs(x, y, lag)
+        assert row.N == len(a)
+        if len(a) < 2:
+            assert np.isnan(row.Correlation)
+            continue
+        with warnings.catch_warnings():
+            # scipy warns that a constant input has no correlation
+            warnings.simplefilter('ignore')
+            expected = stats.spearmanr(a, b)
+        np.testing.assert_allclose([row.Correlation, row.PValue], [expected[0], expected[1]],
+                                   rtol=1e-10, atol=1e-12, equal_nan=True)
+        if len(a) > 3 and not np.isnan(row.Correlation):
+            assert row.CILow <= row.Correlation <= row.CIHigh
+
+
+@pytest.mark.parametrize("kind", ['plain', 'ties', 'missing', 'constant'])
+def test_distance_correlation_matches_dcor(kind):
+    x, y = _series(kind)
+    result = inspect.unwrap(lagged_distance_correlation)(x, y, LAGS, workers=1)
+    for lag, row in zip(LAGS, result.itertuples()):
+        a, b = _shifted_pairs(x, y, lag)
+        assert row.N == len(a)
+        if len(a) < 2:
+            assert np.isnan(row.Correlation)
+            continue
+        np.testing.assert_allclose(row.Correlation, dcor.distance_correlation(a, b), atol=1e-10)
+
+
+def test_distance_correlation_rows():
+    rng = np.random.default_rng(2)
+    x = np.round(rng.normal(size=(6, 50)), 1)
+    y = x ** 2 + rng.normal(scale=0.5, size=x.shape)
+    expected = [dcor.distance_correlation(a, b) for a, b in zip(x, y)]
+    np.testing.assert_allclose(distance_correlation(x, y), expected, atol=1e-10)
+
+
+def test_distance_correlation_in_worker_processes():
+    # Enough lags x days to pass PARALLEL_MIN_WORK, so batches run on a pool
+    x, y = _series('missing', n=2000)
+    lags = np.arange(0, 200, 2)
+    assert len(lags) * len(x) >= PARALLEL_MIN_WORK
+    compute = inspect.unwrap(lagged_distance_correlation)
+    parallel = compute(x, y, lags, workers=2)
+    pd.testing.assert_frame_equal(parallel, compute(x, y, lags, workers=1))
+    a, b = _shifted_pairs(x, y, 100)
+    np.testing.assert_allclose(parallel.loc[50, 'Correlation'], dcor.distance_correlation(a, b), atol=1e-10)
+
+
+@pytest.mark.parametrize("method", ['pearson', 'spearman'])
+def test_correlation_rows(method):
+    series = [_series(kind, seed=i) for i, kind in enumerate(['plain', 'ties', 'missing', 'constant'])]
+    x = np.stack([x for x, _ in series])
+    y = np.stack([y for _, y in series])
+    rho, pairs = lagged_correlation_rows(x, y, LAGS, method, workers=1)
+    for i, lag in enumerate(LAGS):
+        for r in range(len(x)):
+            a, b = _shifted_pairs(x[r], y[r], lag)
+            assert pairs[i, r] == len(a)
+            if len(a) < 2 or a.std() == 0:
+                assert np.isnan(rho[i, r])
+            elif method == 'pearson':
+                np.testing.assert_allclose(rho[i, r], np.corrcoef(a, b)[0, 1], atol=1e-12)
+            else:
+                np.testing.assert_allclose(rho[i, r], stats.spearmanr(a, b)[0], atol=1e-12)
@@ -0,0 +1,70 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from utils import ingest
+from utils.synthetic import VACCINATION_START_DAY, generate
+
+DAYS = VACCINATION_START_DAY + 90
+
+
+@pytest.fixture(scope="module")
+def drop(tmp_path_factory):
+    # A full drop of the synthetic files, read as text so they are written back verbatim
+    out_dir = tmp_path_factory.mktemp("drop")
+    registry = generate(out_dir, countries=3, regions=2, days=DAYS)
+    files = {'oxcgrt': next(iter(registry.values()))['oxcgrt_file'], 'vaccinations': "vaccinations.csv"}
+    return {kind: (name, pd.read_csv(os.path.join(out_dir, name), dtype=str, keep_default_na=False))
+            for kind, name in files.items()}
+
+
+def _write(directory, name, df):
+    path = os.path.join(directory, name)
+    df.to_csv(path, index=False)
+    return path
+
+
+def _earlier_drop(df):
+    # The drop before: each jurisdiction (country for the vaccinations) ends
+    # on a different day, as sources report on different days
+    date = 'Date' if 'Date' in df else 'date'
+    group = df['Jurisdiction'] + df['RegionCode'] if 'Jurisdiction' in df else df['iso_code']
+    codes = {code: i for i, code in enumerate(group.unique())}
+    end = df.groupby(group, sort=False)[date].transform('max')
+    dates = pd.to_datetime(df[date])
+    cut = pd.to_datetime(end) - pd.to_timedelta(group.map(codes) * 7 + 10, unit='D')
+    return df[dates <= cut]
+
+
+@pytest.mark.parametrize("kind", ["oxcgrt", "vaccinations"])
+def test_append_equals_rebuild(drop, tmp_path, kind):
+    name, df = drop[kind]
+    path = _write(tmp_path, name, _earlier_drop(df))
+    ingest.build_cache(path)
+    path = _write(tmp_path, name, df)
+    parquet_path, appended = ingest.append_cache(path)
+    assert appended == len(df) - len(_earlier_drop(df))
+
+    rebuilt = os.path.join(tmp_path, "rebuilt")
+    os.makedirs(rebuilt)
+    shutil.copy(path, rebuilt)
+    expected = pd.read_parquet(ingest.build_cache(os.path.join(rebuilt, name)))
+    pd.testing.assert_frame_equal(pd.read_parquet(parquet_path), expected)
+
+
+@pytest.mark.parametrize("change", ["removed", "redated"])
+def test_changed_earlier_rows_rebuild(drop, tmp_path, change):
+    name, df = drop['oxcgrt']
+    path = _write(tmp_path, name, _earlier_drop(df))
+    ingest.build_cache(path)
+    if change == "removed":
+        df = df.drop(index=df.index[5])
+    else:
+        df = df.copy()
+        df.loc[df.index[5], 'Date'] = df.loc[df.index[4], 'Date']
+    path = _write(tmp_path, name, df)
+    parquet_path, appended = ingest.append_cache(path)
+    assert appended is None
+    assert len(pd.read_parquet(parquet_path)) == len(df)
@@ -0,0 +1,36 @@
+import glob
+import os
+
+import pytest
+
+from utils.data import POLICY_COLUMNS
+from utils.schema import OXCGRT_COLUMNS, OXCGRT_DTYPES, POLICY_LEVELS, notes_column
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# The repository's data directory (the tests run the app on synthetic data)
+REPO_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+def _header(path):
+    with open(path) as f:
+        return f.readline().rstrip("\n").split(",")
+
+
+def test_columns_match_published_header():
+    assert OXCGRT_COLUMNS == _header(os.path.join(FIXTURES, "OxCGRT_fullwithnotes_header.csv"))
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(REPO_DATA_DIR, "OxCGRT_fullwithnotes_*_v1.csv"))))
+def test_columns_match_data_files(path):
+    assert OXCGRT_COLUMNS == _header(path)
+
+
+def test_every_policy_is_followed_by_its_notes():
+    assert list(POLICY_LEVELS) == POLICY_COLUMNS
+    for policy in POLICY_LEVELS:
+        assert OXCGRT_COLUMNS[OXCGRT_COLUMNS.index(policy) + 1] == notes_column(policy)
+
+
+def test_dtypes_cover_only_published_columns():
+    assert set(OXCGRT_DTYPES) <= set(OXCGRT_COLUMNS)
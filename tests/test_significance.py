@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+
+from utils.significance import lagged_significance
+
+LAGS = [0, 5, 10]
+
+
+def _series(n=300, seed=1):
+    rng = np.random.default_rng(seed)
+    x = np.cumsum(rng.normal(size=n))
+    y = np.r_[np.zeros(3), x[:-3]] + rng.normal(scale=5, size=n)
+    return x, y
+
+
+@pytest.mark.parametrize("method", ["spearman", "dcor"])
+def test_constant_series_has_no_significance(method):
+    _, y = _series()
+    result = lagged_significance(np.zeros_like(y), y, LAGS, method, n_resamples=20, workers=1)
+    assert result[['PValue', 'NullLow', 'NullHigh', 'CILow', 'CIHigh']].isna().all().all()
+
+
+@pytest.mark.parametrize("method", ["spearman", "dcor"])
+def test_interval_contains_estimate(method):
+    x, y = _series()
+    result = lagged_significance(x, y, LAGS, method, n_resamples=50, workers=1)
+    assert ((result['CILow'] <= result['Correlation']) & (result['Correlation'] <= result['CIHigh'])).all()
+    assert result['PValue'].between(0, 1).all()
@@ -0,0 +1,22 @@
+import inspect
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.data import INDEX_COLUMNS, national_outcomes
+from utils.store import OUTCOME_METRICS, national_frame
+
+DROPNA = ('ConfirmedCases', 'ConfirmedDeaths', *INDEX_COLUMNS)
+
+
+@pytest.mark.parametrize("iso_code", ['SAA', 'SAB'])
+def test_national_frame_matches_source_rows(iso_code):
+    # The store against the rows the pages loaded from the source before it:
+    # the days with counts and indexes, with daily rates over those days
+    expected = national_outcomes([iso_code], list(DROPNA), dropna=list(DROPNA)).reset_index(drop=True)
+    assert expected['Date'].diff().dt.days.max() > 1, "no gap in the indexes to test"
+    df = inspect.unwrap(national_frame)(iso_code, tuple(OUTCOME_METRICS + INDEX_COLUMNS), DROPNA)
+    pd.testing.assert_series_equal(df['Date'], expected['Date'].astype(df['Date'].dtype))
+    for column in OUTCOME_METRICS + INDEX_COLUMNS:
+        np.testing.assert_allclose(df[column], expected[column].to_numpy(dtype=float), rtol=1e-6, err_msg=column)
@@ -0,0 +1,26 @@
+import os
+
+import pandas as pd
+
+from utils.schema import OXCGRT_COLUMNS, VACCINATION_COLUMNS
+from utils.synthetic import VACCINATION_START_DAY, generate
+
+
+def test_generates_published_layout(tmp_path):
+    registry = generate(tmp_path, countries=1, regions=2, days=VACCINATION_START_DAY + 30)
+    country = next(iter(registry.values()))
+    df = pd.read_csv(os.path.join(tmp_path, country['oxcgrt_file']))
+    assert list(df.columns) == OXCGRT_COLUMNS
+    assert len(df) == 3 * (VACCINATION_START_DAY + 30)
+    vaccinations = pd.read_csv(os.path.join(tmp_path, "vaccinations.csv"))
+    assert list(vaccinations.columns) == VACCINATION_COLUMNS
+    assert len(vaccinations) == 30
+
+
+def test_short_range_has_no_vaccinations(tmp_path):
+    registry = generate(tmp_path, countries=1, regions=1, days=10)
+    country = next(iter(registry.values()))
+    assert len(pd.read_csv(os.path.join(tmp_path, country['oxcgrt_file']))) == 20
+    vaccinations = pd.read_csv(os.path.join(tmp_path, "vaccinations.csv"))
+    assert list(vaccinations.columns) == VACCINATION_COLUMNS
+    assert vaccinations.empty
@@ -0,0 +1,233 @@
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from utils.data import DATA_DIR
+
+# Shared by every process (and replica) that can see the directory
+CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", os.path.join(DATA_DIR, ".cache", "results"))
+
+# Least recently used entries are evicted once the cache grows past this
+MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+
+def _update(h, value):
+    # Feed a stable, type-tagged encoding of value into the hash
+    if isinstance(value, (pd.Series, pd.DataFrame)):
+        h.update(b'pandas')
+        h.update(repr((type(value).__name__, value.shape)).encode())
+        names = [value.name] if isinstance(value, pd.Series) else list(value.columns)
+        h.update(repr((names, [str(t) for t in np.atleast_1d(value.dtypes)])).encode())
+        h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        h.update(b'ndarray')
+        h.update(repr((value.dtype.str, value.shape)).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (list, tuple)):
+        h.update(f'{type(value).__name__}{len(value)}'.encode())
+        for item in value:
+            _update(h, item)
+    elif isinstance(value, dict):
+        h.update(f'dict{len(value)}'.encode())
+        for key in sorted(value, key=repr):
+            _update(h, key)
+            _update(h, value[key])
+    elif isinstance(value, range):
+        h.update(repr(('range', value.start, value.stop, value.step)).encode())
+    else:
+        h.update(repr((type(value).__name__, value)).encode())
+
+
+def fingerprint(*parts):
+    """Hex digest identifying the content of parts (frames, arrays, scalars and containers)."""
+    h = hashlib.sha256()
+    for part in parts:
+        _update(h, part)
+    return h.hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(CACHE_DIR, key[:2], key + ".pkl")
+
+
+def get(key):
+    # Returns (True, value) on a hit. Reading refreshes the entry's mtime,
+    # which is the LRU clock (atime is unreliable on noatime mounts).
+    path = _entry_path(key)
+    try:
+        with open(path, 'rb') as f:
+            value = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return False, None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return True, value
+
+
+def _write(key, value):
+    path = _entry_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def put(key, value):
+    _write(key, value)
+    evict()
+
+
+# Several entries at once, evicting once
+def put_many(items):
+    for key, value in items:
+        _write(key, value)
+    evict()
+
+
+def _entries():
+    for root, _, files in os.walk(CACHE_DIR):
+        for name in files:
+            if name.endswith(".pkl"):
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime_ns, stat.st_size, path
+
+
+def evict(max_bytes=None):
+    # Drop least recently used entries until the cache fits in max_bytes.
+    # Entries removed concurrently by another process are simply skipped.
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    entries = sorted(_entries())
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def clear():
+    evict(max_bytes=0)
+
+
+def memoize(version=1, ignore=()):
+    """Cache a function's results on disk, keyed by a fingerprint of its arguments.
+
+    Arguments are bound to the signature first, so positional, keyword and
+    default values key alike. Bump `version` when the function's output
+    changes for the same inputs; arguments named in `ignore` (e.g. worker
+    counts) are left out of the key.
+    """
+    def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = {k: v for k, v in bound.arguments.items() if k not in ignore}
+            key = fingerprint(name, version, arguments)
+            hit, value = get(key)
+            if hit:
+                return value
+            value = func(*args, **kwargs)
+            put(key, value)
+            return value
+        return wrapper
+    return decorator
+
+
+def _as_float_array(values):
+    if np.ndim(values) > 1:
+        return np.asarray(values, dtype=float)
+    return pd.Series(values).to_numpy(dtype=float, na_value=np.nan)
+
+
+def _lag_row(value, i):
+    # Row i of a result with one row per lag: a frame, or a tuple of arrays
+    # with the lags along the first axis
+    if isinstance(value, pd.DataFrame):
+        return value.iloc[[i]]
+    return tuple(part[i] for part in value)
+
+
+def _stack_lag_rows(rows):
+    if isinstance(rows[0], pd.DataFrame):
+        return pd.concat(rows, ignore_index=True)
+    return tuple(np.stack(parts) for parts in zip(*rows))
+
+
+def memoize_lags(version=1, ignore=()):
+    """memoize() for lagged correlations f(x, y, lags, ...) returning one row per lag.
+
+    The result is a frame with one row per lag, or a tuple of arrays whose
+    first axis is the lag; x and y are series, or (rows, days) arrays of one
+    series per row. Besides the whole call, every lag's row is cached on its
+    own, keyed by the complete pairs (x[t], y[t + lag]) it is computed from.
+    When days are appended to the series (see utils/ingest.append_cache),
+    only the lags whose windows gained complete pairs are recomputed, in one
+    call of the function; lags whose new pairs are all missing keep their
+    results.
+    """
+    def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = {k: v for k, v in bound.arguments.items() if k not in ignore}
+            key = fingerprint(name, version, arguments)
+            hit, value = get(key)
+            if hit:
+                return value
+
+            x, y = _as_float_array(arguments['x']), _as_float_array(arguments['y'])
+            lags = np.asarray(arguments['lags'], dtype=int)
+            options = {k: v for k, v in arguments.items() if k not in ('x', 'y', 'lags')}
+            days = x.shape[-1]
+            lag_keys = []
+            for lag in lags:
+                m = max(days - lag, 0)
+                x_window, y_window = x[..., :m], y[..., lag:lag + m]
+                complete = ~np.isnan(x_window) & ~np.isnan(y_window)
+                parts = [x_window[complete], y_window[complete]]
+                if x.ndim > 1:
+                    # Which row each pair belongs to
+                    parts.append(complete.sum(axis=-1))
+                lag_keys.append(fingerprint(name, version, 'lag', int(lag), options, *parts))
+            rows = {}
+            for lag_key in lag_keys:
+                hit, row = get(lag_key)
+                if hit:
+                    rows[lag_key] = row
+            missing = [i for i, lag_key in enumerate(lag_keys) if lag_key not in rows]
+            if missing:
+                bound.arguments['lags'] = lags[missing]
+                computed = func(*bound.args, **bound.kwargs)
+                if isinstance(computed, pd.DataFrame):
+                    computed = computed.reset_index(drop=True)
+                fresh = {lag_keys[i]: _lag_row(computed, j) for j, i in enumerate(missing)}
+                put_many(fresh.items())
+                rows.update(fresh)
+            value = _stack_lag_rows([rows[lag_key] for lag_key in lag_keys])
+            put(key, value)
+            return value
+        return wrapper
+    return decorator
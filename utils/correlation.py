@@ -0,0 +1,413 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from utils import cache
+from utils.parallel import map_batches
+
+
+def as_float_array(values):
+    # Plain float64 array with NaN for missing values (also for nullable dtypes)
+    return pd.Series(values).to_numpy(dtype=float, na_value=np.nan)
+
+
+def _average_ranks(sorted_values):
+    # 1-based ranks of already sorted values, ties share their average rank
+    n = len(sorted_values)
+    new_value = np.r_[True, sorted_values[1:] != sorted_values[:-1]]
+    dense = np.cumsum(new_value)
+    bounds = np.r_[np.flatnonzero(new_value), n]
+    return 0.5 * (bounds[dense] + bounds[dense - 1] + 1)
+
+
+def _pearson(a, b):
+    a = a - a.mean()
+    b = b - b.mean()
+    denominator = np.sqrt((a * a).sum() * (b * b).sum())
+    return (a * b).sum() / denominator if denominator > 0 else np.nan
+
+
+def _lagged_ranks(x, y, x_order, y_order, lag):
+    # Ranks of the complete pairs (x[i], y[i + lag]). The global sort orders
+    # are filtered rather than re-sorted, so each lag costs O(n).
+    n = len(x)
+    m = n - lag
+    complete = ~np.isnan(x[:m]) & ~np.isnan(y[lag:])
+
+    x_keep = np.zeros(n, dtype=bool)
+    x_keep[:m] = complete
+    x_sorted = x_order[x_keep[x_order]]
+    x_ranks = np.empty(n)
+    x_ranks[x_sorted] = _average_ranks(x[x_sorted])
+
+    y_keep = np.zeros(n, dtype=bool)
+    y_keep[lag:] = complete
+    y_sorted = y_order[y_keep[y_order]]
+    y_ranks = np.empty(n)
+    y_ranks[y_sorted] = _average_ranks(y[y_sorted])
+
+    return x_ranks[:m][complete], y_ranks[lag:][complete]
+
+
+def _spearman_inference(rho, n, confidence):
+    # Two-sided p-value from the t distribution (as scipy.stats.spearmanr) and
+    # a Fisher z interval with the Fieller-Hartley-Pearson variance 1.06/(n-3)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = rho * np.sqrt((n - 2) / ((1 + rho) * (1 - rho)))
+        p_value = np.where(n > 2, 2 * stats.t.sf(np.abs(t), np.maximum(n - 2, 1)), np.nan)
+        z = np.arctanh(np.clip(rho, -1 + 1e-15, 1 - 1e-15))
+        half_width = stats.norm.ppf(0.5 + confidence / 2) * np.sqrt(1.06 / (n - 3))
+        low = np.where(n > 3, np.tanh(z - half_width), np.nan)
+        high = np.where(n > 3, np.tanh(z + half_width), np.nan)
+    return p_value, low, high
+
+
+@cache.memoize_lags()
+def lagged_spearman(x, y, lags, confidence=0.95):
+    """Spearman correlation of x[t] with y[t + lag] for every lag.
+
+    Both series are sorted once; each lag then ranks its complete pairs by
+    filtering the sort orders, giving the same coefficients as
+    scipy.stats.spearmanr on the shifted, NaN-dropped pairs. Returns a frame
+    with Lag, Correlation, PValue, CILow, CIHigh and N (pairs used).
+    """
+    x = as_float_array(x)
+    y = as_float_array(y)
+    lags = np.asarray(lags, dtype=int)
+    x_order = np.argsort(x, kind='stable')
+    y_order = np.argsort(y, kind='stable')
+
+    rho = np.full(len(lags), np.nan)
+    pairs = np.zeros(len(lags), dtype=int)
+    for i, lag in enumerate(lags):
+        if lag >= len(x):
+            continue
+        x_ranks, y_ranks = _lagged_ranks(x, y, x_order, y_order, lag)
+        pairs[i] = len(x_ranks)
+        if pairs[i] > 1:
+            rho[i] = _pearson(x_ranks, y_ranks)
+
+    p_value, low, high = _spearman_inference(rho, pairs, confidence)
+    return pd.DataFrame({'Lag': lags, 'Correlation': rho, 'PValue': p_value,
+                         'CILow': low, 'CIHigh': high, 'N': pairs})
+
+
+def _complete_orders(x, y, x_order, y_order, lag):
+    # Positions of the complete pairs (x[i], y[i + lag]) in x order, with the
+    # rank of each pair's y value; ties in y are broken by position, which is
+    # harmless because tied pairs contribute |y_i - y_j| = 0
+    m = len(x) - lag
+    complete = ~np.isnan(x[:m]) & ~np.isnan(y[lag:])
+    x_keep = np.zeros(len(x), dtype=bool)
+    x_keep[:m] = complete
+    x_sorted = x_order[x_keep[x_order]]
+
+    y_keep = np.zeros(len(y), dtype=bool)
+    y_keep[lag:] = complete
+    y_sorted = y_order[y_keep[y_order]] - lag
+    y_rank = np.empty(len(x), dtype=np.int64)
+    y_rank[y_sorted] = np.arange(len(y_sorted))
+    return x_sorted, y_rank[x_sorted]
+
+
+def _dominance_sums(ranks, weights):
+    # For every row r and position i, the sum of weights[r, j] over j < i with
+    # ranks[r, j] < ranks[r, i]; each row of ranks is a permutation of 0..n-1.
+    # Bottom-up merge sort: rows are padded to a power of two so no block
+    # spans two rows, and at each level the two sorted halves of every block
+    # are merged by rank and the left half's weights counted for the right.
+    rows, n = ranks.shape
+    size = 1 << max(n - 1, 0).bit_length()
+    padded_ranks = np.empty((rows, size), dtype=np.int64)
+    padded_ranks[:, :n] = ranks
+    padded_ranks[:, n:] = np.arange(n, size)
+    padded_weights = np.zeros((rows, size, weights.shape[-1]))
+    padded_weights[:, :n] = weights
+
+    total = rows * size
+    merged_ranks = padded_ranks.ravel()
+    merged_weights = padded_weights.reshape(total, -1)
+    origin = np.arange(total)
+    sums = np.zeros_like(merged_weights)
+    width = 1
+    while width < size:
+        span = 2 * width
+        order = np.argsort(merged_ranks.reshape(-1, span), axis=1, kind='stable')
+        order = (order + np.arange(0, total, span)[:, None]).ravel()
+        merged_ranks = merged_ranks[order]
+        merged_weights = merged_weights[order]
+        origin = origin[order]
+        right = (origin // width) % 2 == 1
+        running = np.cumsum((merged_weights * ~right[:, None]).reshape(-1, span, sums.shape[1]), axis=1)
+        sums[origin[right]] += running.reshape(total, -1)[right]
+        width = span
+    return sums.reshape(rows, size, -1)[:, :n]
+
+
+def _row_sums(sorted_values):
+    # sum_j |v_i - v_j| along the last axis, for values in ascending order
+    n = sorted_values.shape[-1]
+    prefix = np.cumsum(sorted_values, axis=-1) - sorted_values
+    total = sorted_values.sum(axis=-1, keepdims=True)
+    return sorted_values * (2 * np.arange(n) - n) + total - 2 * prefix
+
+
+def _distance_correlation(x, y, y_rank):
+    # Univariate distance correlation (V-statistic, as dcor) of each row of
+    # pairs, given in ascending x order with y_rank the rank of y within its
+    # row, in O(n log n) following Huo and Szekely (2016)
+    rows, n = x.shape
+    if n < 2:
+        return np.full(rows, np.nan)
+    x = x - x.mean(axis=1, keepdims=True)
+    y = y - y.mean(axis=1, keepdims=True)
+    # dcor is scale invariant; rescaling keeps the sums below well conditioned.
+    # A constant row has zero distance variance and correlation 0.
+    x = x / np.maximum(np.abs(x).max(axis=1, keepdims=True), np.finfo(float).tiny)
+    y = y / np.maximum(np.abs(y).max(axis=1, keepdims=True), np.finfo(float).tiny)
+
+    a_rows = _row_sums(x)
+    y_by_rank = np.empty_like(y)
+    np.put_along_axis(y_by_rank, y_rank, y, axis=1)
+    b_rows = np.take_along_axis(_row_sums(y_by_rank), y_rank, axis=1)
+
+    # sum_{i,j} |x_i - x_j| |y_i - y_j| from sums over the pairs j < i
+    weights = np.stack([np.ones_like(x), y, x, x * y], axis=-1)
+    prefix = np.cumsum(weights, axis=1) - weights
+    signed = 2 * _dominance_sums(y_rank, weights) - prefix
+    cross = 2 * (x * y * signed[..., 0] - x * signed[..., 1] - y * signed[..., 2] + signed[..., 3]).sum(axis=1)
+
+    def covariance(ab, a_rows, b_rows):
+        return (ab / n**2 - 2 * (a_rows * b_rows).sum(axis=1) / n**3
+                + a_rows.sum(axis=1) * b_rows.sum(axis=1) / n**4)
+
+    x_pairs = 2 * n * (x * x).sum(axis=1) - 2 * x.sum(axis=1) ** 2
+    y_pairs = 2 * n * (y * y).sum(axis=1) - 2 * y.sum(axis=1) ** 2
+    dcov = covariance(cross, a_rows, b_rows)
+    dvar = covariance(x_pairs, a_rows, a_rows) * covariance(y_pairs, b_rows, b_rows)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(dvar > 0, np.sqrt(np.maximum(dcov, 0) / np.sqrt(dvar)), 0.0)
+
+
+def distance_correlation(x, y):
+    """Distance correlation of two equal-length arrays without missing values.
+
+    Two-dimensional input is treated as one sample per row and returns one
+    correlation per row.
+    """
+    rows = np.ndim(x) > 1
+    x = np.atleast_2d(np.asarray(x, dtype=float))
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    order = np.argsort(x, axis=1, kind='stable')
+    x_sorted = np.take_along_axis(x, order, axis=1)
+    y_sorted = np.take_along_axis(y, order, axis=1)
+    y_rank = np.empty(y.shape, dtype=np.int64)
+    np.put_along_axis(y_rank, np.argsort(y_sorted, axis=1, kind='stable'),
+                      np.broadcast_to(np.arange(y.shape[1]), y.shape), axis=1)
+    result = _distance_correlation(x_sorted, y_sorted, y_rank)
+    return result if rows else result[0]
+
+
+def _distance_correlation_batch(lags, x, y, x_order, y_order):
+    rho = np.full(len(lags), np.nan)
+    pairs = np.zeros(len(lags), dtype=int)
+    for i, lag in enumerate(lags):
+        if lag >= len(x):
+            continue
+        positions, y_rank = _complete_orders(x, y, x_order, y_order, lag)
+        pairs[i] = len(positions)
+        rho[i] = _distance_correlation(x[positions][None], y[positions + lag][None], y_rank[None])[0]
+    return rho, pairs
+
+
+@cache.memoize_lags(ignore=('workers',))
+def lagged_distance_correlation(x, y, lags, workers=None):
+    """Distance correlation of x[t] with y[t + lag] for every lag.
+
+    Uses the O(n log n) univariate algorithm on the shifted, NaN-dropped
+    pairs and matches dcor.distance_correlation to floating point tolerance.
+    Both series are sorted once and the orders reused across lags; large
+    lag grids are split into batches run on a process pool of `workers`
+    (default: all cores). Returns a frame with Lag, Correlation and N.
+    """
+    x = as_float_array(x)
+    y = as_float_array(y)
+    lags = np.asarray(lags, dtype=int)
+    x_order = np.argsort(x, kind='stable')
+    y_order = np.argsort(y, kind='stable')
+
+    rho, pairs = map_batches(_distance_correlation_batch, lags, x, y, x_order, y_order,
+                             work=len(lags) * len(x), workers=workers)
+    return pd.DataFrame({'Lag': lags, 'Correlation': rho, 'N': pairs})
+
+
+def _masked_average_ranks(sorted_values, keep):
+    # 1-based average ranks among the kept entries of each row, for rows of
+    # already sorted values (ties share their average rank); entries that are
+    # not kept get arbitrary ranks
+    rows, n = sorted_values.shape
+    new_value = np.ones((rows, n), dtype=bool)
+    new_value[:, 1:] = sorted_values[:, 1:] != sorted_values[:, :-1]
+    group = (np.cumsum(new_value, axis=1) - 1 + np.arange(rows)[:, None] * n).ravel()
+    kept = np.bincount(group, weights=keep.ravel(), minlength=rows * n).reshape(rows, n)
+    before = (np.cumsum(kept, axis=1) - kept).ravel()
+    return (before[group] + (kept.ravel()[group] + 1) / 2).reshape(rows, n)
+
+
+def _spearman_rows_batch(lags, x, y):
+    # Spearman correlation of every row pair (x[r, t], y[r, t + lag]) for
+    # each lag. Rows are sorted once per batch and each lag ranks its
+    # complete pairs by masking the sorted rows, as _lagged_ranks does for
+    # one pair of series.
+    rows, n = x.shape
+    sides = []
+    for values in (x, y):
+        order = np.argsort(values, axis=1, kind='stable')
+        sides.append((order, np.take_along_axis(values, order, axis=1)))
+    rho = np.full((len(lags), rows), np.nan)
+    pairs = np.zeros((len(lags), rows), dtype=int)
+    for i, lag in enumerate(lags):
+        if lag >= n:
+            continue
+        m = n - lag
+        complete = ~np.isnan(x[:, :m]) & ~np.isnan(y[:, lag:])
+        count = complete.sum(axis=1)
+        centred = []
+        for (order, sorted_values), start in zip(sides, (0, lag)):
+            keep = np.zeros((rows, n), dtype=bool)
+            keep[:, start:start + m] = complete
+            ranks = np.empty((rows, n))
+            np.put_along_axis(ranks, order, _masked_average_ranks(sorted_values, np.take_along_axis(keep, order, axis=1)),
+                              axis=1)
+            ranks = np.where(complete, ranks[:, start:start + m], 0.0)
+            # Ranks of k complete pairs average (k + 1) / 2
+            centred.append(np.where(complete, ranks - (count[:, None] + 1) / 2, 0.0))
+        a, b = centred
+        denominator = np.sqrt((a * a).sum(axis=1) * (b * b).sum(axis=1))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rho[i] = np.where((count > 1) & (denominator > 0), (a * b).sum(axis=1) / denominator, np.nan)
+        pairs[i] = count
+    return rho, pairs
+
+
+def _pearson_rows_batch(lags, x, y):
+    # Pearson correlation of every row pair (x[r, t], y[r, t + lag]) over the
+    # complete pairs of each lag
+    rows, n = x.shape
+    rho = np.full((len(lags), rows), np.nan)
+    pairs = np.zeros((len(lags), rows), dtype=int)
+    for i, lag in enumerate(lags):
+        if lag >= n:
+            continue
+        m = n - lag
+        complete = ~np.isnan(x[:, :m]) & ~np.isnan(y[:, lag:])
+        count = complete.sum(axis=1)
+        a = np.where(complete, x[:, :m], 0.0)
+        b = np.where(complete, y[:, lag:], 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            a = np.where(complete, a - a.sum(axis=1, keepdims=True) / count[:, None], 0.0)
+            b = np.where(complete, b - b.sum(axis=1, keepdims=True) / count[:, None], 0.0)
+            denominator = np.sqrt((a * a).sum(axis=1) * (b * b).sum(axis=1))
+            rho[i] = np.where((count > 1) & (denominator > 0), (a * b).sum(axis=1) / denominator, np.nan)
+        pairs[i] = count
+    return rho, pairs
+
+
+def _distance_rows_batch(lags, x, y):
+    # Distance correlation of every row pair for each lag; rows with the same
+    # number of complete pairs are computed together as one 2D batch
+    rows, n = x.shape
+    rho = np.full((len(lags), rows), np.nan)
+    pairs = np.zeros((len(lags), rows), dtype=int)
+    for i, lag in enumerate(lags):
+        if lag >= n:
+            continue
+        m = n - lag
+        complete = ~np.isnan(x[:, :m]) & ~np.isnan(y[:, lag:])
+        count = complete.sum(axis=1)
+        pairs[i] = count
+        for k in np.unique(count[count > 1]):
+            same = np.flatnonzero(count == k)
+            mask = complete[same]
+            a = x[same, :m][mask].reshape(-1, k)
+            b = y[same, lag:][mask].reshape(-1, k)
+            rho[i, same] = distance_correlation(a, b)
+    return rho, pairs
+
+
+# method -> kernel(lags, x, y) returning (correlation, pairs) arrays of shape
+# (lags, rows)
+ROW_METHODS = {
+    'spearman': _spearman_rows_batch,
+    'pearson': _pearson_rows_batch,
+    'dcor': _distance_rows_batch,
+}
+
+
+def _rows_batch(lags, x, y, method):
+    return ROW_METHODS[method](lags, x, y)
+
+
+def lagged_correlation_rows(x, y, lags, method='spearman', workers=None):
+    """Lagged correlation of many pairs of series at once: row r of x[t] with row r of y[t + lag].
+
+    x and y are (rows, days) arrays on a shared date grid with NaN for
+    missing days; each lag uses its complete pairs, as lagged_spearman() and
+    lagged_distance_correlation() do for one pair. `method` is 'spearman',
+    'pearson' or 'dcor'. Lags are run in batches on a process pool of
+    `workers` (default: all cores). Returns (correlation, pairs) arrays of
+    shape (lags, rows).
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    lags = np.asarray(lags, dtype=int)
+    return map_batches(_rows_batch, lags, x, y, method, work=len(lags) * x.size, workers=workers)
+
+
+# lagged_correlation_rows() cached per lag, so that correlation_table() after
+# an append only recomputes the lags whose windows gained complete pairs. The
+# cube build calls the uncached function: it writes its own files.
+_cached_correlation_rows = cache.memoize_lags(ignore=('workers',))(lagged_correlation_rows)
+
+
+def _date_matrix(df, by, column, groups, dates):
+    # groups x dates array of one column, NaN where a group has no row
+    matrix = df.pivot_table(index=by, columns='Date', values=column, aggfunc='last', dropna=False, observed=True)
+    return matrix.reindex(index=groups, columns=dates).to_numpy(dtype=float, na_value=np.nan)
+
+
+# correlation_table() with `correlate` computing the rows (the benchmarks pass
+# the uncached lagged_correlation_rows)
+def _correlation_table(df, by, x_columns, y_columns, lags, method, workers, correlate):
+    x_columns, y_columns = list(x_columns), list(y_columns)
+    dates = pd.Index(df['Date'].unique()).sort_values()
+    groups = pd.Index(df[by].dropna().unique())
+    matrices = {column: _date_matrix(df, by, column, groups, dates)
+                for column in dict.fromkeys(x_columns + y_columns)}
+
+    # Rows ordered by group, then x column, then y column
+    keys = pd.MultiIndex.from_product([groups, x_columns, y_columns], names=[by, 'X', 'Y']).to_frame(index=False)
+    x = np.stack([matrices[column] for column in x_columns], axis=1).repeat(len(y_columns), axis=1)
+    y = np.tile(np.stack([matrices[column] for column in y_columns], axis=1), (1, len(x_columns), 1))
+    lags = np.asarray(lags, dtype=int)
+    rho, pairs = correlate(x.reshape(len(keys), -1), y.reshape(len(keys), -1), lags, method, workers)
+
+    table = keys.iloc[np.tile(np.arange(len(keys)), len(lags))].reset_index(drop=True)
+    table['Lag'] = np.repeat(lags, len(keys))
+    table['Correlation'] = rho.ravel()
+    table['N'] = pairs.ravel()
+    if method == 'spearman':
+        table['PValue'] = _spearman_inference(rho.ravel(), pairs.ravel(), 0.95)[0]
+    return table
+
+
+@cache.memoize(ignore=('workers',))
+def correlation_table(df, by, x_columns, y_columns, lags, method='spearman', workers=None):
+    """Lagged correlation of every x column with every y column within each `by` group, as a tidy table.
+
+    `df` has one row per group and Date. The series of all groups are put
+    on a common date grid and every (group, x column, y column) pair is one
+    row of lagged_correlation_rows(). Returns a frame with the `by` column,
+    X, Y, Lag, Correlation and N, plus PValue for Spearman.
+    """
+    return _correlation_table(df, by, x_columns, y_columns, lags, method, workers, _cached_correlation_rows)
@@ -0,0 +1,71 @@
+import json
+import os
+
+import streamlit as st
+
+# Country registry: one entry per ISO 3166 alpha-3 code with its OxCGRT source
+# file, display label, population, optional vaccination denominator, regional
+# boundaries and a table of regions ({code: {name, population}}). Adding a
+# country is an entry here; pages only load the countries that are selected.
+#
+# APP_DATA_DIR points the app at another data directory holding a registry and
+# its source files (e.g. one written by `python -m utils.synthetic`).
+DATA_DIR = (os.environ.get("APP_DATA_DIR")
+            or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+REGISTRY_PATH = os.path.join(DATA_DIR, "countries.json")
+
+
+@st.cache_resource(show_spinner=False)
+def load_registry():
+    with open(REGISTRY_PATH) as f:
+        return json.load(f)
+
+
+def country_codes():
+    return list(load_registry())
+
+
+def get_country(iso_code):
+    return load_registry()[iso_code]
+
+
+def label(iso_code):
+    return get_country(iso_code)['label']
+
+
+# "US vs Canada", for page titles
+def labels_title(iso_codes):
+    return " vs ".join(label(iso_code) for iso_code in iso_codes)
+
+
+def population(iso_code):
+    return get_country(iso_code)['population']
+
+
+def vaccination_population(iso_code):
+    country = get_country(iso_code)
+    return country.get('vaccination_population', country['population'])
+
+
+def region_population(iso_code):
+    return {code: region['population'] for code, region in get_country(iso_code).get('regions', {}).items()}
+
+
+def region_names(iso_code):
+    return {code: region['name'] for code, region in get_country(iso_code).get('regions', {}).items()}
+
+
+# Sidebar multiselect of registry countries (labels shown, ISO codes returned),
+# defaulting to the entries marked "default". `regional=True` only offers
+# countries with region tables and boundaries. Stops the page when nothing is
+# selected.
+def select_countries(key="countries", regional=False):
+    registry = load_registry()
+    options = [iso for iso, country in registry.items()
+               if not regional or (country.get('regions') and country.get('geojson'))]
+    default = [iso for iso in options if registry[iso].get('default')]
+    selected = st.sidebar.multiselect("Countries", options, default=default, format_func=label, key=key)
+    if not selected:
+        st.info("Select at least one country in the sidebar.")
+        st.stop()
+    return selected
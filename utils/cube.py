@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import streamlit as st
+
+from utils import countries
+from utils.correlation import lagged_correlation_rows
+from utils.data import DATA_DIR, INDEX_COLUMNS, POLICY_COLUMNS, national, oxcgrt_path
+from utils.ingest import source_hash
+from utils.metrics import add_outcome_metrics
+
+# Precomputed correlation cubes, one set of files per country
+CUBE_DIR = os.environ.get("CUBE_DIR", os.path.join(DATA_DIR, ".cache", "cubes"))
+
+# Bumped when the cube layout changes, so older cubes are reported as missing
+CUBE_VERSION = 2
+
+# Axes of a cube: method x outcome x column x lag, so the column x lag plane of
+# one method and outcome is contiguous. The monetary columns are used as
+# reported; all three correlations are unchanged by the per-100K scaling.
+METHODS = ['spearman', 'pearson', 'dcor']
+OUTCOMES = ['DailyCaseRate', 'DailyDeathRate']
+COLUMNS = POLICY_COLUMNS + INDEX_COLUMNS
+LAGS = list(range(0, 481))
+
+
+def cube_paths(iso_code):
+    base = os.path.join(CUBE_DIR, iso_code)
+    return base + ".correlation.npy", base + ".pairs.npy", base + ".json"
+
+
+def _source(iso_code):
+    # Content hash of the country's source file, as the columnar cache
+    # records it (see utils/ingest.py)
+    return {'sha256': source_hash(oxcgrt_path(iso_code))}
+
+
+def _save(path, array):
+    tmp = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(tmp, array)
+    os.replace(tmp, path)
+
+
+def build_cube(iso_code, workers=None):
+    """Compute and write the correlation cube of one country's national rows.
+
+    Every column in COLUMNS is correlated with every outcome at every lag
+    in LAGS (x[t] against y[t + lag], as on page 5) with each method, in
+    one lagged_correlation_rows() batch per method. Writes the float32
+    correlations, the int16 number of pairs (method x outcome x column x
+    lag) and a manifest recording the axes and the source file.
+    """
+    columns = ['ConfirmedCases', 'ConfirmedDeaths'] + COLUMNS
+    df = add_outcome_metrics(national(iso_code, columns), countries.population(iso_code))
+    # One row per (outcome, column), in cube order
+    x = np.stack([df[column].to_numpy(dtype=float, na_value=np.nan) for _ in OUTCOMES for column in COLUMNS])
+    y = np.stack([df[outcome].to_numpy(dtype=float, na_value=np.nan) for outcome in OUTCOMES for _ in COLUMNS])
+
+    shape = (len(METHODS), len(OUTCOMES), len(COLUMNS), len(LAGS))
+    correlation = np.empty(shape, dtype=np.float32)
+    pairs = np.empty(shape, dtype=np.int16)
+    for i, method in enumerate(METHODS):
+        rho, count = lagged_correlation_rows(x, y, LAGS, method, workers)
+        correlation[i] = rho.T.reshape(shape[1:])
+        pairs[i] = count.T.reshape(shape[1:])
+
+    correlation_path, pairs_path, manifest_path = cube_paths(iso_code)
+    os.makedirs(CUBE_DIR, exist_ok=True)
+    _save(correlation_path, correlation)
+    _save(pairs_path, pairs)
+    tmp = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump({'version': CUBE_VERSION, 'methods': METHODS, 'outcomes': OUTCOMES, 'columns': COLUMNS,
+                   'lags': LAGS, 'source': _source(iso_code)}, f)
+    os.replace(tmp, manifest_path)
+    return correlation_path
+
+
+# The cube of a country as read-only memory maps shared by every session of
+# the process (the OS shares the pages between processes), with its manifest,
+# or None when it has not been built for the current layout. Slicing it reads
+# only the pages of the slice; nothing is computed. A cube rebuilt by
+# python -m utils.cube is picked up by running servers: its manifest, written
+# last, has a new modification time.
+def load_cube(iso_code):
+    try:
+        built = os.stat(cube_paths(iso_code)[2]).st_mtime_ns
+    except OSError:
+        return None
+    return _load_cube(iso_code, built)
+
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _load_cube(iso_code, built):
+    correlation_path, pairs_path, manifest_path = cube_paths(iso_code)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != CUBE_VERSION:
+            return None
+        return {'manifest': manifest, 'correlation': np.load(correlation_path, mmap_mode='r'),
+                'pairs': np.load(pairs_path, mmap_mode='r')}
+    except (OSError, ValueError):
+        return None
+
+
+# Whether the country's source file changed since its cube was built
+def cube_is_stale(iso_code, cube):
+    return cube['manifest']['source'] != _source(iso_code)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the policy x outcome x lag correlation cubes")
+    parser.add_argument("countries", nargs="*", help="ISO codes of the countries (default: every registry entry)")
+    parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    args = parser.parse_args()
+    for iso_code in args.countries or countries.country_codes():
+        path = build_cube(iso_code, args.workers)
+        print(f"{iso_code} -> {path} ({os.path.getsize(path) // 1024} KiB)")
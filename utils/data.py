@@ -0,0 +1,166 @@
+import os
+
+import pandas as pd
+import streamlit as st
+
+from utils import countries
+from utils.ingest import read_columns
+from utils.metrics import add_outcome_metrics, add_per_100k, add_vaccination_metrics
+
+DATA_DIR = countries.DATA_DIR
+
+INDEX_COLUMNS = [
+    'GovernmentResponseIndex_WeightedAverage',
+    'StringencyIndex_WeightedAverage',
+    'ContainmentHealthIndex_WeightedAverage',
+    'EconomicSupportIndex',
+]
+
+POLICY_COLUMNS = [
+    'C1E_School closing',
+    'C2E_Workplace closing',
+    'C3E_Cancel public events',
+    'C4E_Restrictions on gatherings',
+    'C5E_Close public transport',
+    'C6E_Stay at home requirements',
+    'C7E_Restrictions on internal movement',
+    'C8E_International travel controls',
+    'E1_Income support',
+    'E2_Debt/contract relief',
+    'E3_Fiscal measures',
+    'E4_International support',
+    'H1_Public information campaigns',
+    'H2_Testing policy',
+    'H3_Contact tracing',
+    'H4_Emergency investment in healthcare',
+    'H5_Investment in vaccines',
+    'H6E_Facial Coverings',
+    'H7_Vaccination policy',
+    'H8E_Protection of elderly people',
+    'V1_Vaccine Prioritisation (summary)',
+    'V2A_Vaccine Availability (summary)',
+    'V3_Vaccine Financial Support (summary)',
+    'V4_Mandatory Vaccination (summary)',
+]
+
+
+def oxcgrt_path(iso_code):
+    return os.path.join(DATA_DIR, countries.get_country(iso_code)['oxcgrt_file'])
+
+
+# Jurisdictions a load can be limited to, as Parquet filters on the source
+JURISDICTIONS = {
+    'national': [('Jurisdiction', '==', "NAT_TOTAL")],
+    'regional': [('Jurisdiction', '!=', "NAT_TOTAL")],
+}
+
+
+# Loaded once per process from the columnar cache (see utils/ingest.py) and
+# shared by every session and page. `columns` limits the read to what the
+# caller uses and `jurisdiction` ('national' or 'regional') to those rows.
+# Several registry entries may share one multi-country source file, so rows
+# are limited to the country's CountryCode. Both row filters are pushed down
+# to the Parquet reader, so national pages never hold the regional rows. The
+# returned frame is shared, so callers must not modify it; use
+# national()/regional().
+@st.cache_resource(show_spinner=False)
+def load_oxcgrt(iso_code, columns=None, jurisdiction=None):
+    if columns is not None:
+        columns = list(dict.fromkeys(['Date', 'CountryCode', 'Jurisdiction', 'RegionCode'] + list(columns)))
+    filters = [('CountryCode', '==', iso_code)] + JURISDICTIONS.get(jurisdiction, [])
+    return read_columns(oxcgrt_path(iso_code), columns, filters)
+
+
+def _load(iso_code, columns, jurisdiction=None):
+    return load_oxcgrt(iso_code, tuple(columns) if columns is not None else None, jurisdiction)
+
+
+def _select(df, columns, dropna):
+    if columns is not None:
+        df = df[['Date'] + [c for c in columns if c != 'Date']]
+    if dropna is True:
+        df = df.dropna()
+    elif dropna:
+        df = df.dropna(subset=list(dropna))
+    return df.copy()
+
+
+# National totals of one country. `columns` defaults to every column, `dropna`
+# is either a bool or the list of columns that must be present.
+@st.cache_data(show_spinner=False)
+def national(iso_code, columns=None, dropna=False):
+    df = _load(iso_code, columns, 'national')
+    return _select(df, columns, dropna)
+
+
+# State / province rows of one country, with the country prefix removed from
+# RegionCode ('US_AK' -> 'AK', 'CAN_AB' -> 'AB').
+@st.cache_data(show_spinner=False)
+def regional(iso_code, columns=None, dropna=False):
+    df = _load(iso_code, columns, 'regional')
+    df = _select(df, ['RegionCode'] + [c for c in (columns or df.columns) if c != 'RegionCode'], dropna)
+    return df.assign(RegionCode=df['RegionCode'].astype(str).str.split('_', n=1).str[1])
+
+
+# National rows of each country in `iso_codes` with the outcome metrics per
+# 100K (and '<column> Per 100K Population' for `per_100k` columns) computed
+# with the registry population, labelled in a Country column and concatenated
+# in the given order.
+def national_outcomes(iso_codes, columns, dropna=False, per_100k=()):
+    frames = []
+    for iso_code in iso_codes:
+        population = countries.population(iso_code)
+        df = add_outcome_metrics(national(iso_code, columns, dropna), population)
+        if per_100k:
+            df = add_per_100k(df, per_100k, population)
+        frames.append(df.assign(Country=countries.label(iso_code)))
+    return pd.concat(frames)
+
+
+# Regional rows of one country with the outcome metrics per 100K of each
+# region's registry population.
+def regional_outcomes(iso_code, columns, dropna=False):
+    return add_outcome_metrics(regional(iso_code, columns, dropna), countries.population(iso_code),
+                               countries.region_population(iso_code))
+
+
+def index_series(iso_code):
+    return national(iso_code, INDEX_COLUMNS, dropna=True)
+
+
+@st.cache_resource(show_spinner=False)
+def load_vaccinations():
+    return read_columns(os.path.join(DATA_DIR, "vaccinations.csv"))
+
+
+# Our World in Data vaccination rows of one country (ISO 3166 alpha-3 code).
+@st.cache_data(show_spinner=False)
+def vaccinations(iso_code):
+    df = load_vaccinations()
+    return df[df['iso_code'] == iso_code].astype({'location': str, 'iso_code': str})
+
+
+# Population implied by the OWID per-hundred figures, for countries that are
+# not in the registry
+def _owid_population(df):
+    implied = df['people_vaccinated'] / df['people_vaccinated_per_hundred'] * 100
+    return implied.where(df['people_vaccinated_per_hundred'] > 0).groupby(df['iso_code']).median().to_dict()
+
+
+# Vaccination progress (see add_vaccination_metrics) of every country in
+# `iso_codes`, computed in one pass over their rows dated before `before`,
+# without the first `skip_days` rows of each country. Rows are ordered by
+# iso_code and date. Percentages use the registry's vaccination population,
+# or the one implied by the OWID figures for other countries.
+@st.cache_data(show_spinner=False)
+def vaccination_progress(iso_codes, before=None, skip_days=0):
+    filters = [('iso_code', 'in', list(iso_codes))]
+    if before is not None:
+        filters.append(('date', '<', pd.Timestamp(before)))
+    df = read_columns(os.path.join(DATA_DIR, "vaccinations.csv"), filters=filters)
+    df = df.astype({'location': str, 'iso_code': str}).sort_values(['iso_code', 'date'], kind='stable')
+    registry = countries.load_registry()
+    population = _owid_population(df)
+    population.update({iso: countries.vaccination_population(iso) for iso in iso_codes if iso in registry})
+    df = add_vaccination_metrics(df.reset_index(drop=True), population)
+    return df[df.groupby('iso_code', sort=False).cumcount() >= skip_days].reset_index(drop=True)
@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+from scipy import stats
+
+from utils import countries
+from utils.data import POLICY_COLUMNS, national, regional_outcomes
+from utils.metrics import add_outcome_metrics
+from utils.schema import POLICY_LEVELS
+
+# Policies recorded as ordinal levels (the monetary E3, E4, H4 and H5 are
+# amounts, not levels)
+LEVEL_COLUMNS = [column for column in POLICY_COLUMNS if POLICY_LEVELS[column] is not None]
+
+OUTCOMES = ['DailyCaseRate', 'DailyDeathRate']
+
+
+def policy_changes(df, columns, by):
+    """Every change of a policy level as a frame with `by`, Policy, Date, From and To.
+
+    `df` holds Date, `by` (the jurisdiction) and the policy columns, in date
+    order within each jurisdiction. A change is a day whose level differs
+    from the jurisdiction's previous reported level; missing days are
+    skipped, so a gap in reporting is not a change.
+    """
+    frames = []
+    for column in columns:
+        levels = df[[by, 'Date', column]].dropna(subset=[column])
+        previous = levels[column].groupby(levels[by], sort=False, observed=True).shift()
+        changed = previous.notna() & (levels[column] != previous)
+        frames.append(pd.DataFrame({
+            by: levels[by][changed], 'Policy': column, 'Date': levels['Date'][changed],
+            'From': previous[changed].astype('int8'), 'To': levels[column][changed].astype('int8'),
+        }))
+    events = pd.concat(frames, ignore_index=True)
+    return events.astype({'Policy': pd.CategoricalDtype(columns)})
+
+
+# Policy change index of one country, built once per process and shared by
+# every session: the changes (see policy_changes) of its national rows
+# (Region is the country label) and, with `regions`, of every region's rows,
+# with the daily outcomes as Region x date matrices. Each change carries its
+# Row and Day positions in the matrices, so the outcome windows around any
+# set of changes are read with one fancy index (see event_windows). The
+# returned frames are shared, so callers must not modify them.
+@st.cache_resource(show_spinner=False)
+def policy_event_index(iso_code, regions=True):
+    columns = ['ConfirmedCases', 'ConfirmedDeaths'] + LEVEL_COLUMNS
+    df = add_outcome_metrics(national(iso_code, columns), countries.population(iso_code))
+    frames = [df.assign(Region=countries.label(iso_code))]
+    if regions:
+        df = regional_outcomes(iso_code, columns)
+        frames.append(df.assign(Region=df['RegionCode'].map(countries.region_names(iso_code))))
+    df = pd.concat(frames, ignore_index=True).dropna(subset=['Region'])[['Region', 'Date'] + OUTCOMES + LEVEL_COLUMNS]
+
+    # One row per jurisdiction and one column per calendar day, so a day
+    # offset is a column offset
+    jurisdictions = pd.Index(df['Region'].unique())
+    dates = pd.date_range(df['Date'].min(), df['Date'].max(), freq='D')
+    matrices = {}
+    for outcome in OUTCOMES:
+        matrix = df.pivot_table(index='Region', columns='Date', values=outcome, aggfunc='last')
+        matrices[outcome] = matrix.reindex(index=jurisdictions, columns=dates).to_numpy(dtype=float)
+    events = policy_changes(df, LEVEL_COLUMNS, 'Region')
+    events['Row'] = jurisdictions.get_indexer(events['Region'])
+    events['Day'] = dates.get_indexer(events['Date'])
+    return events, matrices
+
+
+def event_windows(events, matrix, offsets):
+    """Outcome of every event's jurisdiction at each day offset from the event, as an (events, offsets) array.
+
+    `events` carries Row and Day positions in `matrix` (see
+    policy_event_index); days outside the matrix are NaN.
+    """
+    offsets = np.asarray(offsets, dtype=int)
+    days = events['Day'].to_numpy()[:, None] + offsets
+    inside = (days >= 0) & (days < matrix.shape[1])
+    values = matrix[events['Row'].to_numpy()[:, None], np.clip(days, 0, matrix.shape[1] - 1)]
+    return np.where(inside, values, np.nan)
+
+
+def event_study(windows, offsets, baseline=7, confidence=0.95):
+    """Average outcome path around events, relative to the mean of the `baseline` days before each event.
+
+    `windows` is an (events, offsets) array from event_windows(); events
+    without a complete baseline are dropped. Returns a frame with Offset,
+    Mean (change since the baseline), CILow, CIHigh (normal `confidence`
+    interval of the mean across events) and Events (events with a value at
+    the offset).
+    """
+    offsets = np.asarray(offsets, dtype=int)
+    before = (offsets < 0) & (offsets >= -baseline)
+    if before.any():
+        reference = windows[:, before].mean(axis=1)
+        windows = windows[~np.isnan(reference)] - reference[~np.isnan(reference), None]
+    counts = (~np.isnan(windows)).sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.nansum(windows, axis=0) / counts
+        spread = np.sqrt(np.nansum((windows - mean) ** 2, axis=0) / (counts - 1))
+        half_width = np.where(counts > 1, stats.norm.ppf(0.5 + confidence / 2) * spread / np.sqrt(counts), np.nan)
+    return pd.DataFrame({'Offset': offsets, 'Mean': mean, 'CILow': mean - half_width, 'CIHigh': mean + half_width,
+                         'Events': counts})
@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+import urllib.request
+
+import numpy as np
+import streamlit as st
+
+from utils.data import DATA_DIR
+
+GEO_DIR = os.path.join(DATA_DIR, "geo")
+
+# Boundary sources, the property the pages join on, and the default
+# simplification tolerance in degrees (the Canada source is far more detailed
+# than a map at zoom 1.25 can show)
+SOURCES = {
+    "us-states": {
+        "url": "https://raw.githubusercontent.com/PublicaMundi/MappingAPI/master/data/geojson/us-states.json",
+        "key": "StateName",
+        "tolerance": 0.01,
+    },
+    "canada": {
+        "url": "https://raw.githubusercontent.com/codeforgermany/click_that_hood/main/public/data/canada.geojson",
+        "key": "ProvinceName",
+        "tolerance": 0.05,
+    },
+}
+
+COORDINATE_DECIMALS = 4
+
+
+def _douglas_peucker(points, tolerance):
+    # Indices of the points kept when simplifying an open polyline
+    n = len(points)
+    if n < 3:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a, b = points[start], points[end]
+        seg = points[start + 1:end]
+        d = b - a
+        length = np.hypot(d[0], d[1])
+        if length == 0:
+            dist = np.hypot(seg[:, 0] - a[0], seg[:, 1] - a[1])
+        else:
+            dist = np.abs(d[0] * (seg[:, 1] - a[1]) - d[1] * (seg[:, 0] - a[0])) / length
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            mid = start + 1 + i
+            keep[mid] = True
+            stack.append((start, mid))
+            stack.append((mid, end))
+    return np.flatnonzero(keep)
+
+
+def _simplify_arc(arc, tolerance):
+    # Shared arcs appear once in each neighbouring ring, possibly reversed;
+    # simplifying a canonical orientation keeps both copies identical.
+    points = np.asarray(arc, dtype=float)
+    reverse = tuple(arc[0]) > tuple(arc[-1])
+    if reverse:
+        points = points[::-1]
+    kept = points[_douglas_peucker(points, tolerance)]
+    return kept[::-1] if reverse else kept
+
+
+def _rings(geometry):
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+    return []
+
+
+def simplify_collection(geojson, tolerance):
+    """Topology-preserving Douglas-Peucker simplification of a FeatureCollection.
+
+    Ring vertices where the set of rings sharing them changes split the rings
+    into arcs. Each arc is simplified once with its end points fixed, so
+    borders between neighbouring regions stay identical and no gaps or
+    overlaps open up between them.
+    """
+    polygons = [polygon for feature in geojson["features"] for polygon in _rings(feature["geometry"])]
+    rings = [[tuple(map(float, p)) for p in ring[:-1]] for polygon in polygons for ring in polygon]
+
+    owners = {}
+    for ring_id, ring in enumerate(rings):
+        for p in ring:
+            owners.setdefault(p, set()).add(ring_id)
+
+    simplified = []
+    for ring in rings:
+        n = len(ring)
+        junctions = [i for i in range(n)
+                     if owners[ring[i]] != owners[ring[i - 1]] or owners[ring[i]] != owners[ring[(i + 1) % n]]]
+        if not junctions:
+            # Ring shares no border: split it at its first and farthest vertex
+            far = int(np.argmax(np.hypot(*(np.asarray(ring) - ring[0]).T)))
+            junctions = [0, far] if far else [0]
+        out = []
+        for k, start in enumerate(junctions):
+            end = junctions[(k + 1) % len(junctions)]
+            arc = ring[start:end + 1] if end > start else ring[start:] + ring[:end + 1]
+            out.extend(_simplify_arc(arc, tolerance)[:-1].tolist())
+        simplified.append(out)
+
+    ring_iter = iter(simplified)
+    for feature in geojson["features"]:
+        geometry = feature["geometry"]
+        polygons = []
+        for polygon in _rings(geometry):
+            new_polygon = []
+            for _ in polygon:
+                ring = next(ring_iter)
+                if len(ring) >= 3:
+                    ring = np.round(ring, COORDINATE_DECIMALS).tolist()
+                    new_polygon.append(ring + [ring[0]])
+            # Drop polygons whose outer ring collapsed below the tolerance
+            if new_polygon and len(new_polygon[0]) >= 4:
+                polygons.append(new_polygon)
+        if geometry["type"] == "Polygon":
+            geometry["coordinates"] = polygons[0] if polygons else []
+        elif geometry["type"] == "MultiPolygon":
+            geometry["coordinates"] = polygons
+    return geojson
+
+
+def _fetch(source):
+    if os.path.exists(source):
+        with open(source) as f:
+            return json.load(f)
+    with urllib.request.urlopen(source) as response:
+        return json.load(response)
+
+
+def bundle_path(name):
+    return os.path.join(GEO_DIR, f"{name}.geojson")
+
+
+# Download (or read) a source, copy its 'name' property to the key the pages
+# join on, simplify it and write the bundle to data/geo/<name>.geojson
+def build_bundle(name, tolerance=None, source=None):
+    spec = SOURCES[name]
+    geojson = _fetch(source or spec["url"])
+    for feature in geojson["features"]:
+        feature["properties"] = {"name": feature["properties"]["name"], spec["key"]: feature["properties"]["name"]}
+    geojson = simplify_collection(geojson, spec["tolerance"] if tolerance is None else tolerance)
+
+    os.makedirs(GEO_DIR, exist_ok=True)
+    path = bundle_path(name)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(geojson, f, separators=(",", ":"))
+    os.replace(tmp, path)
+    return path
+
+
+# Boundaries for the choropleths, read once per process. The bundles are
+# committed; pages never download them.
+@st.cache_resource(show_spinner=False)
+def load_geojson(name):
+    path = bundle_path(name)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"GeoJSON bundle {path} is missing; build it with `python -m utils.geo {name}`")
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the simplified GeoJSON bundles in data/geo/")
+    parser.add_argument("names", nargs="*", default=list(SOURCES), help="bundles to build (default: all)")
+    parser.add_argument("--tolerance", type=float, help="simplification tolerance in degrees")
+    parser.add_argument("--source", help="local file to use instead of the download URL (single bundle only)")
+    args = parser.parse_args()
+    for name in args.names:
+        path = build_bundle(name, args.tolerance, args.source)
+        print(f"{name} -> {path} ({os.path.getsize(path) // 1024} KiB)")
@@ -0,0 +1,307 @@
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.schema import OXCGRT_DTYPES, VACCINATION_DTYPES
+
+# Caches live in a .cache directory next to their source file
+CACHE_DIRNAME = ".cache"
+
+# Bumped when the cache layout changes, so older caches are rebuilt
+CACHE_VERSION = 3
+
+# CSV rows parsed at a time; each chunk becomes one Parquet row group
+CHUNK_ROWS = 25_000
+
+# Storage types of the columns the schema declares (see utils/schema.py);
+# columns it does not know are stored as text
+STORAGE_DTYPES = {**OXCGRT_DTYPES, **VACCINATION_DTYPES}
+NUMERIC_DTYPES = ('Int8', 'float32', 'float64')
+
+DATE_FORMATS = {'Date': '%Y%m%d', 'date': '%Y-%m-%d'}
+
+# Columns that, with the date, identify a row of a source file
+KEY_COLUMNS = ['CountryCode', 'RegionCode', 'Jurisdiction', 'iso_code']
+
+FILTER_OPS = {
+    '==': lambda s, v: s == v,
+    '!=': lambda s, v: s != v,
+    'in': lambda s, v: s.isin(v),
+    'not in': lambda s, v: ~s.isin(v),
+}
+
+
+def _file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _cache_paths(path):
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIRNAME)
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, name + ".parquet"), os.path.join(cache_dir, name + ".json")
+
+
+def _read_manifest(manifest_path):
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, obj):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+# Columns of a source CSV without the free-text *_Notes columns
+def csv_columns(path):
+    return [c for c in pd.read_csv(path, nrows=0).columns if not c.endswith('_Notes')]
+
+
+def _dtype(column):
+    return STORAGE_DTYPES.get(column, 'object')
+
+
+# Declared read types, so that every chunk parses the same way whatever its
+# values (inference would make a chunk of whole numbers int64 and the next
+# float64, or a chunk of empty strings float64). Numbers are parsed as
+# float64 and narrowed by _convert().
+def _csv_dtypes(columns):
+    return {c: 'float64' if _dtype(c) in NUMERIC_DTYPES else str for c in columns}
+
+
+# Arrow schema of the cache, with the pandas metadata that restores the
+# nullable integer columns on read. Dictionaries get 32-bit indices whatever
+# the number of categories in a chunk.
+def _arrow_schema(columns):
+    template = pd.DataFrame({c: pd.Series(dtype=_dtype(c)) for c in columns})
+    schema = pa.Schema.from_pandas(template, preserve_index=False)
+    for i, c in enumerate(columns):
+        if _dtype(c) == 'category':
+            schema = schema.set(i, pa.field(c, pa.dictionary(pa.int32(), pa.string())))
+        elif _dtype(c) == 'object':
+            schema = schema.set(i, pa.field(c, pa.string()))
+    return schema
+
+
+def _convert(chunk):
+    converted = {}
+    for c in chunk.columns:
+        dtype = _dtype(c)
+        if c in DATE_FORMATS:
+            converted[c] = pd.to_datetime(chunk[c], format=DATE_FORMATS[c])
+        elif dtype in ('category', 'Int8', 'float32'):
+            converted[c] = chunk[c].astype(dtype)
+    return chunk.assign(**converted)
+
+
+# Rows of `df` matching every (column, op, value) of `filters`, with op one of
+# '==', '!=', 'in' and 'not in' (the pyarrow / pd.read_parquet filter form)
+def _matching(df, filters):
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters:
+        mask &= FILTER_OPS[op](df[column], value)
+    return df[mask]
+
+
+def iter_csv(path, columns=None, filters=None, chunksize=CHUNK_ROWS):
+    """Stream a source CSV in chunks of typed rows, filtered as they are read.
+
+    `columns` limits the parse (default: all but *_Notes); `filters` is a
+    list of (column, op, value) as for read_columns(). Only the matching rows
+    of each chunk are kept, so memory follows the chunk size and the result,
+    not the size of the file.
+    """
+    columns = list(columns) if columns is not None else csv_columns(path)
+    usecols = list(dict.fromkeys(columns + [f[0] for f in filters or ()]))
+    reader = pd.read_csv(path, usecols=usecols, dtype=_csv_dtypes(usecols), chunksize=chunksize)
+    for chunk in reader:
+        if filters:
+            chunk = _matching(chunk, filters)
+        yield _convert(chunk[columns])
+
+
+# Rows of a source CSV matching `filters`, read straight from the CSV (no
+# cache), e.g. one country's national rows of the global OxCGRT file
+def read_csv_slice(path, columns=None, filters=None):
+    return pd.concat(iter_csv(path, columns, filters), ignore_index=True)
+
+
+def _write_cache(path, columns, chunks):
+    # Write the typed chunks of `path` as its Parquet cache, one row group per
+    # chunk, and record the source in the manifest
+    parquet_path, manifest_path = _cache_paths(path)
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+    stat = os.stat(path)
+
+    schema = _arrow_schema(columns)
+    tmp = f"{parquet_path}.{os.getpid()}.tmp"
+    with pq.ParquetWriter(tmp, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    os.replace(tmp, parquet_path)
+    _write_json(manifest_path, {
+        'version': CACHE_VERSION,
+        'source': os.path.basename(path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': _file_hash(path),
+        'columns': columns,
+    })
+    return parquet_path
+
+
+# Parse the CSV chunk by chunk without the free-text *_Notes columns and store
+# it as Parquet
+def build_cache(path):
+    columns = csv_columns(path)
+    return _write_cache(path, columns, iter_csv(path, columns))
+
+
+def _same_rows(a, b):
+    return len(a) == len(b) and all((a[c].astype(str).to_numpy() == b[c].astype(str).to_numpy()).all()
+                                    for c in a.columns)
+
+
+# Rows of `keys` (the identifying columns and the date of a file) dated after
+# the last cached date of their jurisdiction or country; all rows of one the
+# cache does not have. Sources report on different days (an OWID drop adds
+# more days for some countries than others), so the tail is found per group.
+def _new_rows(keys, cached, date):
+    groups = [c for c in keys.columns if c != date]
+    if not groups:
+        return (keys[date] > cached[date].max()).to_numpy()
+    last = (cached[groups].astype(str).assign(Last=cached[date].to_numpy())
+            .groupby(groups, as_index=False)['Last'].max())
+    last_date = keys[groups].astype(str).merge(last, on=groups, how='left')['Last'].to_numpy()
+    # NaT (a new group) compares False
+    return ~(keys[date].to_numpy() <= last_date)
+
+
+# Extend the cache of `path` with the rows dated after the last cached date of
+# their jurisdiction, for a new drop of a file that only adds days. Only the
+# identifying columns of the whole file and the new rows are parsed; the
+# cached rows are kept and the new ones merged in at their place in the file,
+# so the cache is the one build_cache() would write. Returns (cache path, rows
+# appended).
+#
+# The earlier rows must be the cached ones: when rows were added, removed or
+# reordered before the last cached dates, the columns changed or there is no
+# new row, the cache is rebuilt instead (rows appended None). Revised values
+# of earlier rows are not detected; a drop that revises history needs a
+# rebuild (ensure_cache() / `python -m utils.ingest`).
+def append_cache(path):
+    parquet_path, manifest_path = _cache_paths(path)
+    manifest = _read_manifest(manifest_path)
+    columns = csv_columns(path)
+    date = next((c for c in DATE_FORMATS if c in columns), None)
+    if (manifest is None or manifest.get('version') != CACHE_VERSION or manifest['columns'] != columns
+            or date is None or not os.path.exists(parquet_path)):
+        return build_cache(path), None
+
+    cached = pd.read_parquet(parquet_path)
+    keys = [c for c in KEY_COLUMNS if c in columns] + [date]
+    file_keys = _convert(pd.read_csv(path, usecols=keys, dtype=_csv_dtypes(keys)))[keys]
+    new = _new_rows(file_keys, cached, date)
+    if not new.any() or not _same_rows(file_keys[~new], cached[keys]):
+        return build_cache(path), None
+
+    wanted = set((np.flatnonzero(new) + 1).tolist())
+    tail = _convert(pd.read_csv(path, usecols=columns, dtype=_csv_dtypes(columns),
+                                skiprows=lambda i: i > 0 and i not in wanted))[columns]
+    for c in columns:
+        if isinstance(cached[c].dtype, pd.CategoricalDtype):
+            categories = cached[c].cat.categories.union(tail[c].cat.categories)
+            cached[c] = cached[c].cat.set_categories(categories)
+            tail[c] = tail[c].cat.set_categories(categories)
+    merged = pd.concat([cached.set_axis(np.flatnonzero(~new)), tail.set_axis(np.flatnonzero(new))]).sort_index()
+    chunks = (merged.iloc[start:start + CHUNK_ROWS] for start in range(0, len(merged), CHUNK_ROWS))
+    return _write_cache(path, columns, chunks), len(tail)
+
+
+# Return the Parquet cache of `path`, rebuilding it when the CSV changed. A
+# matching size and mtime is trusted; otherwise the content hash decides, so a
+# touched but unchanged file does not trigger a rebuild.
+def ensure_cache(path):
+    parquet_path, manifest_path = _cache_paths(path)
+    manifest = _read_manifest(manifest_path)
+    if manifest is None or manifest.get('version') != CACHE_VERSION or not os.path.exists(parquet_path):
+        return build_cache(path)
+
+    stat = os.stat(path)
+    if stat.st_size == manifest['size'] and stat.st_mtime_ns == manifest['mtime_ns']:
+        return parquet_path
+    if stat.st_size == manifest['size'] and _file_hash(path) == manifest['sha256']:
+        manifest['mtime_ns'] = stat.st_mtime_ns
+        _write_json(manifest_path, manifest)
+        return parquet_path
+    return build_cache(path)
+
+
+# Content hash of `path`, as recorded by its (rebuilt if needed) cache
+def source_hash(path):
+    ensure_cache(path)
+    return _read_manifest(_cache_paths(path)[1])['sha256']
+
+
+# Read only `columns` (all cached columns when None) of a source CSV, and only
+# the rows matching `filters`: a list of (column, op, value) such as
+# [('Jurisdiction', '==', 'NAT_TOTAL')], pushed down to the Parquet reader so
+# row groups without matches are skipped
+def read_columns(path, columns=None, filters=None):
+    parquet_path = ensure_cache(path)
+    return pd.read_parquet(parquet_path, columns=list(columns) if columns is not None else None,
+                           filters=list(filters) if filters else None)
+
+
+# In-memory size (MB) of a source file's columns grouped by storage type:
+# read by pd.read_csv with inferred types (before) and from the cache (after)
+def memory_report(path):
+    columns = csv_columns(path)
+    before = pd.read_csv(path, usecols=columns, low_memory=False).memory_usage(deep=True, index=False)
+    after = read_columns(path, columns).memory_usage(deep=True, index=False)
+    report = pd.DataFrame({'dtype': [str(_dtype(c)) for c in columns], 'columns': 1,
+                           'before_mb': before[columns].to_numpy() / 2**20,
+                           'after_mb': after[columns].to_numpy() / 2**20})
+    report = report.groupby('dtype').sum()
+    report.loc['total'] = report.sum()
+    return report.assign(ratio=report['before_mb'] / report['after_mb']).round(2)
+
+
+if __name__ == "__main__":
+    # python -m utils.ingest [--memory] [--append] [file ...] -- prebuild the
+    # caches of every data file; --memory also prints their in-memory size
+    # before and after the storage types, --append extends the caches with
+    # the new days of a drop that only adds days (see append_cache())
+    from utils.countries import country_codes
+    from utils.data import DATA_DIR, oxcgrt_path
+
+    args = sys.argv[1:]
+    show_memory = "--memory" in args
+    append = "--append" in args
+    args = [a for a in args if a not in ("--memory", "--append")]
+    files = args or sorted({oxcgrt_path(iso) for iso in country_codes()}) + [os.path.join(DATA_DIR, "vaccinations.csv")]
+    for f in files:
+        if not os.path.exists(f):
+            print(f"{f}: not found, skipped")
+            continue
+        if append:
+            parquet_path, appended = append_cache(f)
+            print(f"{f} -> {parquet_path} ({'rebuilt' if appended is None else f'{appended} rows appended'})")
+        else:
+            print(f"{f} -> {ensure_cache(f)}")
+        if show_memory:
+            print(memory_report(f).to_string(), end="\n\n")
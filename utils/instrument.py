@@ -0,0 +1,169 @@
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+
+from utils.data import DATA_DIR
+from utils.plotting import SerializedFigure
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+# PAGE_METRICS=1 shows the stages of each rerun in a sidebar panel;
+# PAGE_METRICS_LOG=<path> appends them to a JSON-lines file (set to 1 for the
+# default path). Either turns recording on; with neither, the calls below
+# only cost a lookup.
+SHOW_PANEL = os.environ.get("PAGE_METRICS", "0") not in ("", "0")
+LOG_PATH = os.environ.get("PAGE_METRICS_LOG", "")
+if LOG_PATH == "1":
+    LOG_PATH = os.path.join(DATA_DIR, ".cache", "page_metrics.jsonl")
+ENABLED = SHOW_PANEL or bool(LOG_PATH)
+
+# Every rerun runs in its own script thread
+_run = threading.local()
+_log_lock = threading.Lock()
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class _Rerun:
+    # The stages of one rerun. A rerun that ends without finish_page() (on
+    # st.stop() or an exception) is logged when it is released: when its
+    # script thread exits or the next rerun in the thread starts.
+    def __init__(self, page):
+        self.page = page
+        self.started = time.time()
+        self.stages = {}
+        self.current = None
+        self.finished = False
+
+    def record(self):
+        return {
+            'time': datetime.datetime.fromtimestamp(self.started, datetime.timezone.utc).isoformat(),
+            'page': self.page,
+            'pid': os.getpid(),
+            'wall_s': time.time() - self.started,
+            'stages': list(self.stages.values()),
+        }
+
+    def __del__(self):
+        if not self.finished and self.current is not None:
+            _close_stage(self)
+            _write_log(dict(self.record(), stopped=True))
+
+
+def _write_log(record):
+    if LOG_PATH:
+        line = json.dumps(record) + "\n"
+        with _log_lock:
+            os.makedirs(os.path.dirname(os.path.abspath(LOG_PATH)), exist_ok=True)
+            with open(LOG_PATH, 'a') as f:
+                f.write(line)
+
+
+def _current():
+    rerun = getattr(_run, 'rerun', None)
+    return rerun if rerun is not None and not rerun.finished else None
+
+
+def _totals(rerun, name):
+    return rerun.stages.setdefault(name, {'stage': name, 'wall_s': 0.0, 'cpu_s': 0.0, 'peak_rss_mb': None,
+                                          'rss_growth_mb': 0.0, 'payload_bytes': 0})
+
+
+def _close_stage(rerun):
+    # Add the open segment to its stage's totals
+    name, wall, cpu, rss = rerun.current
+    stage = _totals(rerun, name)
+    stage['wall_s'] += time.perf_counter() - wall
+    stage['cpu_s'] += time.thread_time() - cpu
+    peak = _peak_rss_bytes()
+    if peak is not None:
+        stage['peak_rss_mb'] = peak / 2**20
+        stage['rss_growth_mb'] += (peak - rss) / 2**20
+
+
+def start_page(page):
+    """Start recording a rerun of `page` (call first thing in the page script)."""
+    if not ENABLED:
+        return
+    _run.rerun = _Rerun(os.path.splitext(os.path.basename(page))[0])
+    stage('setup')
+
+
+def stage(name):
+    """End the current stage of the rerun and start `name`.
+
+    Stages are consecutive segments of the script (load, derive, compute,
+    render, ...); a name used again adds to its earlier segments. Wall time,
+    CPU time of the script thread (not of worker processes), the process's
+    peak RSS and its growth are recorded per stage. Returns the name of the
+    stage that was ended.
+    """
+    rerun = _current() if ENABLED else None
+    if rerun is None:
+        return None
+    previous = None
+    if rerun.current is not None:
+        previous = rerun.current[0]
+        _close_stage(rerun)
+    rerun.current = (name, time.perf_counter(), time.thread_time(), _peak_rss_bytes() or 0)
+    return previous
+
+
+def payload(obj):
+    """Count the size of obj towards the current stage's payload bytes.
+
+    Frames count their deep memory usage, figures their JSON and anything else
+    its len().
+    """
+    rerun = _current() if ENABLED else None
+    if rerun is None or rerun.current is None:
+        return
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        size = int(pd.Series(obj.memory_usage(deep=True)).sum())
+    elif hasattr(obj, 'to_json'):
+        size = len(obj.to_json())
+    else:
+        size = len(obj)
+    _totals(rerun, rerun.current[0])['payload_bytes'] += size
+
+
+def plotly_chart(fig, **kwargs):
+    # st.plotly_chart, recorded as the 'serialize' stage with the figure's
+    # JSON as payload; the surrounding stage resumes afterwards. The figure is
+    # serialized once, and not at all when it is a cached spec.
+    previous = stage('serialize')
+    if previous is not None and not isinstance(fig, SerializedFigure):
+        fig = SerializedFigure(fig.to_json())
+    st.plotly_chart(fig, **kwargs)
+    if previous is not None:
+        payload(fig.to_json())
+        stage(previous)
+
+
+def finish_page():
+    """End the rerun: log its stages and, with PAGE_METRICS=1, show them in the sidebar."""
+    rerun = _current() if ENABLED else None
+    if rerun is None:
+        return
+    _close_stage(rerun)
+    rerun.finished = True
+    record = rerun.record()
+    _write_log(record)
+    if SHOW_PANEL:
+        with st.sidebar.expander("Page metrics", expanded=False):
+            st.caption(f"{record['page']}: {record['wall_s']:.3f}s")
+            st.dataframe(pd.DataFrame(record['stages']).set_index('stage').round(4))
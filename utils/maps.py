@@ -0,0 +1,66 @@
+import pandas as pd
+import plotly.graph_objects as go
+
+
+# Values of every region on `date` as a two-column frame ready for
+# px.choropleth_mapbox; empty when the date is not in the data
+def values_on(matrix, date, region_column, value_column):
+    position = matrix.columns.get_indexer([pd.Timestamp(date)])[0]
+    if position < 0:
+        return pd.DataFrame({region_column: [], value_column: []})
+    return pd.DataFrame({region_column: matrix.index, value_column: matrix.iloc[:, position].to_numpy()})
+
+
+# Choropleth animated over the matrix dates (every `step` days). The geometry
+# and locations are sent once in the base trace; each frame only carries the
+# colour vector, and the play button and slider run in the browser.
+def animated_choropleth(matrix, geojson, featureidkey, label, range_color, zoom, center, step=7):
+    dates = matrix.columns[::step]
+    values = matrix[dates].to_numpy()
+    names = [d.strftime('%m/%d/%Y') for d in dates]
+
+    fig = go.Figure(
+        data=[go.Choroplethmapbox(
+            geojson=geojson,
+            locations=matrix.index,
+            featureidkey=featureidkey,
+            z=values[:, 0],
+            zmin=range_color[0],
+            zmax=range_color[1],
+            colorscale='Viridis',
+            marker_opacity=0.5,
+            marker_line_width=0,
+            colorbar_title=label,
+        )],
+        frames=[go.Frame(data=[go.Choroplethmapbox(z=values[:, i])], traces=[0], name=name)
+                for i, name in enumerate(names)],
+    )
+    frame_args = {'frame': {'duration': 150, 'redraw': True}, 'mode': 'immediate', 'transition': {'duration': 0}}
+    fig.update_layout(
+        mapbox_style='carto-positron',
+        mapbox_zoom=zoom,
+        mapbox_center=center,
+        margin={'r': 0, 't': 0, 'l': 0, 'b': 0},
+        updatemenus=[{
+            'type': 'buttons',
+            'direction': 'left',
+            'x': 0.1,
+            'y': 0,
+            'xanchor': 'right',
+            'yanchor': 'top',
+            'pad': {'r': 10, 't': 30},
+            'buttons': [
+                {'label': 'Play', 'method': 'animate', 'args': [None, {**frame_args, 'fromcurrent': True}]},
+                {'label': 'Pause', 'method': 'animate', 'args': [[None], {**frame_args, 'frame': {'duration': 0}}]},
+            ],
+        }],
+        sliders=[{
+            'x': 0.1,
+            'y': 0,
+            'len': 0.9,
+            'pad': {'t': 20},
+            'currentvalue': {'prefix': 'Date: '},
+            'steps': [{'label': name, 'method': 'animate', 'args': [[name], frame_args]} for name in names],
+        }],
+    )
+    return fig
@@ -0,0 +1,68 @@
+PER_100K = 100_000
+
+
+def _population(df, population, region_population, region_column):
+    if region_population is None:
+        return population
+    codes = df[region_column]
+    return codes.map(region_population).astype(float).where(codes.notna(), population)
+
+
+# Cumulative (CasesPer100K, DeathsPer100K) and daily (DailyCaseRate,
+# DailyDeathRate) counts per 100K population, computed column-wise.
+#
+# National rows use `population`. With `region_population` ({RegionCode:
+# population}) rows are normalised by their region's population, rows without
+# a region code fall back to `population`, and the daily delta is taken within
+# each region, so a frame holding several regions (or national and regional
+# rows together) is derived in one pass. Rows must be in date order within each
+# region. Regions missing from `region_population` get NaN. The metrics are
+# float32, like the indexes (see utils/schema.py).
+def add_outcome_metrics(df, population, region_population=None, region_column='RegionCode'):
+    pop = _population(df, population, region_population, region_column)
+    counts = df[['ConfirmedCases', 'ConfirmedDeaths']]
+    if region_population is None:
+        daily = counts.diff()
+    else:
+        daily = counts.groupby(df[region_column], sort=False, dropna=False, observed=True).diff()
+    daily = daily.fillna(0).clip(lower=0)
+    return df.assign(
+        CasesPer100K=(counts['ConfirmedCases'] / pop * PER_100K).astype('float32'),
+        DeathsPer100K=(counts['ConfirmedDeaths'] / pop * PER_100K).astype('float32'),
+        DailyCaseRate=(daily['ConfirmedCases'] / pop * PER_100K).astype('float32'),
+        DailyDeathRate=(daily['ConfirmedDeaths'] / pop * PER_100K).astype('float32'),
+    )
+
+
+# Adds '<column> Per 100K Population' for monetary policy columns (E3, E4, H4, H5)
+def add_per_100k(df, columns, population, region_population=None, region_column='RegionCode'):
+    pop = _population(df, population, region_population, region_column)
+    return df.assign(**{f"{col} Per 100K Population": (df[col] / pop * PER_100K).astype('float32') for col in columns})
+
+
+# Vaccination progress of Our World in Data rows of any number of countries,
+# sorted by iso_code and date, in one grouped pass. Missing values count as
+# 0. people_fully_vaccinated and total_vaccinations are forward filled over
+# zero (unreported) days within each country, and days before the first
+# report take the country's last value. Adds cumulative_people_vaccinated
+# (running sum of daily_people_vaccinated), percent_people_vaccinated and
+# percent_people_fully_vaccinated of `population` ({iso_code: population})
+# and vaccine_administered_per_people (doses per vaccinated person).
+def add_vaccination_metrics(df, population):
+    countries = df['iso_code']
+    filled = {}
+    for col in ('people_fully_vaccinated', 'total_vaccinations'):
+        reported = df[col].where(df[col] != 0)
+        forward = reported.groupby(countries, sort=False, observed=True).ffill()
+        filled[col] = forward.fillna(forward.groupby(countries, sort=False, observed=True).transform('last'))
+    cumulative = df['daily_people_vaccinated'].fillna(0).groupby(countries, sort=False, observed=True).cumsum()
+    pop = countries.map(population).astype(float)
+    return df.assign(
+        people_fully_vaccinated=filled['people_fully_vaccinated'],
+        total_vaccinations=filled['total_vaccinations'],
+        daily_people_vaccinated=df['daily_people_vaccinated'].fillna(0),
+        cumulative_people_vaccinated=cumulative,
+        percent_people_vaccinated=cumulative / pop * 100,
+        percent_people_fully_vaccinated=filled['people_fully_vaccinated'] / pop * 100,
+        vaccine_administered_per_people=filled['total_vaccinations'] / cumulative,
+    )
@@ -0,0 +1,50 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Below this much work (data points summed over all items) a worker pool
+# costs more than it saves
+PARALLEL_MIN_WORK = 200_000
+
+_pools = {}
+
+
+def worker_pool(workers):
+    # One pool per size, kept for the life of the process so workers are only
+    # started once. Spawned rather than forked: the Streamlit server is
+    # multi-threaded.
+    if workers not in _pools:
+        context = multiprocessing.get_context('spawn')
+        _pools[workers] = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    return _pools[workers]
+
+
+def map_batches(func, items, *args, work=0, workers=None):
+    """Run func(batch, *args) over interleaved batches of items.
+
+    func returns a tuple of arrays aligned with its batch, which are
+    reassembled in item order. Batches run on a process pool of `workers`
+    (default: all cores) once `work` reaches PARALLEL_MIN_WORK, otherwise
+    func is called once in-process on all items.
+    """
+    items = np.asarray(items)
+    workers = min(workers or os.cpu_count() or 1, len(items))
+    if workers <= 1 or work < PARALLEL_MIN_WORK:
+        return func(items, *args)
+
+    # Interleave the items so every batch gets a similar amount of work
+    batches = [np.arange(i, len(items), workers) for i in range(workers)]
+    pool = worker_pool(workers)
+    futures = [pool.submit(func, items[batch], *args) for batch in batches]
+    results = [future.result() for future in futures]
+
+    merged = []
+    for k, first in enumerate(results[0]):
+        first = np.asarray(first)
+        out = np.empty((len(items),) + first.shape[1:], dtype=first.dtype)
+        for batch, result in zip(batches, results):
+            out[batch] = result[k]
+        merged.append(out)
+    return tuple(merged)
@@ -0,0 +1,230 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+
+from utils.cache import fingerprint
+
+# Traces with more points than this are drawn with WebGL (as plotly express
+# does with render_mode='auto')
+WEBGL_THRESHOLD = 1000
+
+# Points kept per trace by the downsamplers; a zoomed-in date range of fewer
+# points is drawn at full resolution
+MAX_POINTS = 2000
+
+
+def _numeric(values):
+    values = pd.Series(values)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(float)
+    return values.to_numpy(dtype=float, na_value=np.nan)
+
+
+def lttb_indices(x, y, n_out):
+    """Indices of the points kept by Largest-Triangle-Three-Buckets.
+
+    Keeps the first and last point and, from each of n_out - 2 equal-count
+    buckets, the point forming the largest triangle with the point kept
+    before it and the mean of the next bucket, which preserves the visual
+    shape of a line.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = _numeric(x)
+    y = _numeric(y)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    kept = np.empty(n_out, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        area = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                      - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        kept[i + 1] = previous
+    return kept
+
+
+def minmax_indices(x, y, n_buckets):
+    """Indices of the minimum and maximum y of each of n_buckets equal-width x buckets.
+
+    Keeps the envelope of a dense scatter, outliers included, in at most
+    2 * n_buckets points (in x order).
+    """
+    n = len(x)
+    if 2 * n_buckets >= n:
+        return np.arange(n)
+    x = _numeric(x)
+    y = _numeric(y)
+    bucket = np.minimum(((x - x[0]) / max(x[-1] - x[0], 1) * n_buckets).astype(int), n_buckets - 1)
+    order = np.lexsort((y, bucket))
+    starts = np.r_[0, np.flatnonzero(np.diff(bucket[order])) + 1]
+    ends = np.r_[starts[1:], n] - 1
+    return np.unique(np.r_[order[starts], order[ends]])
+
+
+def downsample(x, y, max_points=MAX_POINTS, method='lttb'):
+    # Indices of at most max_points points of (x, y) sorted by x; missing y
+    # are dropped when thinning (short series are kept as is, gaps included)
+    if len(y) <= max_points:
+        return np.arange(len(y))
+    valid = np.flatnonzero(~np.isnan(_numeric(y)))
+    if len(valid) <= max_points:
+        return valid
+    x = np.asarray(x)[valid]
+    y = np.asarray(y)[valid]
+    if method == 'minmax':
+        return valid[minmax_indices(x, y, max_points // 2)]
+    return valid[lttb_indices(x, y, max_points)]
+
+
+def scatter(x, y, max_points=MAX_POINTS, method=None, **kwargs):
+    """go.Scatter, or go.Scattergl above WEBGL_THRESHOLD points, of at most max_points points.
+
+    Markers are downsampled min-max per bucket and lines with LTTB unless
+    `method` says otherwise; max_points=None keeps every point.
+    """
+    x = pd.Series(x).reset_index(drop=True)
+    y = pd.Series(y).reset_index(drop=True)
+    if max_points is not None:
+        method = method or ('minmax' if kwargs.get('mode') == 'markers' else 'lttb')
+        kept = downsample(x, y, max_points, method)
+        x = x.iloc[kept]
+        y = y.iloc[kept]
+    trace = go.Scattergl if len(x) > WEBGL_THRESHOLD else go.Scatter
+    return trace(x=x, y=y, **kwargs)
+
+
+def downsample_frame(df, x, y, by=None, max_points=MAX_POINTS, method='minmax'):
+    # Rows of df kept when downsampling y against x within each `by` group,
+    # for plotly express figures
+    groups = df.groupby(by, sort=False) if by is not None else [(None, df)]
+    kept = [group.iloc[downsample(group[x], group[y], max_points, method)] for _, group in groups]
+    return pd.concat(kept) if kept else df
+
+
+# Index column suffixes of the OxCGRT vaccination statuses and their legend names
+STATUS_NAMES = {'NonVaccinated': 'Not Vaccinated', 'Vaccinated': 'Vaccinated'}
+
+
+def status_figure(df, index, title, y_label, x='Date', x_label='Date', status_label='Vaccination Status'):
+    """Line figure of an index for non-vaccinated and vaccinated people, e.g. 'StringencyIndex'.
+
+    One trace per status is built straight from the wide frame's
+    '<index>_NonVaccinated' and '<index>_Vaccinated' columns, drawn and
+    labelled as px.line of the melted frame with a status color would.
+    """
+    fig = go.Figure()
+    for suffix, name in STATUS_NAMES.items():
+        fig.add_trace(scatter(x=df[x], y=df[f'{index}_{suffix}'], mode='lines', name=name, legendgroup=name,
+                              showlegend=True,
+                              hovertemplate=f"{status_label}={name}<br>{x_label}=%{{x}}<br>{y_label}=%{{y}}<extra></extra>"))
+    fig.update_layout(title=title, xaxis_title=x_label, yaxis_title=y_label, legend_title_text=status_label,
+                      legend_tracegroupgap=0)
+    return fig
+
+
+# Sidebar date range shared by the page's time series. Figures are built from
+# the rows in range only, so zooming into a range of at most MAX_POINTS days
+# per trace shows the full-resolution data.
+def _zoom_range(first, last, key):
+    start, end = st.sidebar.slider("Date range", min_value=first.to_pydatetime(), max_value=last.to_pydatetime(),
+                                   value=(first.to_pydatetime(), last.to_pydatetime()), format="MM/DD/YYYY", key=key)
+    return pd.Timestamp(start), pd.Timestamp(end)
+
+
+def zoom(df, key="zoom", column='Date'):
+    first, last = df[column].min(), df[column].max()
+    if first == last:
+        return df
+    start, end = _zoom_range(first, last, key)
+    return df[df[column].between(start, end)]
+
+
+# zoom() over several frames sorted by `column` (e.g. {country: frame}), with
+# one slider for their combined range. Each frame's rows in range are a slice
+# of it rather than a filtered copy.
+def zoom_frames(frames, key="zoom", column='Date'):
+    first = min(df[column].min() for df in frames.values())
+    last = max(df[column].max() for df in frames.values())
+    if first == last:
+        return frames
+    start, end = _zoom_range(first, last, key)
+    return {name: df.iloc[df[column].searchsorted(start):df[column].searchsorted(end, side='right')]
+            for name, df in frames.items()}
+
+
+# The range picked on the zoom slider `key` of zoom() / zoom_frames(), None
+# when it is not shown; with the version of the data zoomed, it identifies the
+# zoomed frames without hashing them
+def zoom_version(key="zoom"):
+    return st.session_state.get(key)
+
+
+# Serialized figures kept across reruns and sessions, least recently used
+# first out
+FIGURE_CACHE_MAX_BYTES = int(os.environ.get("FIGURE_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+
+class SerializedFigure(go.Figure):
+    """Figure standing in for its JSON spec: st.plotly_chart reads the spec instead of serializing the traces.
+
+    Only to_dict() and to_json() reflect the spec; the figure has no traces
+    or layout of its own and must not be modified.
+    """
+
+    def __init__(self, spec):
+        super().__init__()
+        self._spec = spec
+
+    def to_dict(self):
+        return json.loads(self._spec)
+
+    def to_plotly_json(self):
+        return self.to_dict()
+
+    def to_json(self, *args, **kwargs):
+        return self._spec
+
+
+@st.cache_resource
+def _figure_store():
+    # Shared by every session of the server, hence the lock
+    return {'entries': OrderedDict(), 'bytes': 0, 'lock': threading.Lock()}
+
+
+def cached_figure(figure_id, build, *inputs, data_version=None):
+    """Figure returned by build(*inputs), serialized once and reused while figure_id, inputs and data_version are unchanged.
+
+    `inputs` are the widget values the figure depends on and `data_version`
+    identifies the data it is drawn from (e.g. the store_version() of the
+    frames and the zoom_version() of their range),
+    so a rerun only rebuilds the figures whose inputs changed. Figure ids must
+    be unique across pages. The JSON spec is cached, sized by its length and
+    evicted past FIGURE_CACHE_MAX_BYTES, and returned as a SerializedFigure.
+    """
+    key = fingerprint(figure_id, inputs, data_version)
+    store = _figure_store()
+    with store['lock']:
+        if key in store['entries']:
+            store['entries'].move_to_end(key)
+            return SerializedFigure(store['entries'][key])
+    spec = build(*inputs).to_json()
+    with store['lock']:
+        if key not in store['entries']:
+            store['entries'][key] = spec
+            store['bytes'] += len(spec)
+        while store['bytes'] > FIGURE_CACHE_MAX_BYTES and len(store['entries']) > 1:
+            _, evicted = store['entries'].popitem(last=False)
+            store['bytes'] -= len(evicted)
+    return SerializedFigure(spec)
@@ -0,0 +1,113 @@
+# Column layout and storage types of the source files, used by the columnar
+# caches (utils/ingest.py) and the synthetic data generator
+# (utils/synthetic.py). The loaders select columns by name, so they do not
+# depend on the order.
+
+OXCGRT_ID_COLUMNS = ['CountryName', 'CountryCode', 'RegionName', 'RegionCode', 'Jurisdiction', 'Date']
+
+# OxCGRT_fullwithnotes_<ISO>_v1.csv header, as published: identifiers, each
+# policy followed by its notes, case and death counts and the indexes. Only
+# the everyone (E) value of the indicators recorded per vaccination status is
+# published; the indexes come per status and averaged.
+OXCGRT_COLUMNS = OXCGRT_ID_COLUMNS + [
+    'C1E_School closing', 'C1E_Notes',
+    'C2E_Workplace closing', 'C2E_Notes',
+    'C3E_Cancel public events', 'C3E_Notes',
+    'C4E_Restrictions on gatherings', 'C4E_Notes',
+    'C5E_Close public transport', 'C5E_Notes',
+    'C6E_Stay at home requirements', 'C6E_Notes',
+    'C7E_Restrictions on internal movement', 'C7E_Notes',
+    'C8E_International travel controls', 'C8E_Notes',
+    'E1_Income support', 'E1_Notes',
+    'E2_Debt/contract relief', 'E2_Notes',
+    'E3_Fiscal measures', 'E3_Notes',
+    'E4_International support', 'E4_Notes',
+    'H1_Public information campaigns', 'H1_Notes',
+    'H2_Testing policy', 'H2_Notes',
+    'H3_Contact tracing', 'H3_Notes',
+    'H4_Emergency investment in healthcare', 'H4_Notes',
+    'H5_Investment in vaccines', 'H5_Notes',
+    'H6E_Facial Coverings', 'H6E_Notes',
+    'H7_Vaccination policy', 'H7_Notes',
+    'H8E_Protection of elderly people', 'H8E_Notes',
+    'V1_Vaccine Prioritisation (summary)', 'V1_Notes',
+    'V2A_Vaccine Availability (summary)', 'V2A_Notes',
+    'V3_Vaccine Financial Support (summary)', 'V3_Notes',
+    'V4_Mandatory Vaccination (summary)', 'V4_Notes',
+    'ConfirmedCases', 'ConfirmedDeaths',
+    'StringencyIndex_NonVaccinated', 'StringencyIndex_Vaccinated',
+    'StringencyIndex_SimpleAverage', 'StringencyIndex_WeightedAverage',
+    'GovernmentResponseIndex_NonVaccinated', 'GovernmentResponseIndex_Vaccinated',
+    'GovernmentResponseIndex_SimpleAverage', 'GovernmentResponseIndex_WeightedAverage',
+    'ContainmentHealthIndex_NonVaccinated', 'ContainmentHealthIndex_Vaccinated',
+    'ContainmentHealthIndex_SimpleAverage', 'ContainmentHealthIndex_WeightedAverage',
+    'EconomicSupportIndex',
+]
+
+# Policy columns and their highest level, or None for the monetary ones (in
+# USD)
+POLICY_LEVELS = {
+    'C1E_School closing': 3,
+    'C2E_Workplace closing': 3,
+    'C3E_Cancel public events': 2,
+    'C4E_Restrictions on gatherings': 4,
+    'C5E_Close public transport': 2,
+    'C6E_Stay at home requirements': 3,
+    'C7E_Restrictions on internal movement': 2,
+    'C8E_International travel controls': 4,
+    'E1_Income support': 2,
+    'E2_Debt/contract relief': 2,
+    'E3_Fiscal measures': None,
+    'E4_International support': None,
+    'H1_Public information campaigns': 2,
+    'H2_Testing policy': 3,
+    'H3_Contact tracing': 2,
+    'H4_Emergency investment in healthcare': None,
+    'H5_Investment in vaccines': None,
+    'H6E_Facial Coverings': 4,
+    'H7_Vaccination policy': 5,
+    'H8E_Protection of elderly people': 3,
+    'V1_Vaccine Prioritisation (summary)': 2,
+    'V2A_Vaccine Availability (summary)': 3,
+    'V3_Vaccine Financial Support (summary)': 5,
+    'V4_Mandatory Vaccination (summary)': 1,
+}
+
+
+def notes_column(policy):
+    # 'C1E_School closing' -> 'C1E_Notes'
+    return f"{policy.split('_', 1)[0]}_Notes"
+
+
+INDEX_VARIANTS = ['NonVaccinated', 'Vaccinated', 'SimpleAverage', 'WeightedAverage']
+OXCGRT_INDEX_COLUMNS = ([f'{index}_{variant}' for index in ('StringencyIndex', 'GovernmentResponseIndex',
+                                                            'ContainmentHealthIndex') for variant in INDEX_VARIANTS]
+                        + ['EconomicSupportIndex'])
+
+# Our World in Data vaccinations.csv
+VACCINATION_COLUMNS = [
+    'location', 'iso_code', 'date', 'total_vaccinations', 'people_vaccinated', 'people_fully_vaccinated',
+    'total_boosters', 'daily_vaccinations_raw', 'daily_vaccinations', 'total_vaccinations_per_hundred',
+    'people_vaccinated_per_hundred', 'people_fully_vaccinated_per_hundred', 'total_boosters_per_hundred',
+    'daily_vaccinations_per_million', 'daily_people_vaccinated', 'daily_people_vaccinated_per_hundred',
+]
+
+# Storage types, applied when the columnar caches are built (utils/ingest.py):
+# categoricals for codes and names, nullable 8-bit integers for ordinal policy
+# levels, float32 for indexes and per-capita figures. Counts and
+# monetary amounts stay float64 (float32 holds 7 significant digits, too few
+# for cumulative case counts and day-to-day differences of them).
+def _oxcgrt_dtypes():
+    dtypes = {column: 'category' for column in OXCGRT_ID_COLUMNS}
+    dtypes['Date'] = 'datetime64[ns]'
+    dtypes.update({column: 'float64' if high is None else 'Int8' for column, high in POLICY_LEVELS.items()})
+    dtypes.update({'ConfirmedCases': 'float64', 'ConfirmedDeaths': 'float64'})
+    dtypes.update({column: 'float32' for column in OXCGRT_INDEX_COLUMNS})
+    return dtypes
+
+
+OXCGRT_DTYPES = _oxcgrt_dtypes()
+
+VACCINATION_DTYPES = {column: 'float32' if column.endswith(('_per_hundred', '_per_million')) else 'float64'
+                      for column in VACCINATION_COLUMNS}
+VACCINATION_DTYPES.update({'location': 'category', 'iso_code': 'category', 'date': 'datetime64[ns]'})
@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+from scipy.stats import rankdata
+
+from utils import cache
+from utils.correlation import as_float_array, distance_correlation
+from utils.parallel import map_batches
+
+# Resamples per vectorised distance correlation call, bounding peak memory
+DCOR_CHUNK = 128
+
+
+def default_block_length(n):
+    # n^(1/3), the usual rate for block resampling of dependent series
+    return max(1, int(round(n ** (1 / 3))))
+
+
+def _block_permutations(rng, n, block_length, n_resamples):
+    # Rows of positions 0..n-1 with whole blocks of consecutive positions
+    # shuffled; a final partial block stays at the end
+    blocks = n // block_length
+    order = np.argsort(rng.random((n_resamples, blocks)), axis=1)
+    index = (order[:, :, None] * block_length + np.arange(block_length)).reshape(n_resamples, -1)
+    tail = np.broadcast_to(np.arange(blocks * block_length, n), (n_resamples, n - blocks * block_length))
+    return np.hstack([index, tail])
+
+
+def _block_bootstrap(rng, n, block_length, n_resamples):
+    # Moving block bootstrap: rows of n positions made of blocks of
+    # consecutive positions starting uniformly at random
+    blocks = -(-n // block_length)
+    starts = rng.integers(0, n - block_length + 1, size=(n_resamples, blocks))
+    return (starts[:, :, None] + np.arange(block_length)).reshape(n_resamples, -1)[:, :n]
+
+
+def _resampled_ranks(values, index):
+    # Average ranks within each row of values[index], from per-row counts of
+    # every distinct value rather than sorting each row
+    distinct, groups = np.unique(values, return_inverse=True)
+    rows = len(index)
+    drawn = groups[index]
+    keys = np.arange(rows)[:, None] * len(distinct) + drawn
+    counts = np.bincount(keys.ravel(), minlength=rows * len(distinct)).reshape(rows, -1)
+    below = np.cumsum(counts, axis=1) - counts
+    return np.take_along_axis(below + (counts + 1) / 2, drawn, axis=1)
+
+
+def _row_pearson(a, b):
+    a = a - a.mean(axis=-1, keepdims=True)
+    b = b - b.mean(axis=-1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (a * b).sum(axis=-1) / np.sqrt((a * a).sum(axis=-1) * (b * b).sum(axis=-1))
+
+
+def _spearman(a, b, permutations, bootstrap):
+    a_ranks = rankdata(a)
+    b_ranks = rankdata(b)
+    observed = _row_pearson(a_ranks, b_ranks)
+    # Permuting positions leaves the ranks unchanged, only their pairing
+    null = _row_pearson(a_ranks[permutations], b_ranks)
+    resampled = _row_pearson(_resampled_ranks(a, bootstrap), _resampled_ranks(b, bootstrap))
+    return observed, null, resampled
+
+
+def _distance(a, b, permutations, bootstrap):
+    observed = distance_correlation(a, b)
+    null = np.concatenate([
+        distance_correlation(a[chunk], np.broadcast_to(b, chunk.shape))
+        for chunk in np.array_split(permutations, -(-len(permutations) // DCOR_CHUNK))
+    ])
+    resampled = np.concatenate([
+        distance_correlation(a[chunk], b[chunk])
+        for chunk in np.array_split(bootstrap, -(-len(bootstrap) // DCOR_CHUNK))
+    ])
+    return observed, null, resampled
+
+
+# statistic(a, b, permutations, bootstrap) -> (observed, null, resampled),
+# whether the test is two-sided, and whether the bootstrap interval is
+# recentred on the estimate: the biased distance correlation of a resample
+# repeats days, which shifts the resampled values up
+STATISTICS = {
+    'spearman': (_spearman, True, False),
+    'dcor': (_distance, False, True),
+}
+
+
+def _significance_batch(lags, x, y, method, n_resamples, block_length, confidence, seed):
+    statistic, two_sided, recentred = STATISTICS[method]
+    tail = (1 - confidence) / 2
+    results = np.full((6, len(lags)), np.nan)
+    for i, lag in enumerate(lags):
+        if lag >= len(x):
+            continue
+        m = len(x) - lag
+        complete = ~np.isnan(x[:m]) & ~np.isnan(y[lag:])
+        a = x[:m][complete]
+        b = y[lag:][complete]
+        length = block_length or default_block_length(len(a))
+        # A constant side has no defined correlation, so nothing to test
+        if len(a) < max(4, 2 * length) or np.ptp(a) == 0 or np.ptp(b) == 0:
+            continue
+
+        # Seeded per lag so results do not depend on how lags are batched
+        rng = np.random.default_rng([seed, lag])
+        permutations = _block_permutations(rng, len(a), length, n_resamples)
+        bootstrap = _block_bootstrap(rng, len(a), length, n_resamples)
+        observed, null, resampled = statistic(a, b, permutations, bootstrap)
+        if np.isnan(observed):
+            continue
+        if recentred:
+            resampled = resampled + observed - np.nanmedian(resampled)
+
+        extreme = np.abs(null) >= np.abs(observed) if two_sided else null >= observed
+        results[:, i] = [
+            observed,
+            np.nanquantile(null, tail), np.nanquantile(null, 1 - tail),
+            (1 + extreme.sum()) / (1 + n_resamples),
+            np.nanquantile(resampled, tail), np.nanquantile(resampled, 1 - tail),
+        ]
+    return tuple(results)
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+@cache.memoize_lags(version=2, ignore=('workers',))
+def lagged_significance(x, y, lags, method='spearman', n_resamples=1000, block_length=None,
+                        confidence=0.95, seed=0, workers=None):
+    """Resampling significance of the lagged correlation of x[t] with y[t + lag].
+
+    For every lag, the complete pairs are resampled in blocks of consecutive
+    days (default n^(1/3)) to respect autocorrelation:
+    - a block permutation of x against y gives the null band (NullLow,
+      NullHigh) and a permutation PValue (two-sided for Spearman, one-sided
+      for distance correlation);
+    - a moving block bootstrap of the pairs gives a percentile interval for
+      the correlation (CILow, CIHigh), shifted by the estimate minus the
+      median resample for distance correlation.
+    Lags where either side is constant, or with too few pairs, are all NaN.
+    `method` is 'spearman' or 'dcor'. Lags are run in batches on a process
+    pool, and results are cached in memory and on disk per series, lag grid,
+    resample count and seed, and on disk per lag (so appended days only
+    recompute the lags they add pairs to).
+    """
+    x = as_float_array(x)
+    y = as_float_array(y)
+    lags = np.asarray(lags, dtype=int)
+    results = map_batches(_significance_batch, lags, x, y, method, n_resamples, block_length,
+                          confidence, seed, work=len(lags) * len(x) * n_resamples, workers=workers)
+    correlation, null_low, null_high, p_value, ci_low, ci_high = results
+    return pd.DataFrame({'Lag': lags, 'Correlation': correlation, 'NullLow': null_low,
+                         'NullHigh': null_high, 'PValue': p_value, 'CILow': ci_low, 'CIHigh': ci_high})
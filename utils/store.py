@@ -0,0 +1,187 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils import countries
+from utils.data import DATA_DIR, INDEX_COLUMNS, POLICY_COLUMNS, national, oxcgrt_path, regional
+from utils.ingest import source_hash
+from utils.metrics import add_outcome_metrics, add_per_100k
+
+# Dense time-series stores, one per country
+STORE_DIR = os.environ.get("STORE_DIR", os.path.join(DATA_DIR, ".cache", "tensors"))
+
+# Bumped when the store layout or metrics change, so older stores are rebuilt
+STORE_VERSION = 2
+
+# Jurisdiction code of a country's national rows; regions use their RegionCode
+# without the country prefix (see utils.data.regional)
+NATIONAL = "NAT_TOTAL"
+
+COUNT_COLUMNS = ['ConfirmedCases', 'ConfirmedDeaths']
+OUTCOME_METRICS = ['CasesPer100K', 'DeathsPer100K', 'DailyCaseRate', 'DailyDeathRate']
+MONETARY_COLUMNS = ['E3_Fiscal measures', 'E4_International support', 'H4_Emergency investment in healthcare',
+                    'H5_Investment in vaccines']
+METRICS = (COUNT_COLUMNS + OUTCOME_METRICS + POLICY_COLUMNS + INDEX_COLUMNS
+           + [f"{column} Per 100K Population" for column in MONETARY_COLUMNS])
+
+
+def _read_manifest(manifest_path):
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def store_paths(iso_code):
+    base = os.path.join(STORE_DIR, iso_code)
+    return base + ".npy", base + ".json"
+
+
+def _source(iso_code):
+    # What a store is built from: the columnar cache of the country's source
+    # file (see utils/ingest.py) and the registry populations
+    return {'sha256': source_hash(oxcgrt_path(iso_code)), 'population': countries.population(iso_code),
+            'regions': countries.region_population(iso_code)}
+
+
+def _with_metrics(df, population, region_population=None):
+    # Outcome metrics over the days with both counts, as the pages compute them
+    # (their loads drop days without counts first), and the monetary columns
+    # per 100K
+    counted = df.dropna(subset=COUNT_COLUMNS)
+    metrics = add_outcome_metrics(counted, population, region_population)[OUTCOME_METRICS]
+    df = df.join(metrics)
+    return add_per_100k(df, MONETARY_COLUMNS, population, region_population)
+
+
+def build_store(iso_code):
+    """Write the country's jurisdiction x date x metric store and its manifest.
+
+    Row 0 holds the national rows (NATIONAL), the next rows the registry's
+    regions and then any other regions, each in source order, so the
+    regions the pages map are consecutive rows. There is one column per
+    calendar day from the first to the last date and one plane per metric in
+    METRICS. Days a jurisdiction does not report are NaN. Values are
+    float64, like the counts they hold.
+    """
+    source = _source(iso_code)
+    columns = COUNT_COLUMNS + POLICY_COLUMNS + INDEX_COLUMNS
+    frames = [_with_metrics(national(iso_code, columns), source['population']).assign(RegionCode=NATIONAL)]
+    df = regional(iso_code, columns)
+    if len(df):
+        frames.append(_with_metrics(df, source['population'], source['regions']))
+    df = pd.concat(frames, ignore_index=True)
+
+    codes = df['RegionCode'].unique()
+    named = countries.region_names(iso_code)
+    jurisdictions = pd.Index([NATIONAL] + [code for code in codes if code in named]
+                             + [code for code in codes if code != NATIONAL and code not in named])
+    dates = pd.date_range(df['Date'].min(), df['Date'].max(), freq='D')
+    values = np.full((len(jurisdictions), len(dates), len(METRICS)), np.nan)
+    rows = jurisdictions.get_indexer(df['RegionCode'])
+    days = dates.get_indexer(df['Date'])
+    values[rows, days] = df[METRICS].to_numpy(dtype=float, na_value=np.nan)
+
+    path, manifest_path = store_paths(iso_code)
+    os.makedirs(STORE_DIR, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(tmp, values)
+    os.replace(tmp, path)
+    tmp = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump({'version': STORE_VERSION, 'jurisdictions': list(jurisdictions), 'start': str(dates[0].date()),
+                   'days': len(dates), 'metrics': METRICS, 'source': source}, f)
+    os.replace(tmp, manifest_path)
+    return path
+
+
+# The country's store, rebuilt when its source or the registry populations
+# changed, as a read-only memory map with its manifest and index
+# dictionaries: {'manifest', 'values': (jurisdiction, date, metric) array,
+# 'jurisdictions': {code: row}, 'dates': DatetimeIndex, 'metrics': {name:
+# plane}}. Loaded once per process; the OS
+# shares the mapped pages between every process serving the app.
+@st.cache_resource(show_spinner=False)
+def load_store(iso_code):
+    path, manifest_path = store_paths(iso_code)
+    manifest = _read_manifest(manifest_path)
+    if (manifest is None or manifest.get('version') != STORE_VERSION or manifest['source'] != _source(iso_code)
+            or not os.path.exists(path)):
+        build_store(iso_code)
+        manifest = _read_manifest(manifest_path)
+    return {
+        'manifest': manifest,
+        'values': np.load(path, mmap_mode='r'),
+        'jurisdictions': {code: row for row, code in enumerate(manifest['jurisdictions'])},
+        'dates': pd.date_range(manifest['start'], periods=manifest['days'], freq='D'),
+        'metrics': {name: plane for plane, name in enumerate(manifest['metrics'])},
+    }
+
+
+# Identifies what the stores of `iso_codes` hold (layout version and source),
+# to key results drawn from them (e.g. plotting.cached_figure) without hashing
+# their data
+def store_version(iso_codes):
+    manifests = {iso_code: load_store(iso_code)['manifest'] for iso_code in iso_codes}
+    return [(iso_code, manifest['version'], manifest['source']) for iso_code, manifest in manifests.items()]
+
+
+def jurisdiction_frame(store, jurisdiction, metrics):
+    """Date and `metrics` of one jurisdiction, every column a view of the store."""
+    row = store['values'][store['jurisdictions'][jurisdiction]]
+    columns = {'Date': store['dates']}
+    columns.update({metric: row[:, store['metrics'][metric]] for metric in metrics})
+    return pd.DataFrame(columns, copy=False)
+
+
+def region_matrix(store, metric, names=None):
+    """Region x date frame of one metric, rows labelled by `names` ({code: name}) if given.
+
+    Regions missing from `names` are left out, as are the days before the
+    first and after the last value of any region. The frame is a view of the
+    store when the regions are consecutive rows: all of them, or the
+    registry's (see build_store). Other selections are copied.
+    """
+    codes = [code for code in store['jurisdictions'] if code != NATIONAL and (names is None or code in names)]
+    rows = [store['jurisdictions'][code] for code in codes]
+    plane = store['values'][:, :, store['metrics'][metric]]
+    # Consecutive rows and days are sliced rather than gathered, so no data is
+    # copied
+    if rows and rows == list(range(rows[0], rows[0] + len(rows))):
+        plane = plane[rows[0]:rows[0] + len(rows)]
+    else:
+        plane = plane[rows]
+    reported = np.flatnonzero(~np.isnan(plane).all(axis=0))
+    days = slice(reported[0], reported[-1] + 1) if len(reported) else slice(0, 0)
+    index = pd.Index([names[code] for code in codes] if names is not None else codes)
+    return pd.DataFrame(plane[:, days], index=index, columns=store['dates'][days], copy=False)
+
+
+# National rows of one country from its store, with only the days that have
+# every `dropna` metric when given (shared by every session, so callers must
+# not modify them). The daily rates are then taken again over the days kept,
+# as the pages computed them before the store: a day after a gap in the
+# indexes gets the change since the last day kept, not since the day before.
+@st.cache_resource(show_spinner=False)
+def national_frame(iso_code, metrics, dropna=()):
+    store = load_store(iso_code)
+    if not dropna:
+        return jurisdiction_frame(store, NATIONAL, list(metrics))
+    df = jurisdiction_frame(store, NATIONAL, list(dict.fromkeys(metrics + tuple(dropna) + tuple(COUNT_COLUMNS))))
+    df = df.dropna(subset=list(dropna)).reset_index(drop=True)
+    daily = add_outcome_metrics(df, store['manifest']['source']['population'])
+    return df.assign(**{metric: daily[metric] for metric in ('DailyCaseRate', 'DailyDeathRate') if metric in df})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the jurisdiction x date x metric stores")
+    parser.add_argument("countries", nargs="*", help="ISO codes of the countries (default: every registry entry)")
+    args = parser.parse_args()
+    for iso_code in args.countries or countries.country_codes():
+        path = build_store(iso_code)
+        print(f"{iso_code} -> {path} ({os.path.getsize(path) // 1024} KiB)")
@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import string
+
+import numpy as np
+import pandas as pd
+
+from utils.schema import OXCGRT_COLUMNS, OXCGRT_INDEX_COLUMNS, POLICY_LEVELS, VACCINATION_COLUMNS, notes_column
+
+# Synthetic data in the OxCGRT fullwithnotes and OWID vaccinations layouts, for
+# running the app, the loaders and the benchmarks at sizes the real files do
+# not have. Files are written one jurisdiction (one country for the
+# vaccinations) at a time, so memory stays at one jurisdiction's rows
+# whatever the number of countries and regions.
+
+START_DATE = "2020-01-01"
+
+# Days after the start at which vaccination starts and policies start
+# differing by vaccination status
+VACCINATION_START_DAY = 335
+DIFFERENTIATION_DAY = 400
+
+# Stringency uses C1-C8 and H1, containment and health adds H2, H3 and H6-H8,
+# the government response index adds E1 and E2; economic support is E1 and E2
+STRINGENCY = ['C1', 'C2', 'C3', 'C4', 'C5', 'C6', 'C7', 'C8', 'H1']
+CONTAINMENT_HEALTH = STRINGENCY + ['H2', 'H3', 'H6', 'H7', 'H8']
+GOVERNMENT_RESPONSE = CONTAINMENT_HEALTH + ['E1', 'E2']
+ECONOMIC_SUPPORT = ['E1', 'E2']
+
+
+def country_code(i):
+    # 'SAA', 'SAB', ..., recognisable as synthetic in file names
+    letters = string.ascii_uppercase
+    return f"S{letters[i // 26 % 26]}{letters[i % 26]}"
+
+
+def _steps(rng, days, high, changes, start=0):
+    # Piecewise-constant integer series in [0, high], zero before `start`
+    values = np.zeros(days)
+    if high == 0 or start >= days:
+        return values
+    points = np.sort(rng.integers(start, days, size=changes))
+    levels = rng.integers(0, high + 1, size=changes)
+    for point, level in zip(points, levels):
+        values[point:] = level
+    return values
+
+
+def _notes(values, label):
+    # Free text on the days a series changes, empty otherwise
+    changed = np.r_[values[0] != 0, values[1:] != values[:-1]] & ~np.isnan(values)
+    notes = np.full(len(values), "", dtype=object)
+    notes[changed] = [f"{label} set to {v:g} following the announcement of new guidance." for v in values[changed]]
+    return notes
+
+
+def _spending(rng, days, scale):
+    values = np.zeros(days)
+    announced = rng.random(days) < 0.01
+    values[announced] = np.round(rng.lognormal(np.log(scale), 1.0, announced.sum()), -3)
+    return values
+
+
+def _daily_cases(rng, days, population):
+    # A few epidemic waves of daily cases, with day-to-day noise
+    t = np.arange(days)
+    rate = np.zeros(days)
+    for _ in range(rng.integers(3, 7)):
+        peak, width, height = rng.uniform(min(30, days), days), rng.uniform(15, 60), rng.uniform(1e-4, 2e-3)
+        rate += height * np.exp(-0.5 * ((t - peak) / width) ** 2)
+    return rng.poisson(rate * population * rng.uniform(0.7, 1.3, days))
+
+
+def _vaccinated_share(rng, days):
+    # Share of the population vaccinated: a logistic rollout from the start day
+    t = np.arange(days) - VACCINATION_START_DAY
+    share = rng.uniform(0.6, 0.9) / (1 + np.exp(-(t - rng.uniform(60, 150)) / rng.uniform(20, 40)))
+    return np.where(t >= 0, share, 0.0)
+
+
+def _index(scores, codes):
+    return np.round(np.mean([scores[code] for code in codes], axis=0), 2)
+
+
+def jurisdiction_frame(rng, days, ids, population, daily_cases):
+    """All OxCGRT columns for one jurisdiction over `days` days from START_DATE.
+
+    `ids` holds the identifier columns (CountryName, CountryCode, RegionName,
+    RegionCode, Jurisdiction) and `daily_cases` the new cases per day.
+    """
+    columns = {name: value for name, value in ids.items()}
+    columns['Date'] = pd.date_range(START_DATE, periods=days).strftime('%Y%m%d').astype(int)
+    share = _vaccinated_share(rng, days)
+    differentiated = np.arange(days) >= DIFFERENTIATION_DAY
+
+    # Per indicator (C1, E1, ...): the score (0-100) for non-vaccinated and
+    # vaccinated people. Indicators recorded per vaccination status (C1E,
+    # H6E, ...) ease for vaccinated people once policies are differentiated;
+    # the file holds the value for everyone.
+    scores_nv, scores_v = {}, {}
+    for policy, high in POLICY_LEVELS.items():
+        code, name = policy.split('_', 1)
+        if high is None:
+            value = _spending(rng, days, population * 10)
+        elif code.startswith('V'):
+            value = _steps(rng, days, high, rng.integers(2, 6), start=VACCINATION_START_DAY)
+        else:
+            value = _steps(rng, days, high, rng.integers(3, 12))
+            eased = np.where(differentiated, np.maximum(value - rng.integers(0, 2, days), 0), value)
+            scores_nv[code[:2]] = value / high * 100
+            scores_v[code[:2]] = (eased if code.endswith('E') else value) / high * 100
+        columns[policy] = value
+        columns[notes_column(policy)] = _notes(value, name)
+
+    cases = np.cumsum(daily_cases)
+    deaths = np.cumsum(rng.binomial(np.r_[np.zeros(14, dtype=int), daily_cases[:-14]][:days], 0.012))
+    columns['ConfirmedCases'] = cases
+    columns['ConfirmedDeaths'] = deaths
+
+    for index, codes in (('StringencyIndex', STRINGENCY), ('GovernmentResponseIndex', GOVERNMENT_RESPONSE),
+                         ('ContainmentHealthIndex', CONTAINMENT_HEALTH)):
+        nv, v = _index(scores_nv, codes), _index(scores_v, codes)
+        columns[f'{index}_NonVaccinated'] = nv
+        columns[f'{index}_Vaccinated'] = v
+        columns[f'{index}_SimpleAverage'] = np.round((nv + v) / 2, 2)
+        columns[f'{index}_WeightedAverage'] = np.round(nv * (1 - share) + v * share, 2)
+    columns['EconomicSupportIndex'] = _index(scores_nv, ECONOMIC_SUPPORT)
+
+    # The indexes are missing on a few days, as on days not yet coded in the
+    # published files
+    uncoded = rng.random(days) < 0.02
+    for column in OXCGRT_INDEX_COLUMNS:
+        columns[column] = np.where(uncoded, np.nan, columns[column])
+    return pd.DataFrame(columns, columns=OXCGRT_COLUMNS)
+
+
+def vaccination_frame(rng, days, location, iso_code, population):
+    """OWID vaccination rows of one country from VACCINATION_START_DAY, with gaps in the totals.
+
+    No rows when the `days` days end before vaccination starts.
+    """
+    dates = pd.date_range(START_DATE, periods=days)[VACCINATION_START_DAY:]
+    n = len(dates)
+    if n == 0:
+        return pd.DataFrame(columns=VACCINATION_COLUMNS)
+    share = _vaccinated_share(rng, days)[VACCINATION_START_DAY:]
+    people = np.floor(share * population)
+    fully = np.floor(np.r_[np.zeros(min(28, n)), people[:-28]][:n] * 0.9)
+    boosters = np.floor(np.r_[np.zeros(min(180, n)), fully[:-180]][:n] * 0.5)
+    total = people + fully + boosters
+    daily_raw = np.r_[np.nan, np.diff(total)]
+    daily = pd.Series(daily_raw).rolling(7, min_periods=1).mean().round().to_numpy()
+    daily_people = pd.Series(np.r_[people[:1], np.diff(people)]).rolling(7, min_periods=1).mean().round().to_numpy()
+    # Totals are reported on some days only
+    reported = rng.random(n) < 0.8
+    reported[[0, -1]] = True
+    frame = pd.DataFrame({
+        'location': location,
+        'iso_code': iso_code,
+        'date': dates.strftime('%Y-%m-%d'),
+        'total_vaccinations': np.where(reported, total, np.nan),
+        'people_vaccinated': np.where(reported, people, np.nan),
+        'people_fully_vaccinated': np.where(reported, fully, np.nan),
+        'total_boosters': np.where(reported & (boosters > 0), boosters, np.nan),
+        'daily_vaccinations_raw': np.where(reported, daily_raw, np.nan),
+        'daily_vaccinations': daily,
+        'daily_vaccinations_per_million': np.round(daily / population * 1e6),
+        'daily_people_vaccinated': daily_people,
+        'daily_people_vaccinated_per_hundred': np.round(daily_people / population * 100, 3),
+    })
+    for column in ('total_vaccinations', 'people_vaccinated', 'people_fully_vaccinated', 'total_boosters'):
+        frame[f'{column}_per_hundred'] = np.round(frame[column] / population * 100, 2)
+    return frame[VACCINATION_COLUMNS]
+
+
+def generate(out_dir, countries=2, regions=10, days=1096, seed=0):
+    """Write OxCGRT files, vaccinations.csv and a countries.json registry for them to out_dir.
+
+    Every country has `regions` regions and `days` daily rows per jurisdiction
+    (national rows first, as in the US file). Regional cases split the
+    national cases by population. Returns the registry.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    registry = {}
+    with open(os.path.join(out_dir, "vaccinations.csv"), "w", newline="") as vaccinations_file:
+        pd.DataFrame(columns=VACCINATION_COLUMNS).to_csv(vaccinations_file, index=False)
+        for i in range(countries):
+            iso_code, name = country_code(i), f"Synthetic Country {i + 1}"
+            region_pops = np.round(rng.lognormal(14.5, 1.0, regions)).astype(int)
+            population = int(region_pops.sum()) if regions else int(rng.lognormal(16.5, 1.0))
+            entry = registry[iso_code] = {
+                'label': name,
+                'oxcgrt_file': f"OxCGRT_fullwithnotes_{iso_code}_v1.csv",
+                'population': population,
+                'default': i < 2,
+                'regions': {f"R{r + 1:03d}": {'name': f"Region {r + 1}", 'population': int(pop)}
+                            for r, pop in enumerate(region_pops)},
+            }
+
+            national_cases = _daily_cases(rng, days, population)
+            with open(os.path.join(out_dir, entry['oxcgrt_file']), "w", newline="") as f:
+                ids = {'CountryName': name, 'CountryCode': iso_code, 'RegionName': '', 'RegionCode': '',
+                       'Jurisdiction': 'NAT_TOTAL'}
+                jurisdiction_frame(rng, days, ids, population, national_cases).to_csv(f, index=False)
+                for r, (code, region) in enumerate(entry['regions'].items()):
+                    ids = {'CountryName': name, 'CountryCode': iso_code, 'RegionName': region['name'],
+                           'RegionCode': f"{iso_code}_{code}", 'Jurisdiction': 'STATE_TOTAL'}
+                    cases = rng.binomial(national_cases, region['population'] / population)
+                    jurisdiction_frame(rng, days, ids, region['population'], cases).to_csv(f, index=False,
+                                                                                            header=False)
+            vaccination_frame(rng, days, name, iso_code, population).to_csv(vaccinations_file, index=False,
+                                                                             header=False)
+
+    with open(os.path.join(out_dir, "countries.json"), "w") as f:
+        json.dump(registry, f, indent=1)
+    return registry
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic OxCGRT and vaccination files and their registry")
+    parser.add_argument("out_dir", help="directory to write (point APP_DATA_DIR at it to run the app on it)")
+    parser.add_argument("--countries", type=int, default=2)
+    parser.add_argument("--regions", type=int, default=10, help="regions per country")
+    parser.add_argument("--days", type=int, default=1096, help="daily rows per jurisdiction (from 2020-01-01)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    registry = generate(args.out_dir, args.countries, args.regions, args.days, args.seed)
+    for iso_code, country in registry.items():
+        path = os.path.join(args.out_dir, country['oxcgrt_file'])
+        print(f"{iso_code} -> {path} ({os.path.getsize(path) // 1024} KiB)")